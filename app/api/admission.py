@@ -0,0 +1,96 @@
+import asyncio
+from typing import Awaitable, Optional, TypeVar
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from app.core.config import get_settings
+from app.core.limits import Overloaded, remaining, set_deadline
+from app.core.metrics import ABANDONED_REQUESTS
+
+T = TypeVar("T")
+
+# Lets a client with a shorter timeout of its own say so, in seconds.
+DEADLINE_HEADER = "x-request-timeout"
+_DISCONNECT_POLL_SECONDS = 0.25
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def start_deadline(request: Request, seconds: Optional[float] = None) -> None:
+    """Start the request's deadline, shortened if the client asks.
+
+    ``seconds`` defaults to REQUEST_TIMEOUT_SECONDS.
+    """
+    if seconds is None:
+        seconds = float(get_settings().request_timeout_seconds)
+    raw = request.headers.get(DEADLINE_HEADER)
+    if raw:
+        try:
+            seconds = min(seconds, max(0.0, float(raw)))
+        except ValueError:
+            pass
+    set_deadline(seconds)
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(_DISCONNECT_POLL_SECONDS)
+
+
+async def run_guarded(
+    request: Request, work: Awaitable[T], seconds: Optional[float] = None
+) -> T:
+    """Run ``work`` under the request deadline, cancelling it early.
+
+    The work is cancelled when the deadline passes (504) or the client
+    disconnects, so nothing keeps Ollama or OCR busy for an answer nobody
+    will read. Queues inside the work see the same deadline through
+    ``app.core.limits.remaining``. ``seconds`` overrides the default
+    deadline for requests that do more than one generation.
+    """
+    start_deadline(request, seconds)
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait(
+            {task, watcher},
+            timeout=max(0.0, remaining()),
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+    if task in done:
+        return task.result()
+    if watcher in done:
+        ABANDONED_REQUESTS.inc(reason="disconnect")
+        raise ClientDisconnected()
+    ABANDONED_REQUESTS.inc(reason="deadline")
+    raise DeadlineExceeded()
+
+
+async def overloaded_handler(request: Request, exc: Overloaded) -> JSONResponse:
+    return JSONResponse(
+        {"detail": str(exc)},
+        status_code=exc.status_code,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+async def deadline_handler(request: Request, exc: DeadlineExceeded) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Batas waktu permintaan terlampaui."}, status_code=504
+    )
+
+
+async def disconnect_handler(request: Request, exc: ClientDisconnected) -> JSONResponse:
+    # Nobody reads this; 499 only shows up in logs and metrics.
+    return JSONResponse({"detail": "Klien memutus koneksi."}, status_code=499)
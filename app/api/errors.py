@@ -0,0 +1,8 @@
+from pydantic import ValidationError
+
+
+def describe_rag_error(exc: Exception) -> str:
+    """Client-facing message for a failed RAG generation."""
+    if isinstance(exc, ValidationError):
+        return f"Output model tidak sesuai skema: {exc}"
+    return f"Kesalahan RAG: {exc}"
@@ -0,0 +1,62 @@
+import time
+
+from app.core.config import get_settings
+from app.core.metrics import (
+    REQUEST_SECONDS,
+    server_timing_header,
+    start_request_timings,
+    start_request_tokens,
+    tokens_header,
+)
+
+
+class TimingMiddleware:
+    """Records request latency and, if enabled, a Server-Timing header.
+
+    With ``SERVER_TIMING=true`` every response carries the per-stage
+    breakdown (upload, ocr, embedding, vector_query, prompt, llm, ...)
+    measured while handling it, plus the chat model's prompt and
+    completion tokens in ``X-LLM-Tokens``. For streamed responses only the
+    work finished before the first byte is included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings = start_request_timings()
+        tokens = start_request_tokens()
+        add_header = get_settings().server_timing
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if add_header and (timings or tokens):
+                    headers = list(message.get("headers", []))
+                    if timings:
+                        headers.append(
+                            (b"server-timing", server_timing_header(timings).encode())
+                        )
+                    if tokens:
+                        headers.append((b"x-llm-tokens", tokens_header(tokens).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                # Templated path, so ids in URLs don't blow up cardinality.
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Awaitable, Optional, TypeVar
+
+from fastapi import APIRouter, HTTPException, Response
+
+from app.api.errors import describe_rag_error
+from app.core.jobs import JobFailed, check_callback_url, get_job_queue
+from app.core.limits import Overloaded
+from app.models.schemas import JobStatusResponse
+
+T = TypeVar("T")
+
+router = APIRouter()
+
+
+async def _check_callback_url(url: Optional[str]) -> None:
+    if url is None:
+        return
+    try:
+        await asyncio.to_thread(check_callback_url, url)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+async def accept_job(
+    kind: str, payload: dict, callback_url: Optional[str], response: Response
+) -> JobStatusResponse:
+    """Store a job and answer 202 with where to poll for it."""
+    await _check_callback_url(callback_url)
+    job = await get_job_queue().submit(kind, payload, callback_url)
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return JobStatusResponse(**job.view())
+
+
+async def run_job(work: Awaitable[T]) -> T:
+    """Await a job's work, mapping request errors onto job outcomes.
+
+    Client errors (4xx) fail the job for good; everything else is retried
+    by the queue, and ``Overloaded`` defers it without using an attempt.
+    """
+    try:
+        return await work
+    except (JobFailed, Overloaded):
+        raise
+    except HTTPException as exc:
+        if exc.status_code < 500:
+            raise JobFailed(exc.detail)
+        raise RuntimeError(exc.detail) from exc
+    except Exception as exc:
+        raise RuntimeError(describe_rag_error(exc)) from exc
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    job = await get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Pekerjaan tidak ditemukan.")
+    return JobStatusResponse(**job.view())
@@ -1,8 +1,23 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import ValidationError
+import math
+from typing import List, Literal, Optional
 
-from app.models.schemas import ManualSearchRequest, ManualSearchResponse
-from app.rag.pipeline import rag_chain
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+from app.api.admission import run_guarded, start_deadline
+from app.api.errors import describe_rag_error
+from app.api.routes_jobs import accept_job, run_job
+from app.api.streaming import sse_event, sse_response
+from app.core.config import get_settings
+from app.core.jobs import register_job_handler
+from app.core.limits import Overloaded, get_rag_slots
+from app.models.schemas import (
+    JobStatusResponse,
+    ManualBatchItemResult,
+    ManualBatchResponse,
+    ManualSearchRequest,
+    ManualSearchResponse,
+)
+from app.rag.pipeline import aanswer, abatch_rag, astream_rag
 from app.services.nutrition import (
     build_product_profile,
     build_search_query,
@@ -13,8 +28,7 @@ from app.services.nutrition import (
 router = APIRouter()
 
 
-@router.post("/search/manual", response_model=ManualSearchResponse)
-def manual_search(payload: ManualSearchRequest):
+def _build_chain_inputs(payload: ManualSearchRequest) -> dict:
     if not payload.product.name and not payload.nutritionFacts:
         raise HTTPException(
             status_code=400,
@@ -37,33 +51,181 @@ def manual_search(payload: ManualSearchRequest):
         payload.product.name,
         payload.nutritionFacts,
     )
+    return {
+        "search_query": search_query,
+        "user_query": user_query,
+        "user_profile": user_profile_text,
+        "product_profile": product_profile_text,
+    }
 
-    try:
-        answer = rag_chain.invoke(
-            {
-                "search_query": search_query,
-                "user_query": user_query,
-                "user_profile": user_profile_text,
-                "product_profile": product_profile_text,
-            }
-        )
 
-        return ManualSearchResponse(
-            status="ok",
-            answer=answer,
-            used_query=search_query,
-            user_profile=user_profile_text,
-            product_profile=product_profile_text,
-        )
+def _build_response(inputs: dict, answer) -> ManualSearchResponse:
+    return ManualSearchResponse(
+        status="ok",
+        answer=answer,
+        used_query=inputs["search_query"],
+        user_profile=inputs["user_profile"],
+        product_profile=inputs["product_profile"],
+    )
+
+
+async def _answer(inputs: dict, mode: Optional[str]) -> ManualSearchResponse:
+    async with get_rag_slots().slot():
+        answer = await aanswer(inputs, mode)
+    return _build_response(inputs, answer)
+
+
+@router.post("/search/manual", response_model=ManualSearchResponse)
+async def manual_search(
+    request: Request,
+    payload: ManualSearchRequest,
+    mode: Optional[Literal["llm", "fast"]] = Query(None),
+):
+    inputs = _build_chain_inputs(payload)
+    get_rag_slots().check()
+
+    async def run() -> ManualSearchResponse:
+        try:
+            return await _answer(inputs, mode)
+        except (HTTPException, Overloaded):
+            raise
+        except Exception as exc:
+            raise HTTPException(
+                status_code=500, detail=describe_rag_error(exc)
+            )
+
+    return await run_guarded(request, run())
+
+
+async def _run_manual_job(payload: dict) -> dict:
+    request = ManualSearchRequest.model_validate(payload["request"])
+
+    async def work() -> ManualSearchResponse:
+        return await _answer(_build_chain_inputs(request), payload.get("mode"))
+
+    return (await run_job(work())).model_dump(mode="json")
+
+
+register_job_handler("manual", _run_manual_job)
+
 
-    except ValidationError as exc:
+@router.post("/jobs/manual", status_code=202, response_model=JobStatusResponse)
+async def manual_search_job(
+    payload: ManualSearchRequest,
+    response: Response,
+    mode: Optional[Literal["llm", "fast"]] = Query(None),
+    callback_url: Optional[str] = Query(None),
+):
+    """Queue a /search/manual request and return its job at once.
+
+    Poll ``GET /jobs/{id}`` (the ``Location`` header) or pass
+    ``callback_url`` to have the finished job POSTed there.
+    """
+    # Bad input fails now rather than inside the job.
+    _build_chain_inputs(payload)
+    return await accept_job(
+        "manual",
+        {"request": payload.model_dump(mode="json"), "mode": mode},
+        callback_url,
+        response,
+    )
+
+
+@router.post("/search/manual/stream")
+async def manual_search_stream(request: Request, payload: ManualSearchRequest):
+    """Server-sent events variant of /search/manual.
+
+    Events: ``candidates``, ``product_assessment``, ``recommendation`` (one
+    per item), ``replace`` if repair changed those, then ``answer`` with
+    the full ManualSearchResponse, or ``error``.
+    """
+    inputs = _build_chain_inputs(payload)
+    # Turn the request away before the stream starts if it could not queue.
+    get_rag_slots().check()
+    start_deadline(request)
+
+    async def events():
+        try:
+            async with get_rag_slots().slot():
+                async for event, data in astream_rag(inputs):
+                    if event == "answer":
+                        data = _build_response(inputs, data)
+                    yield sse_event(event, data)
+        except Exception as exc:
+            yield sse_event("error", {"detail": describe_rag_error(exc)})
+
+    return sse_response(events())
+
+
+@router.post("/search/manual/batch", response_model=ManualBatchResponse)
+async def manual_search_batch(request: Request, payload: List[ManualSearchRequest]):
+    if not payload:
         raise HTTPException(
-            status_code=500,
-            detail=f"Output model tidak sesuai skema: {exc}",
+            status_code=400, detail="Daftar produk tidak boleh kosong."
         )
-    except HTTPException:
-        raise
-    except Exception as exc:
+    settings = get_settings()
+    if len(payload) > settings.batch_max_items:
         raise HTTPException(
-            status_code=500, detail=f"Kesalahan RAG: {exc}"
+            status_code=400,
+            detail=(
+                f"Maksimal {settings.batch_max_items} produk per permintaan."
+            ),
         )
+
+    results: List[ManualBatchItemResult] = []
+    runnable: List[int] = []
+    inputs_list: List[dict] = []
+    for index, item in enumerate(payload):
+        try:
+            inputs_list.append(_build_chain_inputs(item))
+            runnable.append(index)
+        except HTTPException as exc:
+            inputs_list.append({})
+            results.append(
+                ManualBatchItemResult(index=index, status="error", error=exc.detail)
+            )
+
+    get_rag_slots().check()
+
+    async def run() -> list:
+        try:
+            return await abatch_rag(
+                [inputs_list[i] for i in runnable],
+                max_concurrency=settings.batch_max_concurrency,
+            )
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=describe_rag_error(exc))
+
+    # One REQUEST_TIMEOUT_SECONDS per round of BATCH_MAX_CONCURRENCY
+    # generations, so a full batch is not cut off at a single request's limit.
+    rounds = max(1, math.ceil(len(runnable) / max(1, settings.batch_max_concurrency)))
+    answers = await run_guarded(
+        request, run(), seconds=settings.request_timeout_seconds * rounds
+    )
+    for index, answer in zip(runnable, answers):
+        if isinstance(answer, Exception):
+            results.append(
+                ManualBatchItemResult(
+                    index=index,
+                    status="error",
+                    error=describe_rag_error(answer),
+                )
+            )
+            continue
+        results.append(
+            ManualBatchItemResult(
+                index=index,
+                status="ok",
+                result=_build_response(inputs_list[index], answer),
+            )
+        )
+
+    results.sort(key=lambda r: r.index)
+    failed = sum(1 for r in results if r.status != "ok")
+    if not failed:
+        status = "ok"
+    elif failed == len(results):
+        status = "error"
+    else:
+        status = "partial"
+    return ManualBatchResponse(status=status, results=results)
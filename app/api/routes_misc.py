@@ -1,4 +1,18 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.core.db import pool_status
+from app.core.jobs import get_job_queue
+from app.core.limits import get_ocr_slots, get_rag_slots
+from app.core.llm import get_embeddings
+from app.core.metrics import family, render
+from app.core.ollama_router import get_chat_pool, get_embedding_pool
+from app.core.replica import get_vector_replica
+from app.core.singleflight import single_flight_stats
+from app.rag.pipeline import get_answer_cache
+from app.rag.recommendations import get_recommendation_index
+from app.services.ocr_cache import get_ocr_cache
+from app.services.upload import upload_stats
 
 router = APIRouter()
 
@@ -11,3 +25,148 @@ def root():
 @router.get("/health")
 def health():
     return {"status": "OK"}
+
+
+@router.get("/ready")
+def ready(request: Request):
+    """Readiness: 200 only once DB, vector store and models are warmed up."""
+    snapshot = request.app.state.startup.snapshot()
+    status_code = 200 if snapshot["status"] == "ready" else 503
+    return JSONResponse(snapshot, status_code=status_code)
+
+
+@router.get("/stats")
+def stats():
+    # Only report components that are already initialized; /stats must not
+    # trigger a TiDB or Ollama connection.
+    answer_cache = get_answer_cache.peek()
+    embeddings = get_embeddings.peek()
+    ocr_cache = get_ocr_cache.peek()
+    replica = get_vector_replica.peek()
+    chat_pool = get_chat_pool.peek()
+    embedding_pool = get_embedding_pool.peek()
+    rag_slots = get_rag_slots.peek()
+    ocr_slots = get_ocr_slots.peek()
+    job_queue = get_job_queue.peek()
+    recommendations = get_recommendation_index.peek()
+    return {
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "embedding_cache": embeddings.stats() if embeddings else None,
+        "ocr_cache": ocr_cache.stats() if ocr_cache else None,
+        "uploads": upload_stats.snapshot(),
+        "db_pool": pool_status(),
+        "vector_replica": replica.stats() if replica else None,
+        "recommendation_index": recommendations.stats() if recommendations else None,
+        "single_flight": single_flight_stats(),
+        "admission": {
+            "rag": rag_slots.stats() if rag_slots else None,
+            "ocr": ocr_slots.stats() if ocr_slots else None,
+        },
+        "jobs": job_queue.stats() if job_queue else None,
+        "ollama": {
+            "chat": chat_pool.stats() if chat_pool else None,
+            "embedding": embedding_pool.stats() if embedding_pool else None,
+        },
+    }
+
+
+def _cache_families(caches: dict) -> list:
+    live = {name: s for name, s in caches.items() if s is not None}
+    return [
+        family(
+            "grains_cache_hits_total",
+            "counter",
+            "Cache lookups served from the cache.",
+            [({"cache": name}, s["hits"]) for name, s in live.items()],
+        ),
+        family(
+            "grains_cache_misses_total",
+            "counter",
+            "Cache lookups that fell through.",
+            [({"cache": name}, s["misses"]) for name, s in live.items()],
+        ),
+        family(
+            "grains_cache_hit_ratio",
+            "gauge",
+            "Hits over lookups since startup.",
+            [({"cache": name}, s["hit_rate"]) for name, s in live.items()],
+        ),
+    ]
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of latency, token, retry and cache metrics."""
+    snapshot = stats()
+    pool = snapshot["db_pool"]
+    uploads = snapshot["uploads"]
+    extra = _cache_families(
+        {
+            "answer": snapshot["answer_cache"],
+            "embedding": snapshot["embedding_cache"],
+            "ocr": snapshot["ocr_cache"],
+        }
+    )
+    extra.append(
+        family(
+            "grains_db_pool_checkouts_total",
+            "counter",
+            "Connections checked out of the TiDB pool.",
+            [({}, pool["checkouts"])],
+        )
+    )
+    extra.append(
+        family(
+            "grains_db_pool_timeouts_total",
+            "counter",
+            "Checkouts that timed out waiting for a connection.",
+            [({}, pool["timeouts"])],
+        )
+    )
+    extra.append(
+        family(
+            "grains_db_pool_wait_seconds_total",
+            "counter",
+            "Time spent waiting for a pooled connection.",
+            [({}, pool["wait_seconds_total"])],
+        )
+    )
+    extra.append(
+        family(
+            "grains_db_pool_checked_out",
+            "gauge",
+            "Connections currently in use.",
+            [({}, pool.get("checked_out"))],
+        )
+    )
+    extra.append(
+        family(
+            "grains_upload_bytes_total",
+            "counter",
+            "Image bytes received and sent on to OCR.",
+            [
+                ({"direction": "in"}, uploads["bytes_in"]),
+                ({"direction": "sent"}, uploads["bytes_sent"]),
+            ],
+        )
+    )
+    admission = {k: v for k, v in snapshot["admission"].items() if v is not None}
+    extra.append(
+        family(
+            "grains_admission_queued",
+            "gauge",
+            "Requests waiting for a RAG or OCR slot.",
+            [({"limit": name}, s["queued"]) for name, s in admission.items()],
+        )
+    )
+    extra.append(
+        family(
+            "grains_admission_active",
+            "gauge",
+            "Requests holding a RAG or OCR slot.",
+            [({"limit": name}, s["active"]) for name, s in admission.items()],
+        )
+    )
+    return PlainTextResponse(
+        render(extra), media_type="text/plain; version=0.0.4"
+    )
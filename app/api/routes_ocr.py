@@ -1,21 +1,58 @@
-import base64
+import asyncio
 import json
 import mimetypes
-from typing import Optional
+from dataclasses import asdict
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile
-from mistralai import Mistral
-from pydantic import ValidationError
+from fastapi import (
+    APIRouter,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
 
-from app.core.config import settings
-from app.models.schemas import OcrSearchResponse, UserProfile
-from app.rag.pipeline import rag_chain
-from app.services.nutrition import build_user_profile_text, build_user_query
+from app.api.admission import run_guarded, start_deadline
+from app.api.errors import describe_rag_error
+from app.api.routes_jobs import accept_job, run_job
+from app.api.streaming import sse_event, sse_response
+from app.core.config import get_settings
+from app.core.jobs import register_job_handler
+from app.core.limits import Overloaded, get_ocr_slots, get_rag_slots
+from app.core.metrics import OCR_SOURCES, stage
+from app.core.ocr import get_local_ocr, get_ocr_backend
+from app.core.singleflight import SingleFlight
+from app.models.schemas import (
+    JobStatusResponse,
+    OcrSearchResponse,
+    Product,
+    UserProfile,
+)
+from app.rag.context import compact_ocr_markdown
+from app.rag.pipeline import aanswer, astream_rag
+from app.services.nutrition import (
+    build_product_profile,
+    build_user_profile_text,
+    build_user_query,
+)
+from app.services.nutrition import build_search_query as build_facts_query
+from app.services.nutrition_label import (
+    LabelReading,
+    first_heading,
+    portion_or_unknown,
+    read_markdown_label,
+    read_nutrition_label,
+)
+from app.services.ocr_cache import OcrResult, get_ocr_cache
+from app.services.upload import EncodedImage, UploadRejected, encode_upload
 
 router = APIRouter()
 
 
-def _encode_image_from_upload(upload: UploadFile) -> tuple[str, str]:
+async def _encode_image_from_upload(upload: UploadFile) -> EncodedImage:
     if not upload.filename:
         raise HTTPException(
             status_code=400, detail="File gambar tidak ditemukan."
@@ -23,21 +60,44 @@ def _encode_image_from_upload(upload: UploadFile) -> tuple[str, str]:
 
     guessed_mime, _ = mimetypes.guess_type(upload.filename)
     mime = upload.content_type or guessed_mime or "image/jpeg"
+    settings = get_settings()
     try:
-        data = upload.file.read()
+        with stage("upload"):
+            return await encode_upload(
+                upload,
+                mime,
+                max_bytes=settings.upload_max_bytes,
+                max_side=settings.ocr_max_image_side,
+                jpeg_quality=settings.ocr_jpeg_quality,
+                want_phash=get_ocr_cache().phash_enabled,
+            )
+    except UploadRejected as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
     except Exception as exc:
         raise HTTPException(
             status_code=400,
             detail=f"Gagal membaca gambar: {exc}",
         )
 
-    if not data:
+
+async def _encode_images(
+    image: Optional[UploadFile], images: Optional[List[UploadFile]]
+) -> List[EncodedImage]:
+    """Encode every uploaded photo (``image`` and/or ``images``) concurrently."""
+    uploads = ([image] if image is not None else []) + list(images or [])
+    if not uploads:
         raise HTTPException(
-            status_code=400, detail="File gambar kosong."
+            status_code=400, detail="File gambar tidak ditemukan."
         )
-
-    encoded = base64.b64encode(data).decode("utf-8")
-    return encoded, mime
+    max_images = get_settings().ocr_max_images
+    if len(uploads) > max_images:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Maksimal {max_images} gambar per permintaan.",
+        )
+    return list(
+        await asyncio.gather(*(_encode_image_from_upload(u) for u in uploads))
+    )
 
 
 def build_search_query(markdown: str) -> str:
@@ -48,93 +108,327 @@ def build_search_query(markdown: str) -> str:
     return "alternatif makanan kemasan yang lebih sehat"
 
 
-@router.post("/search/ocr", response_model=OcrSearchResponse)
-def ocr_search(
-    image: UploadFile = File(...),
-    userProfile: Optional[str] = Form(None),
-):
-    base64_image, mime_type = _encode_image_from_upload(image)
+# Concurrent uploads of the same image share one OCR call.
+ocr_flight = SingleFlight("ocr")
 
-    parsed_user: Optional[UserProfile] = None
-    if userProfile:
-        try:
-            user_payload = json.loads(userProfile)
-            parsed_user = UserProfile.model_validate(user_payload)
-        except Exception as exc:
-            raise HTTPException(
-                status_code=400,
-                detail=f"userProfile tidak valid: {exc}",
-            )
 
-    client = Mistral(api_key=settings.mistral_api_key)
+async def _run_ocr(image: EncodedImage) -> OcrResult:
+    """OCR an image, reusing the result for identical (or near) uploads."""
+    cache = get_ocr_cache()
+    cached = cache.get(image.digest, image.phash)
+    if cached is not None:
+        return cached
+    return await ocr_flight.do(image.digest, lambda: _ocr_uncached(image))
 
-    try:
-        ocr_response = client.ocr.process(
-            model="mistral-ocr-latest",
-            document={
-                "type": "image_url",
-                "image_url": f"data:{mime_type};base64,{base64_image}",
-            },
+
+async def _run_ocr_all(images: List[EncodedImage]) -> OcrResult:
+    """OCR several photos of one product concurrently and merge them.
+
+    Pages are joined like the pages of a single image and the merged text
+    is read as one label, so the front of pack can supply the name and the
+    panel the nutrition facts. A photo that yields no text is skipped as
+    long as another one worked.
+    """
+    if len(images) == 1:
+        return await _run_ocr(images[0])
+    outcomes = await asyncio.gather(
+        *(_run_ocr(image) for image in images), return_exceptions=True
+    )
+    results = [r for r in outcomes if isinstance(r, OcrResult)]
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException) and (
+            not results or not isinstance(outcome, HTTPException)
+        ):
+            raise outcome
+    if len(results) == 1:
+        return results[0]
+
+    markdown = "\n\n".join(r.markdown for r in results).strip()
+    sources = {r.source for r in results}
+    product_name = next((r.product_name for r in results if r.product_name), None)
+    return _label_result(
+        markdown,
+        read_markdown_label(markdown, get_settings().ocr_local_min_facts),
+        product_name or first_heading(markdown.splitlines()),
+        sources.pop() if len(sources) == 1 else "mixed",
+    )
+
+
+def _label_result(
+    markdown: str, reading: LabelReading, product_name: Optional[str], source: str
+) -> OcrResult:
+    # A partial table is better left as text for the model to read.
+    if len(reading.facts) < get_settings().ocr_local_min_facts:
+        return OcrResult(
+            markdown=markdown, search_query=build_search_query(markdown), source=source
         )
+    return OcrResult(
+        markdown=markdown,
+        search_query=build_facts_query(product_name, list(reading.facts)),
+        product_name=product_name,
+        portion=reading.portion,
+        facts=reading.facts,
+        source=source,
+    )
+
+
+async def _ocr_locally(image: EncodedImage) -> Optional[OcrResult]:
+    """Read the label on this machine; None if the OCR backend is needed."""
+    engine = get_local_ocr()
+    if engine is None:
+        return None
+    settings = get_settings()
+    try:
+        with stage("ocr_local"):
+            lines = await engine.read_lines(image.data_url)
+    except Exception as exc:
+        print(f"[WARN] Local OCR failed, using {settings.ocr_backend}: {exc}")
+        OCR_SOURCES.inc(source="backend", reason="local_error")
+        return None
+    reading = read_nutrition_label(lines, settings.ocr_local_min_facts)
+    if len(reading.facts) < settings.ocr_local_min_facts:
+        OCR_SOURCES.inc(source="backend", reason="too_few_facts")
+        return None
+    if reading.confidence * 100 < settings.ocr_local_min_confidence:
+        OCR_SOURCES.inc(source="backend", reason="low_confidence")
+        return None
+    OCR_SOURCES.inc(source="local", reason="confident")
+    return _label_result(reading.markdown(), reading, None, "local")
+
+
+async def _ocr_uncached(image: EncodedImage) -> OcrResult:
+    cache = get_ocr_cache()
+    try:
+        async with get_ocr_slots().slot():
+            local = await _ocr_locally(image)
+            if local is not None:
+                cache.set(image.digest, local, image.phash)
+                return local
+            with stage("ocr"):
+                pages = await get_ocr_backend().process(image.data_url)
+    except Overloaded:
+        raise
     except Exception as exc:
         raise HTTPException(
             status_code=500, detail=f"Kesalahan OCR: {exc}"
         )
 
-    ocr_dict = ocr_response.model_dump()
-    pages = ocr_dict.get("pages", [])
     if not pages:
         raise HTTPException(
             status_code=500, detail="Hasil OCR kosong."
         )
 
-    markdown_pages = [
-        page.get("markdown") or ""
-        for page in pages
-        if page.get("markdown")
-    ]
+    markdown_pages = [page for page in pages if page]
     markdown = "\n\n".join(markdown_pages).strip()
     if not markdown:
         raise HTTPException(
             status_code=500, detail="Markdown OCR tidak ditemukan."
         )
 
-    user_profile_text = build_user_profile_text(parsed_user)
-    product_profile_text = f"Hasil OCR:\n{markdown}"
-    search_query = build_search_query(markdown)
+    result = _label_result(
+        markdown,
+        read_markdown_label(markdown, get_settings().ocr_local_min_facts),
+        first_heading(markdown.splitlines()),
+        "backend",
+    )
+    cache.set(image.digest, result, image.phash)
+    return result
+
+
+def _parse_user_profile(raw: Optional[str]) -> Optional[UserProfile]:
+    if not raw:
+        return None
+    try:
+        user_payload = json.loads(raw)
+        return UserProfile.model_validate(user_payload)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=400,
+            detail=f"userProfile tidak valid: {exc}",
+        )
+
+
+def _build_chain_inputs(
+    ocr_result: OcrResult, parsed_user: Optional[UserProfile]
+) -> dict:
     user_query = build_user_query(
         parsed_user.medical_history
         if parsed_user
         else None
     )
-
-    try:
-        answer = rag_chain.invoke(
-            {
-                "search_query": search_query,
-                "user_query": user_query,
-                "user_profile": user_profile_text,
-                "product_profile": product_profile_text,
-            }
+    compact = compact_ocr_markdown(
+        ocr_result.markdown, get_settings().ocr_context_max_tokens
+    )
+    if ocr_result.facts:
+        # The label was read into facts: same profile as a manual request,
+        # plus whatever else the label says (composition, allergens).
+        product = Product(
+            name=ocr_result.product_name,
+            portion=portion_or_unknown(ocr_result.portion),
         )
+        product_profile = build_product_profile(product, list(ocr_result.facts))
+        notes = [
+            line
+            for line in compact.splitlines()
+            if not line.startswith(("|", "#"))
+        ]
+        if notes:
+            product_profile += "\nKeterangan label:\n" + "\n".join(notes)
+    else:
+        product_profile = "Hasil OCR:\n" + compact
+    return {
+        "search_query": ocr_result.search_query,
+        "user_query": user_query,
+        "user_profile": build_user_profile_text(parsed_user),
+        "product_profile": product_profile,
+    }
 
-        return OcrSearchResponse(
-            status="ok",
-            answer=answer,
-            ocr_markdown=markdown,
-            used_query=search_query,
-            user_profile=user_profile_text,
-            product_profile=product_profile_text,
-        )
 
-    except ValidationError as exc:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Output model tidak sesuai skema: {exc}",
-        )
-    except HTTPException:
-        raise
-    except Exception as exc:
-        raise HTTPException(
-            status_code=500, detail=f"Kesalahan RAG: {exc}"
+def _build_response(
+    ocr_result: OcrResult, inputs: dict, answer
+) -> OcrSearchResponse:
+    return OcrSearchResponse(
+        status="ok",
+        answer=answer,
+        ocr_markdown=ocr_result.markdown,
+        used_query=inputs["search_query"],
+        user_profile=inputs["user_profile"],
+        product_profile=inputs["product_profile"],
+        ocr_source=ocr_result.source,
+    )
+
+
+async def _answer(
+    images: List[EncodedImage],
+    parsed_user: Optional[UserProfile],
+    mode: Optional[str],
+) -> OcrSearchResponse:
+    ocr_result = await _run_ocr_all(images)
+    inputs = _build_chain_inputs(ocr_result, parsed_user)
+    async with get_rag_slots().slot():
+        answer = await aanswer(inputs, mode)
+    return _build_response(ocr_result, inputs, answer)
+
+
+@router.post("/search/ocr", response_model=OcrSearchResponse)
+async def ocr_search(
+    request: Request,
+    image: Optional[UploadFile] = File(None),
+    images: Optional[List[UploadFile]] = File(None),
+    userProfile: Optional[str] = Form(None),
+    mode: Optional[Literal["llm", "fast"]] = Query(None),
+):
+    """Answer for a product from one or more label photos.
+
+    Send one photo as ``image`` or several (e.g. front of pack and the
+    nutrition panel) as repeated ``images`` fields; all of them go into a
+    single retrieval and generation.
+    """
+    # Reject before decoding the upload when OCR could not even queue.
+    get_ocr_slots().check()
+    encoded_images = await _encode_images(image, images)
+    parsed_user = _parse_user_profile(userProfile)
+
+    async def run() -> OcrSearchResponse:
+        try:
+            return await _answer(encoded_images, parsed_user, mode)
+        except (HTTPException, Overloaded):
+            raise
+        except Exception as exc:
+            raise HTTPException(
+                status_code=500, detail=describe_rag_error(exc)
+            )
+
+    return await run_guarded(request, run())
+
+
+async def _run_ocr_job(payload: dict) -> dict:
+    images = [EncodedImage(**image) for image in payload["images"]]
+    user = payload.get("userProfile")
+    parsed_user = UserProfile.model_validate(user) if user else None
+    response = await run_job(_answer(images, parsed_user, payload.get("mode")))
+    return response.model_dump(mode="json")
+
+
+register_job_handler("ocr", _run_ocr_job)
+
+
+@router.post("/jobs/ocr", status_code=202, response_model=JobStatusResponse)
+async def ocr_search_job(
+    response: Response,
+    image: Optional[UploadFile] = File(None),
+    images: Optional[List[UploadFile]] = File(None),
+    userProfile: Optional[str] = Form(None),
+    mode: Optional[Literal["llm", "fast"]] = Query(None),
+    callback_url: Optional[str] = Query(None),
+):
+    """Queue a /search/ocr request and return its job at once.
+
+    The encoded photos are stored with the job, so the upload is the only
+    part the client has to stay connected for.
+    """
+    encoded_images = await _encode_images(image, images)
+    parsed_user = _parse_user_profile(userProfile)
+    stored = []
+    for encoded in encoded_images:
+        fields = asdict(encoded)
+        del fields["timings"]
+        stored.append(fields)
+    return await accept_job(
+        "ocr",
+        {
+            "images": stored,
+            "userProfile": parsed_user.model_dump() if parsed_user else None,
+            "mode": mode,
+        },
+        callback_url,
+        response,
+    )
+
+
+@router.post("/search/ocr/stream")
+async def ocr_search_stream(
+    request: Request,
+    image: Optional[UploadFile] = File(None),
+    images: Optional[List[UploadFile]] = File(None),
+    userProfile: Optional[str] = Form(None),
+):
+    """Server-sent events variant of /search/ocr.
+
+    Events: ``ocr`` (markdown and search query), ``candidates``,
+    ``product_assessment``, ``recommendation`` (one per item), ``replace``
+    if repair changed those, then ``answer`` with the full
+    OcrSearchResponse, or ``error``.
+    """
+    get_ocr_slots().check()
+    encoded_images = await _encode_images(image, images)
+    parsed_user = _parse_user_profile(userProfile)
+    start_deadline(request)
+
+    async def events():
+        try:
+            ocr_result = await _run_ocr_all(encoded_images)
+        except HTTPException as exc:
+            yield sse_event("error", {"detail": exc.detail})
+            return
+        except Overloaded as exc:
+            yield sse_event("error", {"detail": str(exc)})
+            return
+        inputs = _build_chain_inputs(ocr_result, parsed_user)
+        yield sse_event(
+            "ocr",
+            {
+                "ocr_markdown": ocr_result.markdown,
+                "used_query": ocr_result.search_query,
+            },
         )
+        try:
+            async with get_rag_slots().slot():
+                async for event, data in astream_rag(inputs):
+                    if event == "answer":
+                        data = _build_response(ocr_result, inputs, data)
+                    yield sse_event(event, data)
+        except Exception as exc:
+            yield sse_event("error", {"detail": describe_rag_error(exc)})
+
+    return sse_response(events())
@@ -1,11 +1,12 @@
 import os
 from dataclasses import dataclass
+from typing import Optional, Tuple
 from urllib.parse import quote_plus, urlparse
 
 import certifi
 from dotenv import load_dotenv
 
-load_dotenv()
+from app.core.lazy import lazy
 
 
 def _require_env(var: str) -> str:
@@ -15,6 +16,30 @@ def _require_env(var: str) -> str:
     return value
 
 
+def _bool_env(var: str, default: bool) -> bool:
+    value = os.getenv(var)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _list_env(var: str, default: Tuple[str, ...]) -> Tuple[str, ...]:
+    value = os.getenv(var)
+    if not value:
+        return default
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+def _int_env(var: str, default: int) -> int:
+    value = os.getenv(var)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError as exc:
+        raise RuntimeError(f"{var} must be an integer, got {value!r}") from exc
+
+
 @dataclass(frozen=True)
 class Settings:
     mistral_api_key: str
@@ -27,6 +52,79 @@ class Settings:
     ollama_base_url: str
     ollama_embedding_model: str
     ollama_chat_model: str
+    rag_max_concurrency: int = 32
+    ocr_max_concurrency: int = 16
+    rag_max_queue: int = 64
+    ocr_max_queue: int = 32
+    admission_queue_timeout_seconds: int = 10
+    request_timeout_seconds: int = 60
+    answer_cache_size: int = 1024
+    answer_cache_ttl_seconds: int = 6 * 3600
+    answer_cache_path: Optional[str] = None
+    embedding_cache_size: int = 4096
+    embedding_cache_path: Optional[str] = None
+    embedding_cache_disk_capacity: int = 65536
+    batch_max_items: int = 100
+    batch_max_concurrency: int = 4
+    startup_retries: int = 5
+    warmup_retry_seconds: int = 30
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: bool = True
+    db_pool_timeout_seconds: int = 10
+    ocr_backend: str = "mistral"
+    ocr_model: str = "mistral-ocr-latest"
+    ocr_timeout_seconds: int = 30
+    ocr_connect_timeout_seconds: int = 5
+    ocr_max_connections: int = 20
+    ocr_retries: int = 2
+    ocr_stub_latency_ms: int = 0
+    ocr_max_images: int = 4
+    ocr_local: bool = False
+    ocr_local_lang: str = "ind+eng"
+    # Percent; below this the label is sent to the OCR backend instead.
+    ocr_local_min_confidence: int = 70
+    ocr_local_min_facts: int = 3
+    ocr_stub_markdown_path: Optional[str] = None
+    ocr_cache_size: int = 512
+    ocr_cache_ttl_seconds: int = 24 * 3600
+    ocr_phash_max_distance: int = 0
+    upload_max_bytes: int = 10 * 1024 * 1024
+    ocr_max_image_side: int = 2000
+    ocr_jpeg_quality: int = 85
+    server_timing: bool = False
+    vector_replica: bool = False
+    retrieval_mode: str = "similarity"
+    answer_mode: str = "llm"
+    answer_repair_attempts: int = 1
+    context_max_tokens: int = 600
+    context_doc_chars: int = 160
+    ocr_context_max_tokens: int = 500
+    # Default to just OLLAMA_BASE_URL.
+    ollama_chat_urls: Tuple[str, ...] = ()
+    ollama_embedding_urls: Tuple[str, ...] = ()
+    ollama_chat_endpoint_concurrency: int = 4
+    ollama_embedding_endpoint_concurrency: int = 8
+    ollama_eject_after_failures: int = 3
+    ollama_eject_seconds: int = 30
+    ollama_health_interval_seconds: int = 15
+    ollama_chat_hedge_ms: int = 0
+    ollama_embedding_hedge_ms: int = 0
+    jobs_db_path: str = "jobs.sqlite3"
+    jobs_workers: int = 4
+    jobs_max_attempts: int = 3
+    jobs_lease_seconds: int = 300
+    jobs_ttl_seconds: int = 24 * 3600
+    jobs_callback_timeout_seconds: int = 10
+    # When set, callbacks may only go to these hosts; otherwise to any
+    # host that resolves to public addresses only.
+    jobs_callback_hosts: Tuple[str, ...] = ()
+    # JSON from ``python -m app.rag.recommendations``; off when unset.
+    recommendation_index_path: Optional[str] = None
+    hybrid_fetch_k: int = 12
+    vector_replica_refresh_seconds: int = 300
+    vector_replica_max_staleness_seconds: int = 3600
 
     @property
     def tidb_conn_str(self) -> str:
@@ -43,17 +141,112 @@ class Settings:
 
 
 def load_settings() -> Settings:
+    ocr_backend = os.getenv("OCR_BACKEND", "mistral").strip().lower()
+    ollama_base_url = os.getenv("OLLAMA_BASE_URL")
+    default_ollama = (ollama_base_url or "http://localhost:11434",)
     return Settings(
-        mistral_api_key=_require_env("MISTRAL_API_KEY"),
+        # The stub OCR backend runs offline and needs no key.
+        mistral_api_key=(
+            _require_env("MISTRAL_API_KEY")
+            if ocr_backend == "mistral"
+            else os.getenv("MISTRAL_API_KEY", "")
+        ),
         tidb_user=_require_env("TIDB_USER"),
         tidb_password=_require_env("TIDB_PASSWORD"),
         tidb_host=_require_env("TIDB_HOST"),
         tidb_port=int(os.getenv("TIDB_PORT")),
         tidb_db=os.getenv("TIDB_DB"),
         tidb_vector_table=os.getenv("TIDB_VECTOR_TABLE"),
-        ollama_base_url=os.getenv("OLLAMA_BASE_URL"),
+        ollama_base_url=ollama_base_url,
         ollama_embedding_model=os.getenv("OLLAMA_EMBEDDING_MODEL"),
         ollama_chat_model=os.getenv("OLLAMA_CHAT_MODEL"),
+        rag_max_concurrency=_int_env("RAG_MAX_CONCURRENCY", 32),
+        ocr_max_concurrency=_int_env("OCR_MAX_CONCURRENCY", 16),
+        rag_max_queue=_int_env("RAG_MAX_QUEUE", 64),
+        ocr_max_queue=_int_env("OCR_MAX_QUEUE", 32),
+        admission_queue_timeout_seconds=_int_env(
+            "ADMISSION_QUEUE_TIMEOUT_SECONDS", 10
+        ),
+        request_timeout_seconds=_int_env("REQUEST_TIMEOUT_SECONDS", 60),
+        answer_cache_size=_int_env("ANSWER_CACHE_SIZE", 1024),
+        answer_cache_ttl_seconds=_int_env("ANSWER_CACHE_TTL_SECONDS", 6 * 3600),
+        answer_cache_path=os.getenv("ANSWER_CACHE_PATH") or None,
+        embedding_cache_size=_int_env("EMBEDDING_CACHE_SIZE", 4096),
+        embedding_cache_path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+        embedding_cache_disk_capacity=_int_env(
+            "EMBEDDING_CACHE_DISK_CAPACITY", 65536
+        ),
+        batch_max_items=_int_env("BATCH_MAX_ITEMS", 100),
+        batch_max_concurrency=_int_env("BATCH_MAX_CONCURRENCY", 4),
+        startup_retries=_int_env("STARTUP_RETRIES", 5),
+        warmup_retry_seconds=_int_env("WARMUP_RETRY_SECONDS", 30),
+        db_pool_size=_int_env("DB_POOL_SIZE", 10),
+        db_max_overflow=_int_env("DB_MAX_OVERFLOW", 10),
+        db_pool_recycle_seconds=_int_env("DB_POOL_RECYCLE_SECONDS", 1800),
+        db_pool_pre_ping=_bool_env("DB_POOL_PRE_PING", True),
+        db_pool_timeout_seconds=_int_env("DB_POOL_TIMEOUT_SECONDS", 10),
+        ocr_backend=ocr_backend,
+        ocr_model=os.getenv("OCR_MODEL", "mistral-ocr-latest"),
+        ocr_timeout_seconds=_int_env("OCR_TIMEOUT_SECONDS", 30),
+        ocr_connect_timeout_seconds=_int_env("OCR_CONNECT_TIMEOUT_SECONDS", 5),
+        ocr_max_connections=_int_env("OCR_MAX_CONNECTIONS", 20),
+        ocr_retries=_int_env("OCR_RETRIES", 2),
+        ocr_stub_latency_ms=_int_env("OCR_STUB_LATENCY_MS", 0),
+        ocr_max_images=_int_env("OCR_MAX_IMAGES", 4),
+        ocr_local=_bool_env("OCR_LOCAL", False),
+        ocr_local_lang=os.getenv("OCR_LOCAL_LANG", "ind+eng"),
+        ocr_local_min_confidence=_int_env("OCR_LOCAL_MIN_CONFIDENCE", 70),
+        ocr_local_min_facts=_int_env("OCR_LOCAL_MIN_FACTS", 3),
+        ocr_stub_markdown_path=os.getenv("OCR_STUB_MARKDOWN_PATH") or None,
+        ocr_cache_size=_int_env("OCR_CACHE_SIZE", 512),
+        ocr_cache_ttl_seconds=_int_env("OCR_CACHE_TTL_SECONDS", 24 * 3600),
+        ocr_phash_max_distance=_int_env("OCR_PHASH_MAX_DISTANCE", 0),
+        upload_max_bytes=_int_env("UPLOAD_MAX_BYTES", 10 * 1024 * 1024),
+        ocr_max_image_side=_int_env("OCR_MAX_IMAGE_SIDE", 2000),
+        ocr_jpeg_quality=_int_env("OCR_JPEG_QUALITY", 85),
+        server_timing=_bool_env("SERVER_TIMING", False),
+        vector_replica=_bool_env("VECTOR_REPLICA", False),
+        retrieval_mode=os.getenv("RETRIEVAL_MODE", "similarity").strip().lower(),
+        answer_mode=os.getenv("ANSWER_MODE", "llm").strip().lower(),
+        answer_repair_attempts=_int_env("ANSWER_REPAIR_ATTEMPTS", 1),
+        context_max_tokens=_int_env("CONTEXT_MAX_TOKENS", 600),
+        context_doc_chars=_int_env("CONTEXT_DOC_CHARS", 160),
+        ocr_context_max_tokens=_int_env("OCR_CONTEXT_MAX_TOKENS", 500),
+        ollama_chat_urls=_list_env("OLLAMA_CHAT_URLS", default_ollama),
+        ollama_embedding_urls=_list_env("OLLAMA_EMBEDDING_URLS", default_ollama),
+        ollama_chat_endpoint_concurrency=_int_env(
+            "OLLAMA_CHAT_ENDPOINT_CONCURRENCY", 4
+        ),
+        ollama_embedding_endpoint_concurrency=_int_env(
+            "OLLAMA_EMBEDDING_ENDPOINT_CONCURRENCY", 8
+        ),
+        ollama_eject_after_failures=_int_env("OLLAMA_EJECT_AFTER_FAILURES", 3),
+        ollama_eject_seconds=_int_env("OLLAMA_EJECT_SECONDS", 30),
+        ollama_health_interval_seconds=_int_env("OLLAMA_HEALTH_INTERVAL_SECONDS", 15),
+        ollama_chat_hedge_ms=_int_env("OLLAMA_CHAT_HEDGE_MS", 0),
+        ollama_embedding_hedge_ms=_int_env("OLLAMA_EMBEDDING_HEDGE_MS", 0),
+        jobs_db_path=os.getenv("JOBS_DB_PATH", "jobs.sqlite3"),
+        jobs_workers=_int_env("JOBS_WORKERS", 4),
+        jobs_max_attempts=_int_env("JOBS_MAX_ATTEMPTS", 3),
+        jobs_lease_seconds=_int_env("JOBS_LEASE_SECONDS", 300),
+        jobs_ttl_seconds=_int_env("JOBS_TTL_SECONDS", 24 * 3600),
+        jobs_callback_timeout_seconds=_int_env("JOBS_CALLBACK_TIMEOUT_SECONDS", 10),
+        jobs_callback_hosts=tuple(
+            host.lower() for host in _list_env("JOBS_CALLBACK_HOSTS", ())
+        ),
+        recommendation_index_path=os.getenv("RECOMMENDATION_INDEX_PATH") or None,
+        hybrid_fetch_k=_int_env("HYBRID_FETCH_K", 12),
+        vector_replica_refresh_seconds=_int_env(
+            "VECTOR_REPLICA_REFRESH_SECONDS", 300
+        ),
+        vector_replica_max_staleness_seconds=_int_env(
+            "VECTOR_REPLICA_MAX_STALENESS_SECONDS", 3600
+        ),
     )
 
-settings = load_settings()
+
+@lazy
+def get_settings() -> Settings:
+    """Read the environment (and .env) on first use, not at import."""
+    load_dotenv()
+    return load_settings()
@@ -1,18 +1,128 @@
-from sqlalchemy import create_engine, text
+import threading
+import time
 
-from app.core.config import settings
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
 
-engine = create_engine(settings.tidb_conn_str, pool_pre_ping=True)
+from app.core.config import get_settings
+from app.core.lazy import lazy
+from app.core.startup import retry_init
+
+
+class PoolStats:
+    """Counters for connection checkouts from the shared pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def record_connect(self) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+        }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that measures how long each checkout waits for a slot."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_stats.record_wait(time.perf_counter() - started)
+        return conn
+
+
+@lazy
+def get_engine() -> Engine:
+    """The one TiDB engine/pool of the process.
+
+    The vector store and every other DB access share it, so TLS handshakes
+    to TiDB Cloud are paid once per pooled connection.
+    """
+    settings = get_settings()
+    engine = create_engine(
+        settings.tidb_conn_str,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle_seconds,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_timeout=settings.db_pool_timeout_seconds,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, record):
+        pool_stats.record_connect()
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_conn, record, exc):
+        pool_stats.record_invalidation()
+
+    print(f"[INFO] TiDB connection string ready. Connected DB = {settings.db_name}")
+    return engine
+
+
+def pool_status() -> dict:
+    """Live pool occupancy plus cumulative checkout/wait counters."""
+    engine = get_engine.peek()
+    status = pool_stats.snapshot()
+    if engine is not None and isinstance(engine.pool, QueuePool):
+        pool = engine.pool
+        status.update(
+            {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            }
+        )
+    return status
 
 
 def verify_connection() -> None:
     """Ping TiDB to fail fast if credentials are wrong."""
-    try:
-        with engine.connect() as conn:
+
+    def ping() -> None:
+        with get_engine().connect() as conn:
             print("Ping TiDB:", conn.execute(text("SELECT 1")).scalar())
+
+    try:
+        retry_init(ping, "TiDB ping")
     except Exception as exc:
         raise RuntimeError(f"Failed to connect to TiDB: {exc}") from exc
-
-
-print(f"[INFO] TiDB connection string ready. Connected DB = {settings.db_name}")
-verify_connection()
@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.cache import TTLCache
+
+_MAGIC = b"GRNEMB01"
+# magic, dimension, capacity, next slot, filled slots
+_HEADER = struct.Struct("<8sIIQQ")
+_HEADER_SIZE = 64
+_KEY_SIZE = 32
+
+
+def embedding_key(model: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+
+def pack_vector(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(packed: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(packed)
+    return values.tolist()
+
+
+class MmapVectorFile:
+    """Fixed-size ring of (key, float32 vector) records in a memory-mapped file.
+
+    The file is created on the first write, once the embedding dimension is
+    known. When full, the oldest slot is overwritten. Intended for a single
+    writer process; point each worker at its own file.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.capacity = capacity
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self._mm: Optional[mmap.mmap] = None
+        self._file = None
+        self._index: Dict[bytes, int] = {}
+        self._next_slot = 0
+        self._filled = 0
+        if os.path.exists(path):
+            self._open_existing()
+
+    @property
+    def _record_size(self) -> int:
+        return _KEY_SIZE + self.dim * 4
+
+    def _offset(self, slot: int) -> int:
+        return _HEADER_SIZE + slot * self._record_size
+
+    def _open_existing(self) -> None:
+        self._file = open(self.path, "r+b")
+        header = self._file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            self._reset()
+            return
+        magic, dim, capacity, next_slot, filled = _HEADER.unpack(header)
+        if magic != _MAGIC or capacity != self.capacity or not dim:
+            self._reset()
+            return
+        self.dim = dim
+        expected = self._offset(capacity)
+        if os.path.getsize(self.path) != expected:
+            self._reset()
+            return
+        self._mm = mmap.mmap(self._file.fileno(), expected)
+        self._next_slot = next_slot
+        self._filled = min(filled, capacity)
+        for slot in range(self._filled):
+            start = self._offset(slot)
+            self._index[bytes(self._mm[start : start + _KEY_SIZE])] = slot
+
+    def _reset(self) -> None:
+        self.close()
+        os.remove(self.path)
+        self.dim = None
+        self._index.clear()
+        self._next_slot = 0
+        self._filled = 0
+
+    def _create(self, dim: int) -> None:
+        self.dim = dim
+        self._file = open(self.path, "w+b")
+        self._file.truncate(self._offset(self.capacity))
+        self._mm = mmap.mmap(self._file.fileno(), self._offset(self.capacity))
+        self._write_header()
+
+    def _write_header(self) -> None:
+        self._mm[: _HEADER.size] = _HEADER.pack(
+            _MAGIC, self.dim, self.capacity, self._next_slot, self._filled
+        )
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        with self._lock:
+            slot = self._index.get(key)
+            if slot is None:
+                return None
+            start = self._offset(slot) + _KEY_SIZE
+            return bytes(self._mm[start : start + self.dim * 4])
+
+    def put(self, key: bytes, packed: bytes) -> None:
+        dim = len(packed) // 4
+        with self._lock:
+            if key in self._index:
+                return
+            if self._mm is None:
+                self._create(dim)
+            elif dim != self.dim:
+                # The embedding model changed shape; start over.
+                self._reset()
+                self._create(dim)
+            slot = self._next_slot % self.capacity
+            start = self._offset(slot)
+            if slot < self._filled:
+                old_key = bytes(self._mm[start : start + _KEY_SIZE])
+                self._index.pop(old_key, None)
+            self._mm[start : start + _KEY_SIZE] = key
+            self._mm[start + _KEY_SIZE : start + self._record_size] = packed
+            self._index[key] = slot
+            self._next_slot += 1
+            self._filled = min(self._filled + 1, self.capacity)
+            self._write_header()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.flush()
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that memoizes vectors by model name + text hash.
+
+    Vectors are kept as packed float32 in a bounded in-process LRU, with an
+    optional memory-mapped file behind it so warm restarts skip the Ollama
+    round trip. Cached and fresh vectors both go through float32, so results
+    do not depend on whether a lookup hit.
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        model_name: str,
+        maxsize: int = 4096,
+        path: Optional[str] = None,
+        disk_capacity: int = 65536,
+    ):
+        self.base = base
+        self.model_name = model_name
+        self._memory = TTLCache(maxsize=maxsize)
+        self._disk = MmapVectorFile(path, disk_capacity) if path else None
+        self.disk_hits = 0
+        self.misses = 0
+        self.embed_calls = 0
+
+    def _lookup(self, key: bytes) -> Optional[bytes]:
+        packed = self._memory.get(key)
+        if packed is not None:
+            return packed
+        if self._disk is not None:
+            packed = self._disk.get(key)
+            if packed is not None:
+                self.disk_hits += 1
+                self._memory.set(key, packed)
+                return packed
+        self.misses += 1
+        return None
+
+    def _store(self, key: bytes, vector: Sequence[float]) -> bytes:
+        packed = pack_vector(vector)
+        self._memory.set(key, packed)
+        if self._disk is not None:
+            self._disk.put(key, packed)
+        return packed
+
+    def _partition(self, texts: List[str]):
+        keys = [embedding_key(self.model_name, t) for t in texts]
+        found: Dict[bytes, bytes] = {}
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            packed = self._lookup(key)
+            if packed is None:
+                missing[key] = text
+            else:
+                found[key] = packed
+        return keys, found, missing
+
+    def _collect(self, keys, found, missing, vectors) -> List[List[float]]:
+        for key, vector in zip(missing, vectors):
+            found[key] = self._store(key, vector)
+        return [unpack_vector(found[key]) for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._partition(texts)
+        vectors = []
+        if missing:
+            self.embed_calls += 1
+            vectors = self.base.embed_documents(list(missing.values()))
+        return self._collect(keys, found, missing, vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self._disk is not None:
+            keys, found, missing = await asyncio.to_thread(self._partition, texts)
+        else:
+            keys, found, missing = self._partition(texts)
+        vectors = []
+        if missing:
+            self.embed_calls += 1
+            vectors = await self.base.aembed_documents(list(missing.values()))
+        return self._collect(keys, found, missing, vectors)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+    def stats(self) -> dict:
+        memory = self._memory.stats()
+        hits = memory["hits"] + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "model": self.model_name,
+            "memory": memory,
+            "disk_enabled": self._disk is not None,
+            "disk_entries": len(self._disk) if self._disk is not None else 0,
+            "disk_hits": self.disk_hits,
+            "hits": hits,
+            "misses": self.misses,
+            "embed_calls": self.embed_calls,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,415 @@
+import asyncio
+import ipaddress
+import json
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential_jitter
+
+from app.core.config import get_settings
+from app.core.lazy import lazy
+from app.core.limits import Overloaded
+from app.core.metrics import JOB_CALLBACKS, JOBS
+
+# Handlers by job kind: an async function from the stored payload to the
+# JSON-able result. Route modules register theirs at import.
+JobHandler = Callable[[dict], Awaitable[dict]]
+_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def register_job_handler(kind: str, handler: JobHandler) -> None:
+    _HANDLERS[kind] = handler
+
+
+class JobFailed(Exception):
+    """A job that can never succeed (bad input, unreadable image); not retried."""
+
+
+def check_callback_url(url: str) -> Optional[str]:
+    """Raise ValueError unless ``url`` is a callback target we may POST to.
+
+    Anyone can submit a job, so the callback must not reach the metadata
+    service, Ollama or anything else on the internal network: with
+    JOBS_CALLBACK_HOSTS set only those hosts are allowed, otherwise every
+    address the host resolves to must be public. Returns the checked
+    address to connect to (None for an allowed host), so a second DNS
+    lookup cannot point the request elsewhere. Blocking (DNS lookup).
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("callback_url harus berupa URL http(s).")
+    host = parsed.hostname.lower()
+    allowed = get_settings().jobs_callback_hosts
+    if allowed:
+        if host not in allowed:
+            raise ValueError("Host callback_url tidak diizinkan.")
+        return None
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        infos = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, ValueError):
+        raise ValueError("Host callback_url tidak dapat ditemukan.")
+    addresses = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+    if not addresses or not all(address.is_global for address in addresses):
+        raise ValueError("callback_url tidak boleh menuju alamat internal.")
+    return str(addresses[0])
+
+
+def _pinned(url: str, address: str) -> Tuple[str, dict, dict]:
+    """``url`` aimed at ``address``, keeping the original Host and TLS name."""
+    parsed = urlparse(url)
+    host = f"[{address}]" if ":" in address else address
+    if parsed.port:
+        host += f":{parsed.port}"
+    headers = {"Host": parsed.netloc.rpartition("@")[2]}
+    extensions = {"sni_hostname": parsed.hostname} if parsed.scheme == "https" else {}
+    return parsed._replace(netloc=host).geturl(), headers, extensions
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str
+    payload: Optional[dict]
+    result: Optional[dict]
+    error: Optional[str]
+    callback_url: Optional[str]
+    attempts: int
+    created_at: float
+    updated_at: float
+
+    def view(self) -> dict:
+        """What clients see: everything but the (possibly large) payload."""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+_COLUMNS = (
+    "id, kind, status, payload, result, error, callback_url, attempts,"
+    " created_at, updated_at"
+)
+
+
+def _job(row) -> Job:
+    id_, kind, status, payload, result, error, callback, attempts, created, updated = row
+    return Job(
+        id=id_,
+        kind=kind,
+        status=status,
+        payload=json.loads(payload) if payload else None,
+        result=json.loads(result) if result else None,
+        error=error,
+        callback_url=callback,
+        attempts=attempts,
+        created_at=created,
+        updated_at=updated,
+    )
+
+
+class SqliteJobStore:
+    """Job state in SQLite, shared by all workers on the same host.
+
+    A job is claimed by moving it to ``running`` with a lease; a job whose
+    lease ran out (its worker died or the process restarted) is claimable
+    again, so accepted work survives restarts. Queued jobs use the lease
+    column as "not before", which is how retries are delayed.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " payload TEXT,"
+                " result TEXT,"
+                " error TEXT,"
+                " callback_url TEXT,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " lease_until REAL NOT NULL"
+                ")"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, lease_until)"
+            )
+
+    def add(self, kind: str, payload: dict, callback_url: Optional[str]) -> Job:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, callback_url,"
+                " created_at, updated_at, lease_until)"
+                " VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), callback_url, now, now, now),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return _job(row) if row else None
+
+    def claim(self, lease_seconds: float) -> Optional[Job]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running')"
+                " AND lease_until <= ? ORDER BY created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            claimed = self._conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1,"
+                " lease_until = ?, updated_at = ?"
+                " WHERE id = ? AND status IN ('queued', 'running')"
+                " AND lease_until <= ?",
+                (now + lease_seconds, now, row[0], now),
+            ).rowcount
+        # Another process may have claimed it between the two statements.
+        return self.get(row[0]) if claimed else None
+
+    def finish(
+        self, job_id: str, result: Optional[dict] = None, error: Optional[str] = None
+    ) -> None:
+        status = "failed" if error is not None else "succeeded"
+        with self._lock, self._conn:
+            # The payload (e.g. encoded images) is not needed any more.
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, payload = NULL,"
+                " updated_at = ? WHERE id = ?",
+                (
+                    status,
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def requeue(
+        self, job_id: str, delay: float, error: Optional[str], count_attempt: bool
+    ) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, lease_until = ?,"
+                " attempts = attempts - ?, updated_at = ? WHERE id = ?",
+                (error, now + delay, 0 if count_attempt else 1, now, job_id),
+            )
+
+    def prune(self, older_than: float) -> int:
+        cutoff = time.time() - older_than
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed')"
+                " AND updated_at < ?",
+                (cutoff,),
+            ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueue:
+    """Background workers running stored jobs, with retries and callbacks.
+
+    ``workers`` jobs run at once per process. Transient failures are
+    retried with exponential backoff up to ``max_attempts``; a saturated
+    backend (``Overloaded``) puts the job back after its Retry-After
+    without using up an attempt. When a job finishes and has a callback
+    URL, the job as returned by ``GET /jobs/{id}`` is POSTed there.
+    """
+
+    def __init__(
+        self,
+        store: SqliteJobStore,
+        workers: int,
+        max_attempts: int,
+        lease_seconds: float,
+        ttl_seconds: float,
+        callback_timeout: float,
+        poll_interval: float = 1.0,
+    ):
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.lease_seconds = lease_seconds
+        self.ttl_seconds = ttl_seconds
+        self.poll_interval = poll_interval
+        self._http = httpx.AsyncClient(timeout=callback_timeout)
+        self._wake = asyncio.Event()
+        self._tasks: list = []
+        self.running = 0
+
+    async def submit(
+        self, kind: str, payload: dict, callback_url: Optional[str] = None
+    ) -> Job:
+        if kind not in _HANDLERS:
+            raise RuntimeError(f"No handler for job kind {kind!r}")
+        job = await asyncio.to_thread(self.store.add, kind, payload, callback_url)
+        JOBS.inc(kind=kind, outcome="submitted")
+        self._wake.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._work()) for _ in range(self.workers)
+            ]
+            self._tasks.append(asyncio.create_task(self._prune()))
+
+    async def aclose(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._http.aclose()
+        self.store.close()
+
+    async def _work(self) -> None:
+        while True:
+            job = await asyncio.to_thread(self.store.claim, self.lease_seconds)
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.running += 1
+            try:
+                await self._run(job)
+            finally:
+                self.running -= 1
+
+    async def _run(self, job: Job) -> None:
+        if job.attempts > self.max_attempts:
+            # Its earlier workers died mid-run every time.
+            await self._finish(job, error=job.error or "Pekerjaan terhenti berulang kali.")
+            return
+        try:
+            # Past the lease another worker could pick the job up again.
+            result = await asyncio.wait_for(
+                _HANDLERS[job.kind](job.payload or {}), self.lease_seconds
+            )
+        except asyncio.CancelledError:
+            # Shutting down: hand the job to the next process right away.
+            self.store.requeue(job.id, 0, None, count_attempt=False)
+            raise
+        except Overloaded as exc:
+            await asyncio.to_thread(
+                self.store.requeue, job.id, exc.retry_after, str(exc), False
+            )
+            JOBS.inc(kind=job.kind, outcome="deferred")
+        except JobFailed as exc:
+            await self._finish(job, error=str(exc))
+        except Exception as exc:
+            if job.attempts >= self.max_attempts:
+                await self._finish(job, error=str(exc))
+                return
+            print(f"[WARN] Job {job.id} ({job.kind}) attempt {job.attempts} failed: {exc}")
+            await asyncio.to_thread(
+                self.store.requeue, job.id, 2 ** job.attempts, str(exc), True
+            )
+            JOBS.inc(kind=job.kind, outcome="retried")
+        else:
+            await self._finish(job, result=result)
+
+    async def _finish(
+        self, job: Job, result: Optional[dict] = None, error: Optional[str] = None
+    ) -> None:
+        await asyncio.to_thread(self.store.finish, job.id, result, error)
+        JOBS.inc(kind=job.kind, outcome="failed" if error is not None else "succeeded")
+        if job.callback_url:
+            finished = await self.get(job.id)
+            await self._callback(job.callback_url, finished.view())
+
+    async def _callback(self, url: str, body: dict) -> None:
+        try:
+            # Checked again: the host may resolve differently by now. The
+            # request then goes to the address that was checked.
+            address = await asyncio.to_thread(check_callback_url, url)
+        except ValueError as exc:
+            JOB_CALLBACKS.inc(outcome="refused")
+            print(f"[WARN] Job callback to {url} refused: {exc}")
+            return
+        target, headers, extensions = url, {}, {}
+        if address is not None:
+            target, headers, extensions = _pinned(url, address)
+        try:
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(3),
+                wait=wait_exponential_jitter(initial=0.5, max=8),
+                reraise=True,
+            ):
+                with attempt:
+                    response = await self._http.post(
+                        target, json=body, headers=headers, extensions=extensions
+                    )
+                    response.raise_for_status()
+            JOB_CALLBACKS.inc(outcome="delivered")
+        except Exception as exc:
+            JOB_CALLBACKS.inc(outcome="failed")
+            print(f"[WARN] Job callback to {url} failed: {exc}")
+
+    async def _prune(self) -> None:
+        while True:
+            await asyncio.to_thread(self.store.prune, self.ttl_seconds)
+            await asyncio.sleep(max(60.0, self.ttl_seconds / 24))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "jobs": self.store.counts(),
+        }
+
+
+@lazy
+def get_job_queue() -> JobQueue:
+    settings = get_settings()
+    return JobQueue(
+        SqliteJobStore(settings.jobs_db_path),
+        workers=settings.jobs_workers,
+        max_attempts=settings.jobs_max_attempts,
+        lease_seconds=settings.jobs_lease_seconds,
+        ttl_seconds=settings.jobs_ttl_seconds,
+        callback_timeout=settings.jobs_callback_timeout_seconds,
+    )
@@ -0,0 +1,52 @@
+import functools
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Lazy(Generic[T]):
+    """Thread-safe memoized zero-argument factory.
+
+    The factory runs on first call; concurrent callers wait for the same
+    result. Failures are not cached, so the next call retries.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._ready = False
+        functools.update_wrapper(self, factory)
+
+    def __call__(self) -> T:
+        if self._ready:
+            return self._value
+        with self._lock:
+            if not self._ready:
+                self._value = self._factory()
+                self._ready = True
+        return self._value
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def peek(self) -> Optional[T]:
+        """Return the value if it was already built, without building it."""
+        return self._value if self._ready else None
+
+    def override(self, value: T) -> None:
+        """Use ``value`` instead of calling the factory (benchmarks, tests)."""
+        with self._lock:
+            self._value = value
+            self._ready = True
+
+    def reset(self) -> None:
+        with self._lock:
+            self._value = None
+            self._ready = False
+
+
+def lazy(factory: Callable[[], T]) -> Lazy[T]:
+    return Lazy(factory)
@@ -0,0 +1,185 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Deque, Optional
+
+from app.core.config import get_settings
+from app.core.lazy import lazy
+from app.core.metrics import ADMISSIONS, record_stage
+
+# Weight of the newest sample in the average time a slot is held.
+_EWMA_ALPHA = 0.2
+
+# Monotonic time by which the current request must be answered.
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def set_deadline(seconds: float) -> None:
+    _deadline.set(time.monotonic() + seconds)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline, if it has one."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class Overloaded(Exception):
+    """A request turned away because a backend is saturated.
+
+    ``status_code`` is 429 when the queue was already full and 503 when the
+    request gave up waiting in it; ``retry_after`` is a hint in seconds.
+    """
+
+    def __init__(self, status_code: int, message: str, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded FIFO queue in front of it.
+
+    At most ``max_concurrency`` holders run at once and at most
+    ``max_queue`` wait; anyone beyond that is rejected immediately. A
+    waiter gives up after ``queue_timeout`` seconds or when the request's
+    deadline passes, whichever is first, so admitted work never sits behind
+    an unbounded backlog. Used as ``async with controller.slot():``.
+    """
+
+    def __init__(
+        self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float
+    ):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._hold: Optional[float] = None
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def retry_after(self) -> int:
+        """Rough seconds until a queued request would be admitted."""
+        ahead = self._queued() + 1
+        return max(1, math.ceil(ahead * (self._hold or 1.0) / self.max_concurrency))
+
+    def _reject(self, status_code: int, message: str) -> Overloaded:
+        if status_code == 429:
+            self.rejected += 1
+            ADMISSIONS.inc(limit=self.name, outcome="rejected")
+        else:
+            self.timed_out += 1
+            ADMISSIONS.inc(limit=self.name, outcome="timed_out")
+        return Overloaded(status_code, message, self.retry_after())
+
+    def check(self) -> None:
+        """Reject now if a request arriving at this moment could not even queue."""
+        if self._active >= self.max_concurrency and self._queued() >= self.max_queue:
+            raise self._reject(429, "Server sedang sibuk, antrean penuh.")
+
+    async def acquire(self) -> None:
+        if self._active < self.max_concurrency and not self._queued():
+            self._active += 1
+            self._admit(0.0)
+            return
+        self.check()
+        left = remaining()
+        timeout = self.queue_timeout if left is None else min(self.queue_timeout, left)
+        if timeout <= 0:
+            raise self._reject(503, "Batas waktu permintaan habis sebelum diproses.")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as exc:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on.
+                self.release()
+            if isinstance(exc, asyncio.TimeoutError):
+                raise self._reject(
+                    503, "Server sedang sibuk, waktu tunggu antrean habis."
+                ) from None
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self._admit(time.perf_counter() - started)
+
+    def _admit(self, waited: float) -> None:
+        self.admitted += 1
+        ADMISSIONS.inc(limit=self.name, outcome="admitted")
+        record_stage(f"{self.name}_queue", waited)
+
+    def release(self, held: Optional[float] = None) -> None:
+        if held is not None:
+            self._hold = (
+                held
+                if self._hold is None
+                else _EWMA_ALPHA * held + (1 - _EWMA_ALPHA) * self._hold
+            )
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Hand the slot straight to the next waiter.
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "queued": self._queued(),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_hold_ms": round(self._hold * 1000, 1) if self._hold else None,
+        }
+
+
+# Upper bound on in-flight RAG generations (embedding + TiDB + Ollama) and
+# OCR calls. Requests beyond the limit wait on the event loop, in a bounded
+# queue, instead of holding a threadpool worker.
+@lazy
+def get_rag_slots() -> AdmissionController:
+    settings = get_settings()
+    return AdmissionController(
+        "rag",
+        settings.rag_max_concurrency,
+        settings.rag_max_queue,
+        settings.admission_queue_timeout_seconds,
+    )
+
+
+@lazy
+def get_ocr_slots() -> AdmissionController:
+    settings = get_settings()
+    return AdmissionController(
+        "ocr",
+        settings.ocr_max_concurrency,
+        settings.ocr_max_queue,
+        settings.admission_queue_timeout_seconds,
+    )
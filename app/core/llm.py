@@ -1,27 +1,180 @@
-from langchain_ollama import ChatOllama, OllamaEmbeddings
-from langchain_community.vectorstores import TiDBVectorStore
+import asyncio
+from typing import List, Optional
 
-from app.core.config import settings
+from langchain_community.vectorstores import TiDBVectorStore
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
 
-embeddings = OllamaEmbeddings(
-    model=settings.ollama_embedding_model,
-    base_url=settings.ollama_base_url,
+from app.core.config import get_settings
+from app.core.db import get_engine
+from app.core.embedding_cache import CachedEmbeddings
+from app.core.lazy import lazy
+from app.core.metrics import TokenUsageHandler, stage
+from app.core.ollama_router import (
+    RoutedChatOllama,
+    RoutedOllamaEmbeddings,
+    get_chat_pool,
+    get_embedding_pool,
 )
+from app.core.replica import get_vector_replica
+from app.core.startup import retry_init
 
-vector_store = TiDBVectorStore.from_existing_vector_table(
-    embedding=embeddings,
-    connection_string=settings.tidb_conn_str,
-    table_name=settings.tidb_vector_table,
-    distance_strategy="cosine",
-)
 
-retriever = vector_store.as_retriever(
-    search_type="similarity",
-    search_kwargs={"k": 3},
-)
+@lazy
+def get_embeddings() -> CachedEmbeddings:
+    settings = get_settings()
+    embeddings = RoutedOllamaEmbeddings(
+        model=settings.ollama_embedding_model,
+        base_url=settings.ollama_embedding_urls[0],
+    )
+    embeddings._pool = get_embedding_pool()
+    return CachedEmbeddings(
+        embeddings,
+        model_name=settings.ollama_embedding_model,
+        maxsize=settings.embedding_cache_size,
+        path=settings.embedding_cache_path,
+        disk_capacity=settings.embedding_cache_disk_capacity,
+    )
 
-llm = ChatOllama(
-    model=settings.ollama_chat_model,
-    base_url=settings.ollama_base_url,
-    temperature=0,
-)
+
+def _open_vector_store() -> TiDBVectorStore:
+    settings = get_settings()
+    store = TiDBVectorStore.from_existing_vector_table(
+        embedding=get_embeddings(),
+        connection_string=settings.tidb_conn_str,
+        table_name=settings.tidb_vector_table,
+        distance_strategy="cosine",
+        # Only used for the schema checks during construction; no pool.
+        engine_args={"poolclass": NullPool},
+    )
+    # TiDBVectorClient always builds its own engine and has no hook to
+    # accept one, so swap in the shared pool once construction is done.
+    # ``_bind`` is private to tidb-vector (checked against 0.0.15, where
+    # every query opens ``Session(self._bind)``); if a release renames it,
+    # keep the client's own engine rather than break.
+    client = store.tidb_vector_client
+    if not isinstance(getattr(client, "_bind", None), Engine):
+        print(
+            "[WARN] tidb-vector client has no _bind engine; the vector store "
+            "uses its own connection pool."
+        )
+        return store
+    client._bind.dispose()
+    client._bind = get_engine()
+    return store
+
+
+@lazy
+def get_vector_store() -> TiDBVectorStore:
+    """Open the existing vector table on the shared engine.
+
+    Construction embeds a probe string and inspects the table, so it talks to
+    both Ollama and TiDB; transient failures are retried.
+    """
+    return retry_init(_open_vector_store, "Vector store init")
+
+
+def search_by_vector(
+    vector: List[float], k: int = 3, filter: Optional[dict] = None
+) -> List[Document]:
+    """Cosine search for an already-embedded query.
+
+    Served from the in-process replica when it is enabled and fresh,
+    otherwise (or if the replica fails) by TiDB. ``filter`` uses the
+    TiDBVectorClient metadata filter syntax and is applied in the query.
+    """
+    replica = get_vector_replica()
+    if replica is not None and replica.ready:
+        try:
+            with stage("replica_query"):
+                return replica.search(vector, k, filter)
+        except Exception as exc:
+            replica.record_fallback()
+            print(f"[WARN] Vector replica search failed, using TiDB: {exc}")
+    elif replica is not None:
+        replica.record_fallback()
+    client = get_vector_store().tidb_vector_client
+    with stage("vector_query"):
+        results = client.query(query_vector=vector, k=k, filter=filter)
+    return [
+        Document(
+            id=str(r.id), page_content=r.document or "", metadata=r.metadata or {}
+        )
+        for r in results
+    ]
+
+
+class ProductRetriever(BaseRetriever):
+    """Top-k similarity retriever with a non-blocking async path.
+
+    The async path embeds through the async Ollama client and only hands the
+    blocking TiDB query to a worker thread.
+    """
+
+    k: int = 3
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        with stage("embedding"):
+            vector = get_embeddings().embed_query(query)
+        return search_by_vector(vector, self.k)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager
+    ) -> List[Document]:
+        with stage("embedding"):
+            vector = await get_embeddings().aembed_query(query)
+        return await asyncio.to_thread(search_by_vector, vector, self.k)
+
+
+retriever = ProductRetriever(k=3)
+
+
+def catalogue_fingerprint() -> str:
+    """Row count and last update time of the vector table.
+
+    Changes whenever the catalogue is reloaded, so caches keyed on it stop
+    serving answers built from old candidates. Database errors propagate:
+    nothing should be keyed on a catalogue we could not read.
+    """
+    with get_engine().connect() as conn:
+        count, updated = conn.execute(
+            text(
+                "SELECT COUNT(*), MAX(update_time) "
+                f"FROM `{get_settings().tidb_vector_table}`"
+            )
+        ).one()
+    return f"{count}:{updated}"
+
+
+@lazy
+def get_llm() -> RoutedChatOllama:
+    """Chat model spread over the OLLAMA_CHAT_URLS endpoints."""
+    settings = get_settings()
+    llm = RoutedChatOllama(
+        model=settings.ollama_chat_model,
+        base_url=settings.ollama_chat_urls[0],
+        temperature=0,
+        callbacks=[TokenUsageHandler()],
+    )
+    llm._pool = get_chat_pool()
+    return llm
+
+
+async def warm_chat_model() -> None:
+    """Ask every chat endpoint to load the model so first requests skip it."""
+    model = get_settings().ollama_chat_model
+    endpoints = get_chat_pool().endpoints
+    # An empty prompt loads the model into memory without generating.
+    results = await asyncio.gather(
+        *(e.async_client.generate(model=model, prompt="") for e in endpoints),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, Exception)]
+    if len(errors) == len(results):
+        raise errors[0]
+    for endpoint, result in zip(endpoints, results):
+        if isinstance(result, Exception):
+            print(f"[WARN] Chat model warmup failed on {endpoint.url}: {result}")
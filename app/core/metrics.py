@@ -0,0 +1,318 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Seconds; spans cache hits (sub-ms) up to slow CPU generations.
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = {k: (list(c), s) for k, (c, s) in self._series.items()}
+        lines = self.header()
+        for key, (counts, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+STAGE_SECONDS = Histogram(
+    "grains_stage_duration_seconds",
+    "Time spent in each request-handling stage.",
+    ["stage"],
+)
+REQUEST_SECONDS = Histogram(
+    "grains_request_duration_seconds",
+    "HTTP request latency until the response is complete.",
+    ["method", "route", "status"],
+)
+PROMPT_TOKENS = Histogram(
+    "grains_llm_prompt_tokens",
+    "Prompt tokens per chat model call, as reported by Ollama.",
+    buckets=(64, 128, 256, 512, 768, 1024, 1536, 2048, 4096, 8192),
+)
+LLM_TOKENS = Counter(
+    "grains_llm_tokens_total",
+    "Tokens processed by the chat model.",
+    ["kind"],
+)
+OCR_RETRIES = Counter(
+    "grains_ocr_retries_total",
+    "OCR calls retried after a transient failure.",
+)
+OCR_SOURCES = Counter(
+    "grains_ocr_sources_total",
+    "Labels read by the local engine or sent to the OCR backend, and why.",
+    ["source", "reason"],
+)
+RECOMMENDATION_INDEX = Counter(
+    "grains_recommendation_index_total",
+    "Candidate lookups answered by the precomputed index, or not.",
+    ["outcome"],
+)
+RULE_OUTCOMES = Counter(
+    "grains_rule_outcomes_total",
+    "Fast-mode requests answered by the rules or passed on to the LLM.",
+    ["outcome"],
+)
+ANSWER_VALIDATIONS = Counter(
+    "grains_answer_validations_total",
+    "Generated answers by validation outcome (valid, repaired, failed).",
+    ["outcome"],
+)
+ANSWER_REPAIRS = Counter(
+    "grains_answer_repairs_total",
+    "Fixes applied to generated answers that failed validation.",
+    ["fix"],
+)
+COALESCED_CALLS = Counter(
+    "grains_single_flight_calls_total",
+    "Calls that ran the work (leader) or shared an in-flight one (follower).",
+    ["flight", "role"],
+)
+OLLAMA_REQUESTS = Counter(
+    "grains_ollama_requests_total",
+    "Calls routed to each Ollama endpoint, by outcome.",
+    ["pool", "endpoint", "outcome"],
+)
+OLLAMA_HEDGES = Counter(
+    "grains_ollama_hedges_total",
+    "Backup requests started because the first one was slow.",
+    ["pool"],
+)
+OLLAMA_EJECTIONS = Counter(
+    "grains_ollama_ejections_total",
+    "Times an Ollama endpoint was taken out of rotation.",
+    ["pool", "endpoint"],
+)
+ADMISSIONS = Counter(
+    "grains_admissions_total",
+    "Requests admitted, rejected (queue full) or timed out in a queue.",
+    ["limit", "outcome"],
+)
+ABANDONED_REQUESTS = Counter(
+    "grains_abandoned_requests_total",
+    "Requests whose work was cancelled (deadline passed or client gone).",
+    ["reason"],
+)
+JOBS = Counter(
+    "grains_jobs_total",
+    "Background jobs by kind and outcome.",
+    ["kind", "outcome"],
+)
+JOB_CALLBACKS = Counter(
+    "grains_job_callbacks_total",
+    "Job completion callbacks delivered or given up on.",
+    ["outcome"],
+)
+INIT_RETRIES = Counter(
+    "grains_init_retries_total",
+    "Startup initializers retried after a failure.",
+    ["component"],
+)
+
+# Stage durations of the current request, for the Server-Timing header.
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "request_timings", default=None
+)
+# Chat model tokens of the current request, for the X-LLM-Tokens header.
+_request_tokens: ContextVar[Optional[Dict[str, int]]] = ContextVar(
+    "request_tokens", default=None
+)
+
+
+def start_request_timings() -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def start_request_tokens() -> Dict[str, int]:
+    tokens: Dict[str, int] = {}
+    _request_tokens.set(tokens)
+    return tokens
+
+
+def record_tokens(prompt: int, completion: int) -> None:
+    PROMPT_TOKENS.observe(prompt)
+    LLM_TOKENS.inc(prompt, kind="prompt")
+    LLM_TOKENS.inc(completion, kind="completion")
+    tokens = _request_tokens.get()
+    if tokens is not None:
+        tokens["prompt"] = tokens.get("prompt", 0) + prompt
+        tokens["completion"] = tokens.get("completion", 0) + completion
+
+
+def tokens_header(tokens: Dict[str, int]) -> str:
+    return ", ".join(f"{kind}={count}" for kind, count in tokens.items())
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Add ``seconds`` to the stage histogram and the request's timings."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as stage ``name``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+    )
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Counts prompt and completion tokens reported by the chat model."""
+
+    # Only bumps counters; no need to hop to a thread from async runs.
+    run_inline = True
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if not usage:
+                    continue
+                record_tokens(
+                    usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+                )
+
+
+def family(
+    name: str, kind: str, help: str, samples: Iterable[Tuple[dict, float]]
+) -> List[str]:
+    """Render a metric computed at scrape time (e.g. from a stats dict)."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        if value is None:
+            continue
+        names = tuple(labels)
+        values = tuple(str(labels[n]) for n in names)
+        lines.append(f"{name}{_format_labels(names, values)} {_format_value(value)}")
+    return lines
+
+
+def render(extra: Iterable[List[str]] = ()) -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for block in extra:
+        lines.extend(block)
+    return "\n".join(lines) + "\n"
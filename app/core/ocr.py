@@ -0,0 +1,222 @@
+import asyncio
+import base64
+import io
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import httpx
+from mistralai import Mistral
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+
+from app.core.config import get_settings
+from app.core.lazy import lazy
+from app.core.metrics import OCR_RETRIES
+
+try:  # Local OCR is optional: needs Pillow, pytesseract and the tesseract binary.
+    import pytesseract
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - depends on the environment
+    pytesseract = None
+
+_RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+STUB_MARKDOWN = """# Teh Manis Kemasan
+
+| Informasi Nilai Gizi | |
+|---|---|
+| Takaran saji | 250 ml |
+| Energi total | 120 kkal |
+| Lemak total | 0 g |
+| Protein | 0 g |
+| Karbohidrat total | 30 g |
+| Gula | 28 g |
+| Natrium | 40 mg |
+"""
+
+
+class OcrBackend(ABC):
+    """Turns an image (as a data URL) into per-page markdown."""
+
+    name = "base"
+
+    @abstractmethod
+    async def process(self, image_url: str) -> List[str]:
+        """Markdown for each page of the image."""
+
+    async def aclose(self) -> None:
+        pass
+
+
+def _is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.TransportError):
+        return True
+    return getattr(exc, "status_code", None) in _RETRYABLE_STATUS
+
+
+class MistralOcrBackend(OcrBackend):
+    """Mistral OCR over one long-lived, pooled HTTP client.
+
+    Reusing the client keeps TLS sessions and keep-alive connections warm
+    across requests. Transient failures (transport errors, 429, 5xx) are
+    retried with jittered exponential backoff.
+    """
+
+    name = "mistral"
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        timeout_s: float,
+        connect_timeout_s: float,
+        max_connections: int,
+        retries: int,
+    ):
+        self.model = model
+        self.retries = retries
+        self.retry_count = 0
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout_s, connect=connect_timeout_s),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+        self._client = Mistral(
+            api_key=api_key,
+            async_client=self._http,
+            timeout_ms=int(timeout_s * 1000),
+        )
+
+    def _count_retry(self, retry_state) -> None:
+        self.retry_count += 1
+        OCR_RETRIES.inc()
+
+    async def process(self, image_url: str) -> List[str]:
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.retries + 1),
+            wait=wait_exponential_jitter(initial=0.5, max=8),
+            retry=retry_if_exception(_is_transient),
+            before_sleep=self._count_retry,
+            reraise=True,
+        ):
+            with attempt:
+                response = await self._client.ocr.process_async(
+                    model=self.model,
+                    document={"type": "image_url", "image_url": image_url},
+                )
+        return [page.markdown or "" for page in response.pages or []]
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+class StubOcrBackend(OcrBackend):
+    """Offline stand-in that returns canned markdown after a fixed delay."""
+
+    name = "stub"
+
+    def __init__(self, latency_s: float = 0.0, markdown: Optional[str] = None):
+        self.latency_s = latency_s
+        self.markdown = markdown or STUB_MARKDOWN
+
+    async def process(self, image_url: str) -> List[str]:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return [self.markdown]
+
+
+def _decode_data_url(image_url: str) -> bytes:
+    _, _, payload = image_url.partition(",")
+    return base64.b64decode(payload)
+
+
+class TesseractOcr:
+    """Local CPU OCR returning text lines with the engine's confidence.
+
+    Far cheaper than a Mistral round trip for the common case of a clean,
+    flat nutrition panel; callers decide from the confidence whether the
+    result is good enough. The image is grey-scaled, contrast-stretched and
+    upscaled when small, then read as one uniform block of text (``--psm
+    6``), which keeps table rows on one line.
+    """
+
+    name = "tesseract"
+
+    def __init__(self, lang: str, min_side: int = 1200):
+        self.lang = lang
+        self.min_side = min_side
+
+    def _read(self, data: bytes) -> List[Tuple[str, float]]:
+        with Image.open(io.BytesIO(data)) as img:
+            gray = ImageOps.autocontrast(ImageOps.grayscale(img))
+        short = min(gray.size)
+        if 0 < short < self.min_side:
+            scale = self.min_side / short
+            gray = gray.resize(
+                (int(gray.width * scale), int(gray.height * scale)), Image.LANCZOS
+            )
+        data = pytesseract.image_to_data(
+            gray,
+            lang=self.lang,
+            config="--psm 6",
+            output_type=pytesseract.Output.DICT,
+        )
+        lines: dict = {}
+        for i, word in enumerate(data["text"]):
+            confidence = float(data["conf"][i])
+            if not word.strip() or confidence < 0:
+                continue
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(key, []).append((word, confidence / 100))
+        return [
+            (" ".join(w for w, _ in words), sum(c for _, c in words) / len(words))
+            for _, words in sorted(lines.items())
+        ]
+
+    async def read_lines(self, image_url: str) -> List[Tuple[str, float]]:
+        return await asyncio.to_thread(self._read, _decode_data_url(image_url))
+
+
+@lazy
+def get_local_ocr() -> Optional[TesseractOcr]:
+    """The local OCR engine if ``OCR_LOCAL`` is on and it can run here."""
+    settings = get_settings()
+    if not settings.ocr_local:
+        return None
+    if pytesseract is None:
+        print("[WARN] OCR_LOCAL is set but pytesseract/Pillow are not installed")
+        return None
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception as exc:
+        print(f"[WARN] OCR_LOCAL is set but tesseract is unavailable: {exc}")
+        return None
+    return TesseractOcr(settings.ocr_local_lang)
+
+
+@lazy
+def get_ocr_backend() -> OcrBackend:
+    """Application-scoped OCR backend selected by ``OCR_BACKEND``."""
+    settings = get_settings()
+    if settings.ocr_backend == "stub":
+        markdown = None
+        if settings.ocr_stub_markdown_path:
+            markdown = Path(settings.ocr_stub_markdown_path).read_text()
+        return StubOcrBackend(settings.ocr_stub_latency_ms / 1000, markdown)
+    if settings.ocr_backend != "mistral":
+        raise RuntimeError(f"Unknown OCR_BACKEND {settings.ocr_backend!r}")
+    return MistralOcrBackend(
+        api_key=settings.mistral_api_key,
+        model=settings.ocr_model,
+        timeout_s=settings.ocr_timeout_seconds,
+        connect_timeout_s=settings.ocr_connect_timeout_seconds,
+        max_connections=settings.ocr_max_connections,
+        retries=settings.ocr_retries,
+    )
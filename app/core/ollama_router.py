@@ -0,0 +1,448 @@
+import asyncio
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, List, Optional
+
+from langchain_ollama import ChatOllama, OllamaEmbeddings
+from ollama import AsyncClient, Client
+from pydantic import PrivateAttr
+
+from app.core.config import get_settings
+from app.core.lazy import lazy
+from app.core.metrics import OLLAMA_EJECTIONS, OLLAMA_HEDGES, OLLAMA_REQUESTS
+
+# Weight of the newest sample in the per-endpoint latency average.
+_EWMA_ALPHA = 0.2
+
+
+class Endpoint:
+    """One Ollama server and its live load and health."""
+
+    def __init__(self, url: str, max_concurrency: int):
+        self.url = url.rstrip("/")
+        self.max_concurrency = max(1, max_concurrency)
+        self.client = Client(host=self.url)
+        self.async_client = AsyncClient(host=self.url)
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejected_for_seconds": (
+                round(self.ejected_until - now, 1) if self.ejected(now) else 0
+            ),
+        }
+
+
+class EndpointPool:
+    """Routes calls of one kind (chat or embedding) over Ollama endpoints.
+
+    Each call goes to the endpoint with the lowest load relative to its
+    concurrency cap, ties broken by recent latency; callers wait while
+    every endpoint is at its cap. ``eject_after`` consecutive failures take
+    an endpoint out of rotation for ``eject_seconds`` (or until a health
+    check passes). If nothing else is left, ejected endpoints are still
+    tried rather than failing outright.
+
+    Async calls are hedged: when the first attempt has produced nothing
+    after ``hedge_after`` seconds, a second one starts on another endpoint
+    with spare capacity and the first to answer wins; the other is
+    cancelled. For streams "answer" means the first chunk. An attempt that
+    fails before answering is retried on an endpoint not tried yet.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        urls: List[str],
+        max_concurrency: int,
+        eject_after: int,
+        eject_seconds: float,
+        hedge_after: float,
+    ):
+        if not urls:
+            raise RuntimeError(f"No Ollama endpoints configured for {kind}")
+        self.kind = kind
+        self.endpoints = [Endpoint(url, max_concurrency) for url in urls]
+        self.eject_after = max(1, eject_after)
+        self.eject_seconds = eject_seconds
+        self.hedge_after = hedge_after
+        self.hedges = 0
+        self._cond = threading.Condition()
+        self._waiters: List[asyncio.Future] = []
+
+    # Load accounting --------------------------------------------------
+
+    def _pick(self, exclude) -> Optional[Endpoint]:
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude]
+        live = [e for e in candidates if not e.ejected(now)]
+        free = [e for e in (live or candidates) if e.in_flight < e.max_concurrency]
+        if not free:
+            return None
+        return min(
+            free,
+            key=lambda e: (e.in_flight / e.max_concurrency, e.latency or 0.0),
+        )
+
+    def try_acquire(self, exclude=()) -> Optional[Endpoint]:
+        with self._cond:
+            endpoint = self._pick(exclude)
+            if endpoint is not None:
+                endpoint.in_flight += 1
+                endpoint.requests += 1
+            return endpoint
+
+    def acquire_sync(self, exclude=()) -> Endpoint:
+        with self._cond:
+            while True:
+                endpoint = self.try_acquire(exclude)
+                if endpoint is not None:
+                    return endpoint
+                self._cond.wait()
+
+    async def acquire(self, exclude=()) -> Endpoint:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                endpoint = self.try_acquire(exclude)
+                if endpoint is not None:
+                    return endpoint
+                waiter = loop.create_future()
+                self._waiters.append(waiter)
+            try:
+                # Re-check now and then in case a wake-up raced the wait.
+                await asyncio.wait_for(waiter, timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+
+    def release(
+        self,
+        endpoint: Endpoint,
+        seconds: Optional[float] = None,
+        error: Optional[BaseException] = None,
+        cancelled_after: Optional[float] = None,
+    ) -> None:
+        """Return a slot: ``seconds`` on success, ``error`` on failure.
+
+        A call cancelled after losing a hedge race passes ``cancelled_after``,
+        a lower bound on its latency, so a slow endpoint stops looking fast.
+        """
+        with self._cond:
+            endpoint.in_flight -= 1
+            if error is not None:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.eject_after:
+                    self._eject(endpoint)
+            elif seconds is not None:
+                endpoint.consecutive_failures = 0
+            sample = seconds if error is None and seconds is not None else cancelled_after
+            if sample is not None:
+                endpoint.latency = (
+                    sample
+                    if endpoint.latency is None
+                    else _EWMA_ALPHA * sample + (1 - _EWMA_ALPHA) * endpoint.latency
+                )
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+        outcome = "error" if error else "ok" if seconds is not None else "cancelled"
+        OLLAMA_REQUESTS.inc(pool=self.kind, endpoint=endpoint.url, outcome=outcome)
+
+    def _eject(self, endpoint: Endpoint) -> None:
+        if not endpoint.ejected(time.monotonic()):
+            OLLAMA_EJECTIONS.inc(pool=self.kind, endpoint=endpoint.url)
+            print(
+                f"[WARN] Ejecting Ollama {self.kind} endpoint {endpoint.url} "
+                f"for {self.eject_seconds:g}s after "
+                f"{endpoint.consecutive_failures} failures"
+            )
+        endpoint.ejected_until = time.monotonic() + self.eject_seconds
+
+    # Calls ------------------------------------------------------------
+
+    def call_sync(self, fn: Callable[[Endpoint], Any]) -> Any:
+        return self._run_sync(fn, stream=False)
+
+    def stream_sync(self, fn: Callable[[Endpoint], Iterator]) -> Iterator:
+        return self._run_sync(fn, stream=True)
+
+    def _run_sync(self, fn, stream: bool):
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = self.acquire_sync(tried)
+            tried.append(endpoint)
+            started = time.perf_counter()
+            try:
+                result = fn(endpoint)
+                if stream:
+                    iterator = iter(result)
+                    first = next(iterator)
+            except StopIteration:
+                self.release(endpoint, time.perf_counter() - started)
+                return iter(())
+            except Exception as exc:
+                self.release(endpoint, error=exc)
+                if len(tried) >= len(self.endpoints):
+                    raise
+                continue
+            if not stream:
+                self.release(endpoint, time.perf_counter() - started)
+                return result
+            return self._rest_sync(endpoint, started, first, iterator)
+
+    def _rest_sync(self, endpoint, started, first, iterator) -> Iterator:
+        latency = time.perf_counter() - started
+        try:
+            yield first
+            yield from iterator
+        except Exception as exc:
+            self.release(endpoint, error=exc)
+            raise
+        except BaseException:
+            self.release(endpoint)
+            raise
+        self.release(endpoint, latency)
+
+    async def _race(self, start: Callable[[Endpoint], Awaitable[Any]]):
+        """Run ``start`` on one endpoint, hedging and failing over as needed.
+
+        Returns ``(endpoint, result, seconds)`` with the winner's slot still
+        held; the caller releases it.
+        """
+        tried: List[Endpoint] = []
+        tasks = {}
+
+        async def launch(endpoint: Endpoint) -> None:
+            tried.append(endpoint)
+            began = time.perf_counter()
+            tasks[asyncio.ensure_future(start(endpoint))] = (endpoint, began)
+
+        await launch(await self.acquire())
+        hedged = False
+        last_error: Optional[BaseException] = None
+        try:
+            while tasks:
+                timeout = None
+                if not hedged and self.hedge_after > 0 and len(tasks) == 1:
+                    timeout = self.hedge_after
+                done, _ = await asyncio.wait(
+                    tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    backup = self.try_acquire(tried)
+                    if backup is not None:
+                        self.hedges += 1
+                        OLLAMA_HEDGES.inc(pool=self.kind)
+                        await launch(backup)
+                    continue
+                for task in done:
+                    endpoint, began = tasks.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        return endpoint, task.result(), time.perf_counter() - began
+                    last_error = error
+                    self.release(endpoint, error=error)
+                if not tasks and len(tried) < len(self.endpoints):
+                    await launch(await self.acquire(tried))
+            raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+            for task, (endpoint, began) in list(tasks.items()):
+                result = await asyncio.gather(task, return_exceptions=True)
+                _close(result[0])
+                self.release(
+                    endpoint, cancelled_after=time.perf_counter() - began
+                )
+
+    async def call(self, fn: Callable[[Endpoint], Awaitable[Any]]) -> Any:
+        endpoint, result, seconds = await self._race(fn)
+        self.release(endpoint, seconds)
+        return result
+
+    async def stream(
+        self, fn: Callable[[Endpoint], Awaitable[AsyncIterator]]
+    ) -> AsyncIterator:
+        async def first_chunk(endpoint: Endpoint):
+            iterator = (await fn(endpoint)).__aiter__()
+            try:
+                return iterator, await iterator.__anext__()
+            except StopAsyncIteration:
+                return iterator, _END
+
+        endpoint, (iterator, first), latency = await self._race(first_chunk)
+        try:
+            if first is not _END:
+                yield first
+                async for chunk in iterator:
+                    yield chunk
+        except Exception as exc:
+            self.release(endpoint, error=exc)
+            raise
+        except BaseException:
+            self.release(endpoint)
+            raise
+        self.release(endpoint, latency)
+
+    # Health -----------------------------------------------------------
+
+    async def check_health(self, timeout: float = 5.0) -> None:
+        """Probe every endpoint; eject the dead, reinstate the recovered."""
+
+        async def probe(endpoint: Endpoint) -> None:
+            try:
+                await asyncio.wait_for(endpoint.async_client.list(), timeout)
+            except Exception as exc:
+                with self._cond:
+                    endpoint.consecutive_failures = max(
+                        endpoint.consecutive_failures + 1, self.eject_after
+                    )
+                    self._eject(endpoint)
+                return
+            with self._cond:
+                if endpoint.ejected(time.monotonic()):
+                    print(f"[INFO] Ollama {self.kind} endpoint {endpoint.url} is back")
+                endpoint.ejected_until = 0.0
+                endpoint.consecutive_failures = 0
+
+        await asyncio.gather(*(probe(e) for e in self.endpoints))
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "hedges": self.hedges,
+                "endpoints": {e.url: e.stats() for e in self.endpoints},
+            }
+
+
+_END = object()
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def _close(value) -> None:
+    # A hedged stream that lost the race may already hold an open response.
+    if isinstance(value, tuple) and value and hasattr(value[0], "aclose"):
+        asyncio.ensure_future(value[0].aclose())
+
+
+class RoutedChatOllama(ChatOllama):
+    """ChatOllama whose requests go through an ``EndpointPool``.
+
+    Only the transport is replaced, so structured output, streaming, token
+    usage and callbacks behave exactly as with a single ``base_url``.
+    ``_create_chat_stream``, ``_acreate_chat_stream`` and ``_chat_params``
+    are langchain-ollama internals (as of 1.x, hence the pin in
+    requirements.txt); check them when upgrading.
+    """
+
+    _pool: EndpointPool = PrivateAttr()
+
+    def _create_chat_stream(self, messages, stop=None, **kwargs):
+        chat_params = self._chat_params(messages, stop, **kwargs)
+        if chat_params["stream"]:
+            yield from self._pool.stream_sync(
+                lambda e: e.client.chat(**chat_params)
+            )
+        else:
+            yield self._pool.call_sync(lambda e: e.client.chat(**chat_params))
+
+    async def _acreate_chat_stream(self, messages, stop=None, **kwargs):
+        chat_params = self._chat_params(messages, stop, **kwargs)
+        if chat_params["stream"]:
+            async for part in self._pool.stream(
+                lambda e: e.async_client.chat(**chat_params)
+            ):
+                yield part
+        else:
+            yield await self._pool.call(lambda e: e.async_client.chat(**chat_params))
+
+
+class RoutedOllamaEmbeddings(OllamaEmbeddings):
+    """OllamaEmbeddings whose requests go through an ``EndpointPool``."""
+
+    _pool: EndpointPool = PrivateAttr()
+
+    def _embed_params(self, texts: List[str]) -> dict:
+        params = {
+            "model": self.model,
+            "input": texts,
+            "options": self._default_params,
+            "keep_alive": self.keep_alive,
+        }
+        # Only newer clients know ``dimensions``; leave it out unless set.
+        dimensions = getattr(self, "dimensions", None)
+        if dimensions is not None:
+            params["dimensions"] = dimensions
+        return params
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        params = self._embed_params(texts)
+        return self._pool.call_sync(lambda e: e.client.embed(**params))["embeddings"]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        params = self._embed_params(texts)
+        response = await self._pool.call(lambda e: e.async_client.embed(**params))
+        return response["embeddings"]
+
+
+@lazy
+def get_chat_pool() -> EndpointPool:
+    settings = get_settings()
+    return EndpointPool(
+        "chat",
+        list(settings.ollama_chat_urls),
+        max_concurrency=settings.ollama_chat_endpoint_concurrency,
+        eject_after=settings.ollama_eject_after_failures,
+        eject_seconds=settings.ollama_eject_seconds,
+        hedge_after=settings.ollama_chat_hedge_ms / 1000,
+    )
+
+
+@lazy
+def get_embedding_pool() -> EndpointPool:
+    settings = get_settings()
+    return EndpointPool(
+        "embedding",
+        list(settings.ollama_embedding_urls),
+        max_concurrency=settings.ollama_embedding_endpoint_concurrency,
+        eject_after=settings.ollama_eject_after_failures,
+        eject_seconds=settings.ollama_eject_seconds,
+        hedge_after=settings.ollama_embedding_hedge_ms / 1000,
+    )
+
+
+async def keep_ollama_healthy() -> None:
+    """Background loop health-checking the Ollama endpoints every interval."""
+    interval = get_settings().ollama_health_interval_seconds
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        for pool in (get_chat_pool.peek(), get_embedding_pool.peek()):
+            if pool is not None:
+                await pool.check_health()
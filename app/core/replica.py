@@ -0,0 +1,292 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from sqlalchemy import text
+
+from app.core.config import get_settings
+from app.core.db import get_engine
+from app.core.lazy import lazy
+
+
+def _parse_vector(value) -> np.ndarray:
+    # TiDB returns VECTOR columns as their text form, e.g. "[0.1,0.2]".
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode()
+    if isinstance(value, str):
+        return np.array(json.loads(value), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def _parse_meta(value) -> dict:
+    if value is None:
+        return {}
+    if isinstance(value, (str, bytes, bytearray)):
+        return json.loads(value)
+    return dict(value)
+
+
+_COMPARISONS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def matches_filter(metadata: dict, filter: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate a TiDBVectorClient metadata filter against one row.
+
+    Same syntax as the TiDB query (``{"key": value}``, ``{"key": {"$lte":
+    x}}``, ``$and``/``$or``), and the same SQL semantics: a missing or null
+    field never matches.
+    """
+    for key, value in (filter or {}).items():
+        if key.lower() == "$and":
+            if not all(matches_filter(metadata, c) for c in value):
+                return False
+        elif key.lower() == "$or":
+            if not any(matches_filter(metadata, c) for c in value):
+                return False
+        else:
+            actual = metadata.get(key)
+            if actual is None:
+                return False
+            if isinstance(value, dict):
+                op, expected = next(iter(value.items()))
+                try:
+                    if not _COMPARISONS[op.lower()](actual, expected):
+                        return False
+                except TypeError:
+                    return False
+            elif actual != value:
+                return False
+    return True
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorReplica:
+    """In-memory copy of the vector table for in-process cosine search.
+
+    Rows are kept as one contiguous, L2-normalized float32 matrix, so a
+    top-k query is a single matrix-vector product. ``refresh`` pulls rows
+    whose ``update_time`` moved since the last sync and drops rows whose id
+    is no longer in the table. Each sync builds new arrays and swaps
+    them in, so searches never see a half-applied update.
+
+    TiDB stays the source of truth: ``ready`` turns false once the last
+    successful sync is older than ``max_staleness``, and callers then query
+    TiDB directly.
+    """
+
+    def __init__(self, table: str, max_staleness: float):
+        self.table = table
+        self.max_staleness = max_staleness
+        self._sync_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._rows: Dict[str, Tuple[np.ndarray, Document]] = {}
+        # (matrix, docs), replaced as one object so readers get a matching pair.
+        self._index: Tuple[np.ndarray, List[Document]] = (
+            np.zeros((0, 0), dtype=np.float32),
+            [],
+        )
+        self._high_water = None
+        self.synced_at: Optional[float] = None
+        self.full_loads = 0
+        self.refreshes = 0
+        self.searches = 0
+        self.fallbacks = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return (
+            self.synced_at is not None
+            and time.monotonic() - self.synced_at <= self.max_staleness
+        )
+
+    def _fetch(self, conn, since=None):
+        sql = (
+            f"SELECT id, embedding, document, meta, update_time FROM `{self.table}`"
+        )
+        if since is None:
+            return conn.execute(text(sql)).all()
+        # >= rather than >: rows written in the same second as the last
+        # high-water mark may have landed after we read it.
+        return conn.execute(
+            text(sql + " WHERE update_time >= :since"), {"since": since}
+        ).all()
+
+    def _apply(self, rows, replace: bool, ids: Optional[set] = None) -> None:
+        merged = {} if replace else dict(self._rows)
+        high_water = None if replace else self._high_water
+        for row_id, embedding, document, meta, updated in rows:
+            merged[str(row_id)] = (
+                _parse_vector(embedding),
+                Document(
+                    id=str(row_id),
+                    page_content=document or "",
+                    metadata=_parse_meta(meta),
+                ),
+            )
+            if updated is not None and (high_water is None or updated > high_water):
+                high_water = updated
+        if ids is not None:
+            merged = {row_id: row for row_id, row in merged.items() if row_id in ids}
+        if merged:
+            entries = list(merged.values())
+            matrix = _normalize(np.stack([vector for vector, _ in entries]))
+            docs = [doc for _, doc in entries]
+        else:
+            matrix, docs = np.zeros((0, 0), dtype=np.float32), []
+        self._rows = merged
+        self._index = (np.ascontiguousarray(matrix), docs)
+        self._high_water = high_water
+
+    def load(self) -> None:
+        """Replace the replica with a full copy of the table."""
+        with self._sync_lock, get_engine().connect() as conn:
+            rows = self._fetch(conn)
+            self._apply(rows, replace=True)
+            self.full_loads += 1
+            self.synced_at = time.monotonic()
+            self.last_error = None
+
+    def refresh(self) -> None:
+        """Apply rows changed since the last sync and drop deleted ones.
+
+        Deletions are found by comparing ids, not counts, so a delete plus
+        an insert between syncs is not missed. A row present in the table
+        but not picked up by ``update_time`` forces a full reload.
+        """
+        if self.synced_at is None:
+            self.load()
+            return
+        with self._sync_lock, get_engine().connect() as conn:
+            ids = {
+                str(row_id)
+                for row_id, in conn.execute(text(f"SELECT id FROM `{self.table}`"))
+            }
+            rows = self._fetch(conn, self._high_water)
+            self._apply(rows, replace=False, ids=ids)
+            if len(ids) != len(self._rows):
+                self._apply(self._fetch(conn), replace=True)
+                self.full_loads += 1
+            self.refreshes += 1
+            self.synced_at = time.monotonic()
+            self.last_error = None
+
+    @property
+    def documents(self) -> List[Document]:
+        return self._index[1]
+
+    def search(
+        self, vector: List[float], k: int, filter: Optional[dict] = None
+    ) -> List[Document]:
+        matrix, docs = self._index
+        if not docs:
+            return []
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        scores = matrix @ query
+        if filter:
+            allowed = np.fromiter(
+                (matches_filter(d.metadata, filter) for d in docs),
+                dtype=bool,
+                count=len(docs),
+            )
+            scores = np.where(allowed, scores, -np.inf)
+            k = min(k, int(allowed.sum()))
+            if not k:
+                self._count_search()
+                return []
+        k = min(k, len(docs))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        self._count_search()
+        return [docs[i] for i in top]
+
+    def _count_search(self) -> None:
+        with self._stats_lock:
+            self.searches += 1
+
+    def record_fallback(self) -> None:
+        """Count a search that went to TiDB instead (called from any thread)."""
+        with self._stats_lock:
+            self.fallbacks += 1
+
+    def stats(self) -> dict:
+        return {
+            "rows": len(self._index[1]),
+            "ready": self.ready,
+            "seconds_since_sync": (
+                round(time.monotonic() - self.synced_at, 1)
+                if self.synced_at is not None
+                else None
+            ),
+            "full_loads": self.full_loads,
+            "refreshes": self.refreshes,
+            "searches": self.searches,
+            "fallbacks": self.fallbacks,
+            "last_error": self.last_error,
+        }
+
+
+@lazy
+def get_vector_replica() -> Optional[VectorReplica]:
+    """The local replica, or None when ``VECTOR_REPLICA`` is off."""
+    settings = get_settings()
+    if not settings.vector_replica:
+        return None
+    return VectorReplica(
+        table=settings.tidb_vector_table,
+        max_staleness=settings.vector_replica_max_staleness_seconds,
+    )
+
+
+def load_catalogue() -> List[Document]:
+    """Every product row, from the replica when it is ready, else from TiDB."""
+    replica = get_vector_replica()
+    if replica is not None and replica.ready:
+        return replica.documents
+    table = get_settings().tidb_vector_table
+    with get_engine().connect() as conn:
+        rows = conn.execute(text(f"SELECT id, document, meta FROM `{table}`")).all()
+    return [
+        Document(
+            id=str(row_id), page_content=document or "", metadata=_parse_meta(meta)
+        )
+        for row_id, document, meta in rows
+    ]
+
+
+def sync_replica(replica: VectorReplica) -> None:
+    """Refresh the replica, logging instead of raising: TiDB is the fallback."""
+    try:
+        replica.refresh()
+    except Exception as exc:
+        replica.last_error = str(exc)
+        print(f"[WARN] Vector replica sync failed: {exc}")
+
+
+async def keep_replica_fresh() -> None:
+    """Background loop refreshing the replica, if enabled, every interval."""
+    replica = get_vector_replica()
+    if replica is None:
+        return
+    interval = get_settings().vector_replica_refresh_seconds
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(sync_replica, replica)
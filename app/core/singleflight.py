@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple, TypeVar
+
+from app.core.metrics import COALESCED_CALLS
+
+T = TypeVar("T")
+
+_REGISTRY: List["SingleFlight"] = []
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers
+    arriving while it is in flight wait for it and get the same result or
+    the same exception. Nothing is remembered afterwards, so this only
+    removes duplicated concurrent work; caching is a separate concern.
+
+    ``do`` is for coroutines and ``do_sync`` for blocking calls from
+    worker threads; the two keep separate in-flight tables. In ``do`` the
+    shared work runs as its own task, so a waiter being cancelled (e.g. a
+    client disconnecting) does not cancel it for the others; once the last
+    waiter has gone the task is cancelled too, so no backend keeps working
+    on a result nobody will read.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+        self._waiting: Dict[asyncio.Future, int] = {}
+        self._calls: Dict[Hashable, Tuple[threading.Event, list]] = {}
+        self.leaders = 0
+        self.followers = 0
+        _REGISTRY.append(self)
+
+    def _count(self, leader: bool) -> None:
+        with self._lock:
+            if leader:
+                self.leaders += 1
+            else:
+                self.followers += 1
+        COALESCED_CALLS.inc(flight=self.name, role="leader" if leader else "follower")
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._tasks.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+
+            def forget(done: asyncio.Future) -> None:
+                if self._tasks.get(key) is done:
+                    del self._tasks[key]
+                self._waiting.pop(done, None)
+                # Marks the exception as retrieved if every waiter went away.
+                if not done.cancelled():
+                    done.exception()
+
+            task.add_done_callback(forget)
+        self._count(leader)
+        self._waiting[task] = self._waiting.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._leave(key, task)
+
+    def _leave(self, key: Hashable, task: asyncio.Future) -> None:
+        left = self._waiting.get(task, 1) - 1
+        if left:
+            self._waiting[task] = left
+            return
+        self._waiting.pop(task, None)
+        if not task.done():
+            # Every waiter was cancelled. A caller arriving now starts afresh
+            # instead of joining the task being cancelled.
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+            task.cancel()
+
+    def do_sync(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                # [result, exception]
+                call = self._calls[key] = (threading.Event(), [None, None])
+        self._count(leader)
+        done, outcome = call
+        if not leader:
+            done.wait()
+        else:
+            try:
+                outcome[0] = fn()
+            except BaseException as exc:
+                outcome[1] = exc
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                done.set()
+        if outcome[1] is not None:
+            raise outcome[1]
+        return outcome[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": len(self._tasks) + len(self._calls),
+                "leaders": self.leaders,
+                "followers": self.followers,
+            }
+
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    return {flight.name: flight.stats() for flight in _REGISTRY}
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from app.core.config import get_settings
+from app.core.metrics import INIT_RETRIES
+
+T = TypeVar("T")
+
+# Taken at import of the application package, i.e. as early as we can see.
+PROCESS_STARTED = time.perf_counter()
+
+
+def _retry_policy(what: str) -> dict:
+    def _log(retry_state) -> None:
+        exc = retry_state.outcome.exception()
+        INIT_RETRIES.inc(component=what)
+        print(
+            f"[WARN] {what} failed (attempt {retry_state.attempt_number}): {exc}"
+        )
+
+    return {
+        "stop": stop_after_attempt(get_settings().startup_retries),
+        "wait": wait_exponential(multiplier=0.5, max=8),
+        "before_sleep": _log,
+        "reraise": True,
+    }
+
+
+def retry_init(fn: Callable[[], T], what: str) -> T:
+    """Run a blocking initializer, retrying transient failures with backoff."""
+    for attempt in Retrying(**_retry_policy(what)):
+        with attempt:
+            return fn()
+
+
+async def aretry_init(fn: Callable[[], Awaitable[T]], what: str) -> T:
+    """Async counterpart of ``retry_init``."""
+    async for attempt in AsyncRetrying(**_retry_policy(what)):
+        with attempt:
+            return await fn()
+
+
+class StartupTracker:
+    """Records warmup progress for the /ready endpoint."""
+
+    def __init__(self):
+        self.components: Dict[str, dict] = {}
+        self.ready = False
+        self.failed = False
+        self.startup_seconds: Optional[float] = None
+
+    async def run(self, name: str, step: Callable[[], Awaitable[object]]) -> None:
+        started = time.perf_counter()
+        self.components[name] = {"status": "starting"}
+        try:
+            await step()
+        except Exception as exc:
+            self.components[name] = {
+                "status": "failed",
+                "error": str(exc),
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+            raise
+        self.components[name] = {
+            "status": "ready",
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+    async def warmup(self, steps: Dict[str, Callable[[], Awaitable[object]]]) -> None:
+        """Run all warmup steps in parallel and record time-to-ready.
+
+        Steps that still fail after their own retries are run again every
+        WARMUP_RETRY_SECONDS, so /ready recovers once e.g. TiDB is back
+        instead of staying 503 until the process restarts.
+        """
+        pending = dict(steps)
+        while True:
+            results = await asyncio.gather(
+                *(self.run(name, step) for name, step in pending.items()),
+                return_exceptions=True,
+            )
+            pending = {
+                name: steps[name]
+                for name, result in zip(list(pending), results)
+                if isinstance(result, BaseException)
+            }
+            if not pending:
+                break
+            retry_seconds = get_settings().warmup_retry_seconds
+            if not self.failed:
+                self.failed = True
+                self.startup_seconds = round(time.perf_counter() - PROCESS_STARTED, 3)
+                print(
+                    f"[ERROR] Warmup failed after {self.startup_seconds}s: "
+                    f"{self.components}"
+                )
+            print(
+                f"[WARN] Retrying warmup of {', '.join(pending)} in {retry_seconds}s"
+            )
+            await asyncio.sleep(retry_seconds)
+        self.startup_seconds = round(time.perf_counter() - PROCESS_STARTED, 3)
+        self.failed = False
+        self.ready = True
+        print(f"[INFO] Ready in {self.startup_seconds}s: {self.components}")
+
+    def snapshot(self) -> dict:
+        if self.ready:
+            status = "ready"
+        elif self.failed:
+            status = "failed"
+        else:
+            status = "starting"
+        return {
+            "status": status,
+            "startup_seconds": self.startup_seconds,
+            "components": self.components,
+        }
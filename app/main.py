@@ -1,12 +1,101 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
+from app.api.admission import (
+    ClientDisconnected,
+    DeadlineExceeded,
+    deadline_handler,
+    disconnect_handler,
+    overloaded_handler,
+)
+from app.api.middleware import TimingMiddleware
+from app.api.routes_jobs import router as jobs_router
 from app.api.routes_manual import router as manual_router
 from app.api.routes_misc import router as misc_router
 from app.api.routes_ocr import router as ocr_router
-from app.core import db
+from app.core.db import get_engine, verify_connection
+from app.core.jobs import get_job_queue
+from app.core.limits import Overloaded
+from app.core.llm import get_embeddings, get_vector_store, warm_chat_model
+from app.core.ocr import get_ocr_backend
+from app.core.ollama_router import keep_ollama_healthy
+from app.core.replica import get_vector_replica, keep_replica_fresh, sync_replica
+from app.core.startup import StartupTracker, aretry_init
+from app.rag.pipeline import (
+    get_answer_cache,
+    get_generation_chain,
+    keep_answer_cache_fresh,
+)
+
+
+def _warm_database() -> None:
+    verify_connection()
+    # Fingerprints the vector table, so it needs a working connection. Also
+    # loads the recommendation index, which is checked against it.
+    get_answer_cache()
+
+
+async def _warm_vector_replica() -> None:
+    replica = get_vector_replica()
+    if replica is not None:
+        # Never fails the warmup; retrieval uses TiDB until a sync succeeds.
+        await asyncio.to_thread(sync_replica, replica)
+
+
+async def _warm_chat_model() -> None:
+    get_generation_chain()
+    await aretry_init(warm_chat_model, "Chat model warmup")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tracker = StartupTracker()
+    app.state.startup = tracker
+    # Warm up in the background so uvicorn accepts connections (and answers
+    # /health) immediately; /ready flips to 200 once every step is done.
+    warmup = asyncio.create_task(
+        tracker.warmup(
+            {
+                "tidb": lambda: asyncio.to_thread(_warm_database),
+                "vector_store": lambda: asyncio.to_thread(get_vector_store),
+                "chat_model": _warm_chat_model,
+                "vector_replica": _warm_vector_replica,
+            }
+        )
+    )
+    refresher = asyncio.create_task(keep_replica_fresh())
+    cache_refresher = asyncio.create_task(keep_answer_cache_fresh())
+    health_checks = asyncio.create_task(keep_ollama_healthy())
+    # Also picks up jobs a previous process accepted but did not finish.
+    get_job_queue().start()
+    try:
+        yield
+    finally:
+        warmup.cancel()
+        refresher.cancel()
+        cache_refresher.cancel()
+        health_checks.cancel()
+        await get_job_queue().aclose()
+        ocr_backend = get_ocr_backend.peek()
+        if ocr_backend is not None:
+            await ocr_backend.aclose()
+        embeddings = get_embeddings.peek()
+        if embeddings is not None:
+            embeddings.close()
+        engine = get_engine.peek()
+        if engine is not None:
+            engine.dispose()
+
 
-app = FastAPI(title="RAG API with User Profile")
+app = FastAPI(title="RAG API with User Profile", lifespan=lifespan)
+app.add_middleware(TimingMiddleware)
+app.add_exception_handler(Overloaded, overloaded_handler)
+app.add_exception_handler(DeadlineExceeded, deadline_handler)
+app.add_exception_handler(ClientDisconnected, disconnect_handler)
 
 app.include_router(misc_router)
 app.include_router(manual_router)
 app.include_router(ocr_router)
+app.include_router(jobs_router)
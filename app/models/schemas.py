@@ -9,6 +9,9 @@ from pydantic import (
 )
 
 
+NO_ALTERNATIVE_SUMMARY = "Tidak ada alternatif yang sesuai."
+
+
 class StrictModel(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
@@ -95,7 +98,7 @@ class RagAnswer(StrictModel):
     @model_validator(mode="after")
     def _validate_logic(self):
         if not self.recommendations:
-            if self.summary.strip() != "Tidak ada alternatif yang sesuai.":
+            if self.summary.strip() != NO_ALTERNATIVE_SUMMARY:
                 raise ValueError(
                     "Jika tidak ada rekomendasi, summary harus "
                     '"Tidak ada alternatif yang sesuai."'
@@ -108,7 +111,7 @@ class RagAnswer(StrictModel):
             raise ValueError(
                 "Rank rekomendasi harus berurutan mulai dari 1."
             )
-        if self.summary.strip() == "Tidak ada alternatif yang sesuai.":
+        if self.summary.strip() == NO_ALTERNATIVE_SUMMARY:
             raise ValueError(
                 "Summary tidak boleh menyatakan tidak ada alternatif "
                 "jika rekomendasi tersedia."
@@ -140,6 +143,18 @@ class ManualSearchResponse(BaseModel):
     product_profile: str
 
 
+class ManualBatchItemResult(BaseModel):
+    index: int
+    status: Literal["ok", "error"]
+    result: Optional[ManualSearchResponse] = None
+    error: Optional[str] = None
+
+
+class ManualBatchResponse(BaseModel):
+    status: Literal["ok", "partial", "error"]
+    results: List[ManualBatchItemResult]
+
+
 class OcrSearchRequest(BaseModel):
     image_base64: Optional[str] = None
     image_path: Optional[str] = None
@@ -154,3 +169,18 @@ class OcrSearchResponse(BaseModel):
     used_query: str
     user_profile: str
     product_profile: str
+    # "local" when read on this server, "backend" for the OCR service,
+    # "mixed" when several photos were read by both.
+    ocr_source: Optional[str] = None
+
+
+class JobStatusResponse(BaseModel):
+    id: str
+    kind: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    attempts: int
+    created_at: float
+    updated_at: float
+    # ManualSearchResponse or OcrSearchResponse once the job succeeded.
+    result: Optional[dict] = None
+    error: Optional[str] = None
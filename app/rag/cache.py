@@ -0,0 +1,170 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+from app.core.cache import TTLCache
+from app.models.schemas import RagAnswer
+
+CACHE_KEY_FIELDS = ("search_query", "user_query", "user_profile", "product_profile")
+
+
+def normalize_text(value) -> str:
+    """Collapse whitespace and case so cosmetic differences share a key."""
+    if value is None:
+        return ""
+    return " ".join(str(value).split()).casefold()
+
+
+def canonical_key(inputs: dict) -> str:
+    """Hash the resolved chain inputs into a stable cache key."""
+    payload = json.dumps(
+        [normalize_text(inputs.get(name)) for name in CACHE_KEY_FIELDS],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def build_namespace(parts: Iterable[str]) -> str:
+    """Fingerprint everything that makes a cached answer stale when it changes."""
+    joined = "\x1f".join(str(part) for part in parts)
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()[:16]
+
+
+class SqliteAnswerStore:
+    """Optional on-disk tier shared by all workers on the same host."""
+
+    def __init__(self, path: str, namespace: str):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rag_answers ("
+                " key TEXT PRIMARY KEY,"
+                " namespace TEXT NOT NULL,"
+                " answer TEXT NOT NULL,"
+                " expires_at REAL"
+                ")"
+            )
+            # Answers produced against another vector table, model or prompt
+            # are never valid again.
+            self._conn.execute(
+                "DELETE FROM rag_answers WHERE namespace != ?", (namespace,)
+            )
+        self.purge_expired()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, expires_at FROM rag_answers"
+                " WHERE key = ? AND namespace = ?",
+                (key, self.namespace),
+            ).fetchone()
+        if row is None:
+            return None
+        answer, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return answer
+
+    def set(self, key: str, answer: str, ttl: Optional[float]) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rag_answers (key, namespace, answer, expires_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, self.namespace, answer, expires_at),
+            )
+
+    def purge_expired(self) -> int:
+        """Delete rows past their TTL; ``get`` only skips them."""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM rag_answers WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM rag_answers")
+
+
+class AnswerCache:
+    """Two-tier cache of validated ``RagAnswer`` objects.
+
+    The in-process tier is a bounded LRU with TTL. The optional SQLite tier
+    survives restarts and is shared between workers; hits there are promoted
+    to memory. Keys are scoped by ``namespace`` so a different vector table,
+    model or prompt never serves old answers.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        maxsize: int,
+        ttl: Optional[float],
+        sqlite_path: Optional[str] = None,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._disk = (
+            SqliteAnswerStore(sqlite_path, namespace) if sqlite_path else None
+        )
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @property
+    def disk_enabled(self) -> bool:
+        return self._disk is not None
+
+    def key_for(self, inputs: dict) -> str:
+        return f"{self.namespace}:{canonical_key(inputs)}"
+
+    def get(self, key: str) -> Optional[RagAnswer]:
+        answer = self._memory.get(key)
+        if answer is not None:
+            return answer
+        if self._disk is not None:
+            raw = self._disk.get(key)
+            if raw is not None:
+                answer = RagAnswer.model_validate_json(raw)
+                self._memory.set(key, answer)
+                self.disk_hits += 1
+                return answer
+        self.misses += 1
+        return None
+
+    def set(self, key: str, answer: RagAnswer) -> None:
+        self._memory.set(key, answer)
+        if self._disk is not None:
+            self._disk.set(key, answer.model_dump_json(), self.ttl)
+        self.stores += 1
+
+    def purge_expired(self) -> int:
+        return self._disk.purge_expired() if self._disk is not None else 0
+
+    def invalidate(self) -> None:
+        self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self) -> dict:
+        memory = self._memory.stats()
+        lookups = memory["hits"] + self.disk_hits + self.misses
+        hits = memory["hits"] + self.disk_hits
+        return {
+            "namespace": self.namespace,
+            "memory": memory,
+            "disk_enabled": self.disk_enabled,
+            "disk_hits": self.disk_hits,
+            "hits": hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,174 @@
+import re
+from typing import List, Optional
+
+from app.services.rules import product_type_of
+
+# Rough size of a token for Indonesian/English text with numbers; only used
+# to keep prompts under a budget, not for billing.
+CHARS_PER_TOKEN = 4
+
+_NUTRITION_HINTS = (
+    "nilai gizi", "nutrition", "takaran saji", "sajian", "serving", "porsi",
+    "energi", "energy", "kalori", "lemak", "fat", "protein", "karbohidrat",
+    "carbohydrate", "gula", "sugar", "natrium", "sodium", "garam", "salt",
+    "serat", "fiber", "kolesterol", "cholesterol", "akg", "komposisi",
+    "ingredients", "bahan", "alergen", "allergen", "mengandung", "contains",
+)
+_TABLE_RULE = re.compile(r"^\|?[\s:|-]*-{2,}[\s:|-]*$")
+_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_SPACES = re.compile(r"\s+")
+_WORD = re.compile(r"[^\W_]+")
+
+
+def estimate_tokens(value: str) -> int:
+    return -(-len(value) // CHARS_PER_TOKEN)
+
+
+def _truncate(value: str, max_chars: int) -> str:
+    if len(value) <= max_chars:
+        return value
+    cut = value[: max(0, max_chars - 1)].rsplit(" ", 1)[0]
+    return cut.rstrip(" ,;") + "…"
+
+
+def _clean_line(line: str) -> str:
+    line = _SPACES.sub(" ", _IMAGE.sub("", line)).strip()
+    if line.startswith("|"):
+        cells = [cell.strip() for cell in line.strip("|").split("|")]
+        while len(cells) > 1 and not cells[-1]:
+            cells.pop()
+        line = "| " + " | ".join(cells) + " |"
+    return line
+
+
+def _has_hint(line: str) -> bool:
+    lowered = line.lower()
+    return any(hint in lowered for hint in _NUTRITION_HINTS)
+
+
+def compact_ocr_markdown(markdown: str, max_tokens: int) -> str:
+    """Cut OCR markdown down to the nutrition-relevant part.
+
+    Keeps the first heading (usually the product name), every table that
+    mentions a nutrient and other lines mentioning nutrition, composition
+    or allergens. Drops images, table rules, empty cells and repeated lines
+    (multi-page OCR often repeats the panel), then trims to ``max_tokens``,
+    cutting the line that overflows so at least one line is always kept.
+    Falls back to the de-duplicated text when nothing looks nutritional.
+    """
+    lines: List[str] = []
+    seen = set()
+    for raw in markdown.splitlines():
+        line = _clean_line(raw)
+        if not line or _TABLE_RULE.match(line) or line == "| |":
+            continue
+        key = " ".join(_WORD.findall(line.lower()))
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+
+    kept: List[str] = []
+    table: List[str] = []
+
+    def flush() -> None:
+        if any(_has_hint(row) for row in table):
+            kept.extend(table)
+        table.clear()
+
+    title_kept = False
+    for line in lines:
+        if line.startswith("|"):
+            table.append(line)
+            continue
+        flush()
+        if line.startswith("#") and not title_kept:
+            kept.append(line)
+            title_kept = True
+        elif _has_hint(line):
+            kept.append(line)
+    flush()
+    if len(kept) <= int(title_kept):
+        kept = lines
+
+    budget = max_tokens * CHARS_PER_TOKEN
+    out: List[str] = []
+    used = 0
+    for line in kept:
+        if used + len(line) + 1 > budget:
+            # Cut the overflowing line instead of dropping it, so a single
+            # long OCR line still yields something to work with.
+            remaining = budget - used - 1
+            if remaining > 1 or not out:
+                out.append(_truncate(line, max(remaining, 1)))
+            break
+        out.append(line)
+        used += len(line) + 1
+    return "\n".join(out)
+
+
+def _fmt(value, unit: str) -> Optional[str]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return f"{round(number, 2):g} {unit}"
+
+
+_CANDIDATE_FIELDS = (
+    ("Gula", "sugars_g_100g", "g"),
+    ("Na", "sodium_mg_100g", "mg"),
+    ("Lemak jenuh", "fat_sat_g_100g", "g"),
+    ("Serat", "fiber_g_100g", "g"),
+    ("Protein", "protein_g_100g", "g"),
+)
+
+
+def format_candidate(doc, text_chars: int) -> str:
+    """One compact line per candidate; unknown values are left out."""
+    m = doc.metadata
+    brand = str(m.get("brand_name") or "?")
+    head = [str(m.get("category") or "?")]
+    if m.get("serving_size_raw"):
+        head.append(f"porsi {m['serving_size_raw']}")
+    basis = "100 mL" if product_type_of(m) == "minuman" else "100 g"
+    values = []
+    for label, field, unit in _CANDIDATE_FIELDS:
+        formatted = _fmt(m.get(field), unit)
+        if formatted is not None:
+            values.append(f"{label} {formatted}")
+    line = f"- {brand} ({', '.join(head)})"
+    if values:
+        line += f" per {basis}: " + ", ".join(values)
+    allergens = m.get("allergens")
+    if allergens:
+        line += f"; Alergen: {allergens}"
+    # Only add the document text when it says more than the metadata line.
+    text = _SPACES.sub(" ", doc.page_content or "").strip()
+    known = set(_WORD.findall(line.lower())) | {"makanan", "minuman"}
+    if text_chars > 0 and set(_WORD.findall(text.lower())) - known:
+        line += f"\n  teks: {_truncate(text, text_chars)}"
+    return line
+
+
+def build_candidate_context(docs, max_tokens: int, text_chars: int) -> str:
+    """Candidate lines in retrieval order, one per brand, within ``max_tokens``.
+
+    The first candidate is always included so the model has something to
+    compare against even with a tiny budget.
+    """
+    out: List[str] = []
+    seen = set()
+    used = 0
+    for doc in docs:
+        brand = str(doc.metadata.get("brand_name") or "").strip().lower()
+        if brand and brand in seen:
+            continue
+        seen.add(brand)
+        line = format_candidate(doc, text_chars)
+        cost = estimate_tokens(line)
+        if out and used + cost > max_tokens:
+            break
+        out.append(line)
+        used += cost
+    return "\n".join(out)
@@ -1,8 +1,28 @@
-from langchain_core.runnables import RunnableLambda
+import asyncio
+import time
+from typing import AsyncIterator, List, Optional, Tuple, Union
 
-from app.core.llm import llm, retriever
-from app.models.schemas import RagAnswer
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from pydantic import ValidationError
+
+from app.core.config import get_settings
+from app.core.lazy import lazy
+from app.core.limits import get_rag_slots
+from app.core.llm import catalogue_fingerprint, get_embeddings, get_llm
+from app.core.metrics import RULE_OUTCOMES, record_stage, stage
+from app.core.singleflight import SingleFlight
+from app.models.schemas import ProductAssessment, RagAnswer, Recommendation
+from app.rag.cache import AnswerCache, build_namespace
+from app.rag.context import build_candidate_context
 from app.rag.prompt import PROMPT
+from app.rag.repair import arepair_answer, repair_answer
+from app.rag.recommendations import get_recommendation_index
+from app.rag.retrieval import (
+    aretrieve,
+    indexed_candidates,
+    retrieve,
+    search_candidates,
+)
 from app.services.nutrition import (
     build_product_profile,
     build_search_query,
@@ -10,42 +30,38 @@ from app.services.nutrition import (
     build_user_query,
     get_attribute,
 )
+from app.services.rules import assess_product, rule_answer
 
 
-def fmt(value, unit: str = "", nd: int = 2):
-    """Format numeric nutrition values for prompt readability."""
-    try:
-        number = float(value)
-        if abs(number - round(number)) < 1e-9:
-            return f"{int(round(number))}{unit}"
-        return f"{round(number, nd)}{unit}"
-    except Exception:
-        return "n/a"
+def format_docs(docs):
+    """Compact, token-budgeted context lines for the retrieved docs."""
+    settings = get_settings()
+    return build_candidate_context(
+        docs,
+        max_tokens=settings.context_max_tokens,
+        text_chars=settings.context_doc_chars,
+    )
 
 
-def format_docs(docs):
-    """Summarize retrieved docs into short, readable context snippets."""
-    out = []
-    for d in docs:
-        m = d.metadata
-        out.append(
-            f"- {m.get('brand_name', '?')} "
-            f"({m.get('category','?')}, porsi {m.get('serving_size_raw','?')}) "
-            f"Na={fmt(m.get('sodium_mg_100g'),' mg/100g')}, "
-            f"Gula={fmt(m.get('sugars_g_100g'),' g/100g')}, "
-            f"Serat={fmt(m.get('fiber_g_100g'),' g/100g')}, "
-            f"Protein={fmt(m.get('protein_g_100g'),' g/100g')}, "
-            f"Lemak Jenuh={fmt(m.get('fat_sat_g_100g'),' g/100g')}; "
-            f"Alergen={m.get('allergens')}.\n"
-            f"  teks: {d.page_content}"
-        )
-    return "\n".join(out)
+CANDIDATE_FIELDS = (
+    "brand_name",
+    "category",
+    "serving_size_raw",
+    "sodium_mg_100g",
+    "sugars_g_100g",
+    "fiber_g_100g",
+    "protein_g_100g",
+    "fat_sat_g_100g",
+    "allergens",
+)
 
 
-def coerce_answer(value):
-    if isinstance(value, RagAnswer):
-        return value
-    return RagAnswer.model_validate(value)
+def summarize_candidates(docs) -> List[dict]:
+    """The metadata ``format_docs`` shows the LLM, as plain dicts."""
+    return [
+        {name: d.metadata.get(name) for name in CANDIDATE_FIELDS}
+        for d in docs
+    ]
 
 
 def resolve_user_profile(inputs: dict) -> str:
@@ -80,19 +96,429 @@ def resolve_search_query(inputs: dict) -> str:
     return build_search_query(product_name, facts)
 
 
-structured_llm = llm.with_structured_output(
-    schema=RagAnswer.model_json_schema(),
-    method="json_schema",
-)
+@lazy
+def get_structured_llm():
+    return get_llm().with_structured_output(
+        schema=RagAnswer.model_json_schema(),
+        method="json_schema",
+    )
+
+
+@lazy
+def get_raw_structured_llm():
+    """Like ``get_structured_llm`` but keeps the raw message when parsing fails."""
+    return get_llm().with_structured_output(
+        schema=RagAnswer.model_json_schema(),
+        method="json_schema",
+        include_raw=True,
+    )
+
+
+def _repair(inputs: dict) -> RagAnswer:
+    return repair_answer(inputs["raw"], inputs)
+
+
+async def _arepair(inputs: dict) -> RagAnswer:
+    return await arepair_answer(inputs["raw"], inputs)
+
+
+def _timed(name: str, runnable):
+    """Wrap ``runnable`` so each call is recorded as stage ``name``."""
+
+    def run(value, config=None):
+        with stage(name):
+            return runnable.invoke(value, config=config)
+
+    async def arun(value, config=None):
+        with stage(name):
+            return await runnable.ainvoke(value, config=config)
+
+    return RunnableLambda(run, afunc=arun, name=name)
+
+
+@lazy
+def get_answer_chain():
+    """Generation only: prompt + structured LLM + validation and repair.
+
+    Expects the retrieved ``context`` alongside the three request strings.
+    Shared by the single and batch paths.
+    """
+    return RunnablePassthrough.assign(
+        raw=_timed("prompt", PROMPT) | _timed("llm", get_raw_structured_llm())
+    ) | RunnableLambda(_repair, afunc=_arepair, name="repair")
 
-rag_chain = (
-    {
-        "context": resolve_search_query | retriever | format_docs,
+
+@lazy
+def get_generation_chain():
+    return {
+        "context": RunnableLambda(retrieve, afunc=aretrieve, name="retrieve")
+        | format_docs,
         "user_query": resolve_user_query,
         "product_profile": resolve_product_profile,
         "user_profile": resolve_user_profile,
+    } | get_answer_chain()
+
+
+def _answer_namespace(fingerprint: str) -> str:
+    settings = get_settings()
+    index = get_recommendation_index()
+    return build_namespace(
+        [
+            settings.tidb_vector_table,
+            fingerprint,
+            settings.ollama_embedding_model,
+            settings.ollama_chat_model,
+            settings.retrieval_mode,
+            f"context:{settings.context_max_tokens}:{settings.context_doc_chars}",
+            f"recommendations:{index.built_at if index else 'off'}",
+            PROMPT.pretty_repr(),
+        ]
+    )
+
+
+@lazy
+def get_answer_cache() -> AnswerCache:
+    # Raises while TiDB is unreachable; the next call tries again.
+    settings = get_settings()
+    return AnswerCache(
+        namespace=_answer_namespace(catalogue_fingerprint()),
+        maxsize=settings.answer_cache_size,
+        ttl=settings.answer_cache_ttl_seconds,
+        sqlite_path=settings.answer_cache_path,
+    )
+
+
+def refresh_answer_cache() -> None:
+    """Start a new answer cache if the catalogue changed since it was built.
+
+    The recommendation index is reloaded and checked against the new
+    catalogue too. Also purges expired on-disk answers. Blocking: queries
+    TiDB.
+    """
+    cache = get_answer_cache.peek()
+    if cache is None:
+        return
+    cache.purge_expired()
+    fingerprint = catalogue_fingerprint()
+    if _answer_namespace(fingerprint) == cache.namespace:
+        return
+    print(f"[INFO] Catalogue changed ({fingerprint}); starting a new answer cache")
+    get_recommendation_index.reset()
+    get_answer_cache.reset()
+    get_answer_cache()
+
+
+async def keep_answer_cache_fresh() -> None:
+    """Background loop running ``refresh_answer_cache`` every replica interval."""
+    interval = get_settings().vector_replica_refresh_seconds
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(refresh_answer_cache)
+        except Exception as exc:
+            print(f"[WARN] Answer cache refresh failed: {exc}")
+
+
+def resolve_inputs(inputs: dict) -> dict:
+    """Reduce raw or pre-built inputs to the four strings the prompt sees."""
+    return {
+        "search_query": resolve_search_query(inputs),
+        "user_query": resolve_user_query(inputs),
+        "user_profile": resolve_user_profile(inputs),
+        "product_profile": resolve_product_profile(inputs),
     }
-    | PROMPT
-    | structured_llm
-    | RunnableLambda(coerce_answer)
-)
+
+
+async def _aget_answer_cache() -> AnswerCache:
+    # Building the cache queries TiDB; normally warmup has done it already.
+    cache = get_answer_cache.peek()
+    if cache is None:
+        cache = await asyncio.to_thread(get_answer_cache)
+    return cache
+
+
+async def _acache_get(key: str):
+    cache = await _aget_answer_cache()
+    with stage("answer_cache"):
+        # The SQLite tier does file I/O; keep it off the event loop.
+        if cache.disk_enabled:
+            return await asyncio.to_thread(cache.get, key)
+        return cache.get(key)
+
+
+async def _acache_set(key: str, answer: RagAnswer) -> None:
+    cache = await _aget_answer_cache()
+    if cache.disk_enabled:
+        await asyncio.to_thread(cache.set, key, answer)
+    else:
+        cache.set(key, answer)
+
+
+# Identical requests arriving together share one generation.
+answer_flight = SingleFlight("answer")
+
+
+def _invoke_cached(inputs: dict, config=None) -> RagAnswer:
+    cache = get_answer_cache()
+    resolved = resolve_inputs(inputs)
+    key = cache.key_for(resolved)
+    with stage("answer_cache"):
+        answer = cache.get(key)
+    if answer is None:
+
+        def generate() -> RagAnswer:
+            generated = get_generation_chain().invoke(resolved, config=config)
+            cache.set(key, generated)
+            return generated
+
+        answer = answer_flight.do_sync(key, generate)
+    return answer
+
+
+async def _ainvoke_cached(inputs: dict, config=None) -> RagAnswer:
+    resolved = resolve_inputs(inputs)
+    key = (await _aget_answer_cache()).key_for(resolved)
+    answer = await _acache_get(key)
+    if answer is None:
+
+        async def generate() -> RagAnswer:
+            generated = await get_generation_chain().ainvoke(resolved, config=config)
+            await _acache_set(key, generated)
+            return generated
+
+        answer = await answer_flight.do(key, generate)
+    return answer
+
+
+rag_chain = RunnableLambda(_invoke_cached, afunc=_ainvoke_cached, name="rag_chain")
+
+
+async def afast_rag(inputs: dict) -> RagAnswer:
+    """Answer from the deterministic rules, calling the LLM only if needed.
+
+    When the rules reach a verdict on the original product, candidates are
+    retrieved and ranked by their per-100 g/mL metadata and no model is
+    called. Otherwise the request goes through ``rag_chain`` unchanged,
+    answer cache included.
+    """
+    resolved = resolve_inputs(inputs)
+    assessed = assess_product(resolved)
+    if not assessed.conclusive:
+        RULE_OUTCOMES.inc(outcome="llm")
+        return await rag_chain.ainvoke(resolved)
+
+    docs = await aretrieve(resolved)
+    with stage("rules"):
+        answer = rule_answer(resolved, docs, assessed)
+    RULE_OUTCOMES.inc(outcome="rules")
+    return answer
+
+
+async def aanswer(inputs: dict, mode: Optional[str] = None) -> RagAnswer:
+    """Answer one request in ``mode`` (``llm`` or ``fast``), default ANSWER_MODE."""
+    if (mode or get_settings().answer_mode) == "fast":
+        return await afast_rag(inputs)
+    return await rag_chain.ainvoke(inputs)
+
+
+async def abatch_rag(
+    inputs_list: List[dict], max_concurrency: int
+) -> List[Union[RagAnswer, Exception]]:
+    """Answer many requests with one embedding call and batched generation.
+
+    Cache hits are served directly and identical requests are generated
+    once. Catalogue products found in the recommendation index skip
+    retrieval; the remaining search queries are embedded in a single
+    ``embed_documents`` call and their TiDB lookups run concurrently. At
+    most ``max_concurrency`` generations run at once, each under a RAG
+    admission slot. Each slot of the result holds either the answer or the
+    exception for that item (``Overloaded`` when its slot was refused).
+    """
+    resolved = [resolve_inputs(inputs) for inputs in inputs_list]
+    cache = await _aget_answer_cache()
+    keys = [cache.key_for(r) for r in resolved]
+    results: List[Union[RagAnswer, Exception, None]] = [
+        await _acache_get(key) for key in keys
+    ]
+
+    pending: dict = {}
+    for index, key in enumerate(keys):
+        if results[index] is None:
+            pending.setdefault(key, index)
+    if not pending:
+        return results
+
+    outcomes: dict = {}
+    contexts = {}
+    owners = []
+    for index in pending.values():
+        docs = indexed_candidates(resolved[index])
+        if docs is not None:
+            contexts[index] = format_docs(docs)
+        else:
+            owners.append(index)
+    vectors: Optional[list] = []
+    if owners:
+        try:
+            with stage("embedding"):
+                vectors = await get_embeddings().aembed_documents(
+                    [resolved[i]["search_query"] for i in owners]
+                )
+        except Exception as exc:
+            vectors = None
+            for index in owners:
+                outcomes[index] = exc
+
+    if vectors:
+        docs_per_item = await asyncio.gather(
+            *(
+                asyncio.to_thread(search_candidates, resolved[index], vector)
+                for index, vector in zip(owners, vectors)
+            ),
+            return_exceptions=True,
+        )
+        for index, docs in zip(owners, docs_per_item):
+            if isinstance(docs, Exception):
+                outcomes[index] = docs
+            else:
+                contexts[index] = format_docs(docs)
+
+    chain = get_answer_chain()
+    running = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def agenerate(index: int) -> RagAnswer:
+        # Each generation holds a RAG slot like a single request does, so a
+        # batch cannot run more of them than RAG_MAX_CONCURRENCY allows.
+        async with running, get_rag_slots().slot():
+            return await chain.ainvoke({**resolved[index], "context": contexts[index]})
+
+    generate = list(contexts)
+    answers = await asyncio.gather(
+        *(agenerate(index) for index in generate), return_exceptions=True
+    )
+    for index, answer in zip(generate, answers):
+        outcomes[index] = answer
+        if isinstance(answer, RagAnswer):
+            await _acache_set(keys[index], answer)
+
+    for index, key in enumerate(keys):
+        if results[index] is None:
+            results[index] = outcomes[pending[key]]
+    return results
+
+
+def _streamable(item, candidates: set, seen: set, rank: int) -> Optional[dict]:
+    """A finished recommendation as the final answer will hold it, or None.
+
+    Follows ``normalize_answer`` (one item per brand + category, ranks
+    from 1) and holds back items that fail the schema or name a product
+    that was not retrieved; those are left to repair and the ``answer``.
+    """
+    if not isinstance(item, dict):
+        return None
+    brand = str(item.get("brand") or "").strip().lower()
+    key = (brand, str(item.get("category") or "").strip().lower())
+    if brand not in candidates or key in seen:
+        return None
+    try:
+        recommendation = Recommendation.model_validate({**item, "rank": rank})
+    except ValidationError:
+        return None
+    seen.add(key)
+    return recommendation.model_dump(mode="json")
+
+
+def _finished(partial: dict, key: str) -> bool:
+    """True once the model has moved past ``key`` in a partial JSON object."""
+    keys = list(partial)
+    return key in keys and keys[-1] != key
+
+
+async def _astream_llm(prompt_value) -> AsyncIterator[object]:
+    # Times generation only, not the consumer's work between chunks.
+    stream = get_structured_llm().astream(prompt_value)
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield chunk
+    finally:
+        record_stage("llm", elapsed)
+
+
+async def astream_rag(inputs: dict) -> AsyncIterator[Tuple[str, object]]:
+    """Run the RAG chain step by step, yielding ``(event, payload)`` pairs.
+
+    Emits ``candidates`` as soon as retrieval finishes, then each
+    ``product_assessment`` / ``recommendation`` piece once the model has
+    finished writing it and it passes the schema (recommendations must
+    also name a retrieved candidate), and finally ``answer`` with the
+    validated ``RagAnswer``. If repair changed what was streamed, a
+    ``replace`` event with the final assessment and recommendations comes
+    right before ``answer``. A cache hit yields ``answer`` immediately.
+    """
+    resolved = resolve_inputs(inputs)
+    key = (await _aget_answer_cache()).key_for(resolved)
+    cached = await _acache_get(key)
+    if cached is not None:
+        yield "answer", cached
+        return
+
+    docs = await aretrieve(resolved)
+    yield "candidates", summarize_candidates(docs)
+
+    context = format_docs(docs)
+    with stage("prompt"):
+        prompt_value = await PROMPT.ainvoke({**resolved, "context": context})
+    candidates = {
+        str(d.metadata.get("brand_name") or "").strip().lower() for d in docs
+    }
+    partial: dict = {}
+    assessment_done = False
+    assessment: Optional[dict] = None
+    read = 0
+    sent: List[dict] = []
+    seen: set = set()
+    async for chunk in _astream_llm(prompt_value):
+        if not isinstance(chunk, dict):
+            continue
+        partial = chunk
+        if not assessment_done and _finished(partial, "product_assessment"):
+            assessment_done = True
+            try:
+                assessment = ProductAssessment.model_validate(
+                    partial["product_assessment"]
+                ).model_dump(mode="json")
+            except ValidationError:
+                pass
+            else:
+                yield "product_assessment", assessment
+        recommendations = partial.get("recommendations") or []
+        complete = len(recommendations)
+        if not _finished(partial, "recommendations"):
+            # The last item may still be mid-generation.
+            complete -= 1
+        while read < complete:
+            item = _streamable(recommendations[read], candidates, seen, len(sent) + 1)
+            read += 1
+            if item is not None:
+                sent.append(item)
+                yield "recommendation", item
+
+    answer = await arepair_answer(partial, {**resolved, "context": context})
+    await _acache_set(key, answer)
+    final = {
+        "product_assessment": answer.product_assessment.model_dump(mode="json"),
+        "recommendations": [r.model_dump(mode="json") for r in answer.recommendations],
+    }
+    if assessment not in (None, final["product_assessment"]) or (
+        sent and sent != final["recommendations"]
+    ):
+        yield "replace", final
+    yield "answer", answer
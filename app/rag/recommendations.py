@@ -0,0 +1,233 @@
+"""Precomputed healthier alternatives per product category and condition.
+
+The catalogue only changes when it is reloaded, and for a given category
+and set of limited nutrients the ranking of alternatives is the same for
+every request. ``python -m app.rag.recommendations --output index.json``
+ranks them once; with RECOMMENDATION_INDEX_PATH pointing at the file,
+requests about a product that is in the catalogue take their candidates
+from it instead of embedding the search query and searching the vectors.
+"""
+
+import argparse
+import json
+import time
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from langchain_core.documents import Document
+
+from app.core.config import get_settings
+from app.core.lazy import lazy
+from app.core.llm import catalogue_fingerprint
+from app.core.metrics import RECOMMENDATION_INDEX
+from app.core.replica import load_catalogue, matches_filter
+from app.services.rules import (
+    LIMITED,
+    NUTRIENTS,
+    Nutrient,
+    derive_filter,
+    health_text,
+    healthier_score,
+    product_type_of,
+    relevant_nutrients,
+)
+
+# Candidates kept per entry. Allergens, product type and the product itself
+# are filtered per request, so keep more than the prompt's k.
+TOP_N = 20
+_TEXT_CHARS = 400
+
+# What the answer path reads from a candidate: format_docs, rank_candidates
+# and CandidateFilter.
+_KEPT_FIELDS = (
+    "brand_name",
+    "category",
+    "product_type",
+    "serving_size_raw",
+    "allergens",
+) + tuple(n.field for n in NUTRIENTS)
+
+
+def _name(metadata: dict) -> str:
+    return str(metadata.get("brand_name") or "").strip().lower()
+
+
+def _category(metadata: dict) -> str:
+    return str(metadata.get("category") or "").strip().lower()
+
+
+def _entry_key(category: str, nutrients: Iterable[Nutrient]) -> str:
+    return category + "|" + "+".join(sorted(n.field for n in nutrients))
+
+
+def _compact(doc: Document) -> dict:
+    m = doc.metadata
+    return {
+        "id": doc.id,
+        "text": doc.page_content[:_TEXT_CHARS],
+        "metadata": {name: m[name] for name in _KEPT_FIELDS if name in m},
+    }
+
+
+def _rank(docs: List[Document], nutrients: Iterable[Nutrient]) -> List[Document]:
+    scored = []
+    seen = set()
+    for doc in docs:
+        name = _name(doc.metadata)
+        if not name or name in seen:
+            continue
+        basis = product_type_of(doc.metadata) or "makanan"
+        score = healthier_score(doc.metadata, nutrients, basis)
+        if score is None:
+            continue
+        seen.add(name)
+        scored.append((score, name, doc))
+    scored.sort(key=lambda item: item[:2])
+    return [doc for _, _, doc in scored]
+
+
+def build_index(docs: List[Document], fingerprint: str, top_n: int = TOP_N) -> dict:
+    """Rank each category's products for every combination of limited nutrients.
+
+    Uses the same score and exclusions as ``rank_candidates``: products
+    high in any limited nutrient or missing a compared value are left out.
+    A request without a recognised condition is compared on all of them.
+    """
+    products: Dict[str, str] = {}
+    by_category: Dict[str, List[Document]] = {}
+    for doc in docs:
+        name, category = _name(doc.metadata), _category(doc.metadata)
+        if not name or not category:
+            continue
+        products.setdefault(name, category)
+        by_category.setdefault(category, []).append(doc)
+
+    entries: Dict[str, List[dict]] = {}
+    for category, members in by_category.items():
+        for size in range(1, len(LIMITED) + 1):
+            for nutrients in combinations(LIMITED, size):
+                ranked = _rank(members, nutrients)[:top_n]
+                if ranked:
+                    entries[_entry_key(category, nutrients)] = [
+                        _compact(doc) for doc in ranked
+                    ]
+    return {
+        "fingerprint": fingerprint,
+        "built_at": time.time(),
+        "products": products,
+        "entries": entries,
+    }
+
+
+class RecommendationIndex:
+    """Lookup side of ``build_index``, loaded once per process."""
+
+    def __init__(self, data: dict):
+        self.fingerprint: str = data["fingerprint"]
+        self.built_at: float = data["built_at"]
+        self.products: Dict[str, str] = data["products"]
+        self.entries: Dict[str, List[Document]] = {
+            key: [
+                Document(id=e["id"], page_content=e["text"], metadata=e["metadata"])
+                for e in docs
+            ]
+            for key, docs in data["entries"].items()
+        }
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_file(cls, path: str) -> "RecommendationIndex":
+        return cls(json.loads(Path(path).read_text()))
+
+    def _candidates(self, resolved: dict, k: int) -> Optional[List[Document]]:
+        constraints = derive_filter(resolved)
+        category = next(
+            (self.products[n] for n in constraints.exclude_names if n in self.products),
+            None,
+        )
+        if category is None:
+            return None
+        nutrients = relevant_nutrients(health_text(resolved)) or LIMITED
+        ranked = self.entries.get(_entry_key(category, nutrients), [])
+        metadata_filter = constraints.metadata_filter()
+        docs = [
+            doc
+            for doc in ranked
+            if constraints.accepts(doc.metadata)
+            and matches_filter(doc.metadata, metadata_filter)
+        ]
+        # None left: the vector search may still find some in other categories.
+        return docs[:k] or None
+
+    def lookup(self, resolved: dict, k: int) -> Optional[List[Document]]:
+        """The top ``k`` alternatives for a catalogue product, or None.
+
+        The product is recognised by its "Produk:" name in the product
+        profile. Unknown products, and entries with no candidate left
+        after the request's filters, are misses.
+        """
+        docs = self._candidates(resolved, k)
+        if docs is None:
+            self.misses += 1
+            RECOMMENDATION_INDEX.inc(outcome="miss")
+        else:
+            self.hits += 1
+            RECOMMENDATION_INDEX.inc(outcome="hit")
+        return docs
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "products": len(self.products),
+            "entries": len(self.entries),
+            "built_at": self.built_at,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+@lazy
+def get_recommendation_index() -> Optional[RecommendationIndex]:
+    """The index at RECOMMENDATION_INDEX_PATH, or None when unset or stale."""
+    path = get_settings().recommendation_index_path
+    if not path:
+        return None
+    try:
+        index = RecommendationIndex.from_file(path)
+    except (OSError, ValueError, KeyError) as exc:
+        print(f"[WARN] Recommendation index {path} not loaded: {exc}")
+        return None
+    current = catalogue_fingerprint()
+    if index.fingerprint != current:
+        print(
+            f"[WARN] Recommendation index {path} was built for catalogue "
+            f"{index.fingerprint}, not {current}; rebuild it. Not used."
+        )
+        return None
+    print(f"[INFO] Recommendation index: {len(index.entries)} entries")
+    return index
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Precompute the recommendation index from the vector table."
+    )
+    parser.add_argument("--output", required=True, help="JSON file to write")
+    parser.add_argument("--top-n", type=int, default=TOP_N)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    docs = load_catalogue()
+    data = build_index(docs, catalogue_fingerprint(), args.top_n)
+    Path(args.output).write_text(json.dumps(data, ensure_ascii=False))
+    print(
+        f"[INFO] Wrote {len(data['entries'])} entries for {len(data['products'])} "
+        f"products to {args.output} in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
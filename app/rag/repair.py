@@ -0,0 +1,303 @@
+import asyncio
+import json
+from typing import Any, List, Optional, Tuple, Type
+
+from langchain_core.messages import BaseMessage
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, ValidationError
+
+from app.core.config import get_settings
+from app.core.llm import get_llm
+from app.core.metrics import ANSWER_REPAIRS, ANSWER_VALIDATIONS, stage
+from app.models.schemas import (
+    NO_ALTERNATIVE_SUMMARY,
+    ProductAssessment,
+    RagAnswer,
+    Recommendation,
+    StrictModel,
+)
+from app.services.parsing import extract_json_from_llm
+
+REPAIR_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            """You repair one field of a nutrition assistant's JSON answer.
+
+Return only the corrected value of that field as JSON matching the schema.
+Fix exactly what the validation errors report and keep everything else.
+All text must stay in Bahasa Indonesia (except brand or product names).
+Do not fabricate nutrition values; use null when the context has none.""",
+        ),
+        (
+            "human",
+            """Field: {field}
+
+Current value:
+{value}
+
+Validation errors:
+{errors}
+
+Full answer:
+{answer}
+
+Product Data:
+{product_profile}
+
+Candidate Product Context:
+{context}""",
+        ),
+    ]
+)
+
+
+class _SummaryPiece(StrictModel):
+    summary: str
+
+
+class _RecommendationsPiece(StrictModel):
+    recommendations: List[Recommendation]
+
+
+# A piece is a path into the answer: () for all of it, ("summary",),
+# ("product_assessment",), ("recommendations",) or ("recommendations", i).
+Piece = Tuple[Any, ...]
+
+
+def _piece_model(piece: Piece) -> Type[BaseModel]:
+    if not piece:
+        return RagAnswer
+    if piece[0] == "product_assessment":
+        return ProductAssessment
+    if piece[0] == "recommendations":
+        return Recommendation if len(piece) > 1 else _RecommendationsPiece
+    return _SummaryPiece
+
+
+def _unwrap(value) -> Tuple[Any, List[str]]:
+    """The answer payload from structured output, raw message or text."""
+    fixes = []
+    if isinstance(value, dict) and {"raw", "parsed", "parsing_error"} <= set(value):
+        # with_structured_output(include_raw=True): fall back to the raw text.
+        if value["parsed"] is not None:
+            value = value["parsed"]
+        else:
+            value = value["raw"]
+    if isinstance(value, BaseMessage):
+        value = value.content
+    if isinstance(value, str):
+        value = json.loads(extract_json_from_llm(value))
+        fixes.append("parsed_text")
+    if isinstance(value, BaseModel):
+        value = value.model_dump()
+    return value, fixes
+
+
+def normalize_answer(payload: dict) -> List[str]:
+    """Apply the deterministic fixes in place and return their names.
+
+    Drops unknown top-level keys and duplicate brand + category entries,
+    renumbers ranks from 1 and sets the exact empty-result summary when
+    there are no recommendations.
+    """
+    fixes = []
+    extra = [key for key in payload if key not in RagAnswer.model_fields]
+    for key in extra:
+        del payload[key]
+    if extra:
+        fixes.append("extra_fields")
+
+    recommendations = payload.get("recommendations")
+    if recommendations is None:
+        recommendations = payload["recommendations"] = []
+    if isinstance(recommendations, list):
+        unique, seen = [], set()
+        for rec in recommendations:
+            if isinstance(rec, dict):
+                key = (
+                    str(rec.get("brand") or "").strip().lower(),
+                    str(rec.get("category") or "").strip().lower(),
+                )
+                if key in seen:
+                    continue
+                seen.add(key)
+            unique.append(rec)
+        if len(unique) != len(recommendations):
+            fixes.append("dedupe")
+        renumbered = False
+        for rank, rec in enumerate(unique, start=1):
+            if isinstance(rec, dict) and rec.get("rank") != rank:
+                rec["rank"] = rank
+                renumbered = True
+        if renumbered:
+            fixes.append("ranks")
+        payload["recommendations"] = recommendations = unique
+
+    if not recommendations and payload.get("summary") != NO_ALTERNATIVE_SUMMARY:
+        payload["summary"] = NO_ALTERNATIVE_SUMMARY
+        fixes.append("summary")
+    return fixes
+
+
+def failing_pieces(exc: ValidationError) -> List[Piece]:
+    """The smallest parts of the answer the validation errors point at."""
+    pieces: List[Piece] = []
+    for error in exc.errors():
+        loc = tuple(error["loc"])
+        if not loc:
+            # Model-level checks; after normalize_answer only the rule that
+            # a non-empty result needs a real summary can still fail.
+            piece = ("summary",)
+        elif loc[0] == "recommendations" and len(loc) > 1 and isinstance(loc[1], int):
+            piece = loc[:2]
+        else:
+            piece = loc[:1]
+        if piece not in pieces:
+            pieces.append(piece)
+    return pieces
+
+
+def _current(payload: Optional[dict], piece: Piece):
+    value = payload
+    for part in piece:
+        try:
+            value = value[part]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return value
+
+
+def _repair_inputs(piece: Piece, payload, error: Exception, inputs: dict) -> dict:
+    value = _current(payload, piece) if payload is not None else None
+    return {
+        "field": ".".join(str(part) for part in piece) or "(seluruh jawaban)",
+        "value": json.dumps(value, ensure_ascii=False, default=str),
+        "errors": str(error),
+        "answer": json.dumps(payload, ensure_ascii=False, default=str),
+        "product_profile": inputs.get("product_profile", ""),
+        "context": inputs.get("context", ""),
+    }
+
+
+def _repair_chain(piece: Piece):
+    model = _piece_model(piece)
+    return REPAIR_PROMPT | get_llm().with_structured_output(
+        schema=model.model_json_schema(), method="json_schema"
+    )
+
+
+def _apply(payload: Optional[dict], piece: Piece, fixed) -> dict:
+    fixed, _ = _unwrap(fixed)
+    if not piece:
+        return fixed
+    if _piece_model(piece) in (_SummaryPiece, _RecommendationsPiece):
+        fixed = fixed[piece[0]]
+    if len(piece) == 1:
+        payload[piece[0]] = fixed
+    else:
+        payload[piece[0]][piece[1]] = fixed
+    return payload
+
+
+def _record(fixes: List[str]) -> None:
+    if not fixes:
+        ANSWER_VALIDATIONS.inc(outcome="valid")
+        return
+    ANSWER_VALIDATIONS.inc(outcome="repaired")
+    for fix in dict.fromkeys(fixes):
+        ANSWER_REPAIRS.inc(fix=fix)
+
+
+def _check(value, fixes: List[str]):
+    """(answer, None) when valid after the deterministic fixes, else
+    (payload, error) with payload None if the output was not JSON at all."""
+    try:
+        payload, unwrapped = _unwrap(value)
+    except ValueError as exc:
+        return None, exc
+    fixes.extend(unwrapped)
+    if not isinstance(payload, dict):
+        return None, ValueError(f"Output model bukan objek JSON: {payload!r}")
+    fixes.extend(normalize_answer(payload))
+    try:
+        return RagAnswer.model_validate(payload), None
+    except ValidationError as exc:
+        return payload, exc
+
+
+def _pieces_for(payload, error: Exception) -> List[Piece]:
+    if payload is None or not isinstance(error, ValidationError):
+        return [()]
+    return failing_pieces(error)
+
+
+def repair_answer(value, inputs: dict) -> RagAnswer:
+    """Validate the structured LLM output, repairing it where possible.
+
+    Deterministic fixes come first (see ``normalize_answer``); whatever
+    still fails validation is re-prompted piece by piece, for at most
+    ``ANSWER_REPAIR_ATTEMPTS`` rounds. Raises the last validation error if
+    the answer is still invalid after that.
+    """
+    if isinstance(value, RagAnswer):
+        return value
+    fixes: List[str] = []
+    with stage("repair"):
+        result, error = _check(value, fixes)
+        attempts = get_settings().answer_repair_attempts
+        while error is not None and attempts > 0:
+            attempts -= 1
+            fixes.append("reprompt")
+            payload = result
+            for piece in _pieces_for(payload, error):
+                try:
+                    fixed = _repair_chain(piece).invoke(
+                        _repair_inputs(piece, payload, error, inputs)
+                    )
+                    payload = _apply(payload, piece, fixed)
+                except Exception as exc:
+                    print(f"[WARN] Answer repair of {piece or 'answer'} failed: {exc}")
+            result, error = _check(payload, fixes)
+    if error is not None:
+        ANSWER_VALIDATIONS.inc(outcome="failed")
+        raise error
+    _record(fixes)
+    return result
+
+
+async def arepair_answer(value, inputs: dict) -> RagAnswer:
+    """Async ``repair_answer``; the pieces of one round are re-prompted concurrently."""
+    if isinstance(value, RagAnswer):
+        return value
+    fixes: List[str] = []
+    with stage("repair"):
+        result, error = _check(value, fixes)
+        attempts = get_settings().answer_repair_attempts
+        while error is not None and attempts > 0:
+            attempts -= 1
+            fixes.append("reprompt")
+            payload = result
+            pieces = _pieces_for(payload, error)
+            outcomes = await asyncio.gather(
+                *(
+                    _repair_chain(piece).ainvoke(
+                        _repair_inputs(piece, payload, error, inputs)
+                    )
+                    for piece in pieces
+                ),
+                return_exceptions=True,
+            )
+            for piece, fixed in zip(pieces, outcomes):
+                try:
+                    if isinstance(fixed, Exception):
+                        raise fixed
+                    payload = _apply(payload, piece, fixed)
+                except Exception as exc:
+                    print(f"[WARN] Answer repair of {piece or 'answer'} failed: {exc}")
+            result, error = _check(payload, fixes)
+    if error is not None:
+        ANSWER_VALIDATIONS.inc(outcome="failed")
+        raise error
+    _record(fixes)
+    return result
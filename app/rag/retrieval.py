@@ -0,0 +1,186 @@
+import asyncio
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from app.core.config import get_settings
+from app.core.lazy import lazy
+from app.core.llm import get_embeddings, retriever, search_by_vector
+from app.core.metrics import stage
+from app.core.replica import load_catalogue, matches_filter
+from app.rag.recommendations import get_recommendation_index
+from app.services.rules import derive_filter
+
+_TOKEN = re.compile(r"[^\W\d_]{2,}")
+
+# Search-query noise: nutrition labels and units carry no product signal.
+_STOPWORDS = frozenset(
+    "dan atau per dengan yang untuk total energi lemak jenuh gula natrium "
+    "garam protein serat karbohidrat kkal kcal mg ml gram takaran saji "
+    "informasi nilai gizi sajian".split()
+)
+
+RRF_K = 60
+MAX_FETCH_K = 200
+
+
+def _tokens(value: str) -> List[str]:
+    return [t for t in _TOKEN.findall(value.lower()) if t not in _STOPWORDS]
+
+
+class KeywordIndex:
+    """Okapi BM25 over product names, categories and documents."""
+
+    def __init__(self, docs: List[Document], k1: float = 1.2, b: float = 0.75):
+        self.docs = docs
+        self.k1 = k1
+        self.b = b
+        self.built_at = time.monotonic()
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        for index, doc in enumerate(docs):
+            m = doc.metadata
+            terms = _tokens(
+                f"{m.get('brand_name', '')} {m.get('category', '')} {doc.page_content}"
+            )
+            self._lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                self._postings.setdefault(term, []).append((index, count))
+        self._avg_length = (sum(self._lengths) / len(docs) if docs else 0.0) or 1.0
+
+    def search(self, query: str, k: int, accept=None) -> List[Document]:
+        scores: Dict[int, float] = {}
+        n = len(self.docs)
+        for term in set(_tokens(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, count in postings:
+                norm = 1 - self.b + self.b * self._lengths[index] / self._avg_length
+                scores[index] = scores.get(index, 0.0) + idf * (
+                    count * (self.k1 + 1) / (count + self.k1 * norm)
+                )
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        hits = []
+        for index in ranked:
+            doc = self.docs[index]
+            if accept is None or accept(doc.metadata):
+                hits.append(doc)
+                if len(hits) == k:
+                    break
+        return hits
+
+
+_keyword_lock = threading.Lock()
+
+
+@lazy
+def get_keyword_index() -> KeywordIndex:
+    return KeywordIndex(load_catalogue())
+
+
+def _fresh_keyword_index() -> KeywordIndex:
+    # Rebuilt on the replica's refresh interval so new products show up.
+    index = get_keyword_index()
+    max_age = get_settings().vector_replica_refresh_seconds
+    if time.monotonic() - index.built_at > max_age and _keyword_lock.acquire(False):
+        try:
+            get_keyword_index.override(KeywordIndex(load_catalogue()))
+        finally:
+            _keyword_lock.release()
+    return get_keyword_index()
+
+
+def _doc_key(doc: Document) -> str:
+    return doc.id or f"{doc.metadata.get('brand_name')}|{doc.page_content}"
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int) -> List[Document]:
+    """Merge ranked lists by summed 1 / (60 + rank), one entry per product."""
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = _doc_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank)
+    fused: List[Document] = []
+    seen_names = set()
+    for key in sorted(scores, key=scores.get, reverse=True):
+        name = str(docs[key].metadata.get("brand_name") or key).strip().lower()
+        if name in seen_names:
+            continue
+        seen_names.add(name)
+        fused.append(docs[key])
+        if len(fused) == k:
+            break
+    return fused
+
+
+def hybrid_search(resolved: dict, vector: List[float], k: int) -> List[Document]:
+    """Filtered vector search fused with BM25 over product names."""
+    settings = get_settings()
+    constraints = derive_filter(resolved)
+    metadata_filter = constraints.metadata_filter()
+    fetch_k = max(k, settings.hybrid_fetch_k)
+    while True:
+        rows = search_by_vector(vector, fetch_k, metadata_filter)
+        dense = [doc for doc in rows if constraints.accepts(doc.metadata)]
+        # Widen the search when the row-level checks rejected too much.
+        if len(dense) >= k or len(rows) < fetch_k or fetch_k >= MAX_FETCH_K:
+            break
+        fetch_k = min(fetch_k * 4, MAX_FETCH_K)
+
+    def accept(metadata: dict) -> bool:
+        return matches_filter(metadata, metadata_filter) and constraints.accepts(
+            metadata
+        )
+
+    with stage("keyword_search"):
+        sparse = _fresh_keyword_index().search(
+            resolved["search_query"], fetch_k, accept
+        )
+    return reciprocal_rank_fusion([dense, sparse], k)
+
+
+def search_candidates(resolved: dict, vector: List[float]) -> List[Document]:
+    """Retrieve candidates for an already-embedded request (blocking)."""
+    if get_settings().retrieval_mode == "hybrid":
+        return hybrid_search(resolved, vector, retriever.k)
+    return search_by_vector(vector, retriever.k)
+
+
+def indexed_candidates(resolved: dict) -> Optional[List[Document]]:
+    """Precomputed candidates for a catalogue product, if the index has them."""
+    index = get_recommendation_index()
+    if index is None:
+        return None
+    with stage("recommendation_index"):
+        return index.lookup(resolved, retriever.k)
+
+
+def retrieve(resolved: dict) -> List[Document]:
+    docs = indexed_candidates(resolved)
+    if docs is not None:
+        return docs
+    with stage("embedding"):
+        vector = get_embeddings().embed_query(resolved["search_query"])
+    return search_candidates(resolved, vector)
+
+
+async def aretrieve(resolved: dict) -> List[Document]:
+    # Loading the index fingerprints the vector table; warmup normally has.
+    if not get_recommendation_index.ready:
+        await asyncio.to_thread(get_recommendation_index)
+    docs = indexed_candidates(resolved)
+    if docs is not None:
+        return docs
+    with stage("embedding"):
+        vector = await get_embeddings().aembed_query(resolved["search_query"])
+    return await asyncio.to_thread(search_candidates, resolved, vector)
@@ -0,0 +1,290 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class FactKind:
+    """A nutrient as printed on Indonesian/English labels.
+
+    ``key`` is the vector table's per-100 g/mL field where it has one;
+    amounts are converted to ``unit``. ``synonyms`` are matched as whole
+    words (an optional plural "s" included).
+    """
+
+    key: str
+    label: str
+    unit: str
+    synonyms: Tuple[str, ...]
+
+
+ENERGY = FactKind(
+    key="energy_kcal_100g",
+    label="Energi total",
+    unit="kkal",
+    synonyms=("energi", "energy", "kalori", "calorie"),
+)
+FAT = FactKind(
+    key="fat_g_100g",
+    label="Lemak total",
+    unit="g",
+    synonyms=("lemak", "fat"),
+)
+SAT_FAT = FactKind(
+    key="fat_sat_g_100g",
+    label="Lemak jenuh",
+    unit="g",
+    synonyms=("lemak jenuh", "saturated fat", "saturated"),
+)
+TRANS_FAT = FactKind(
+    key="fat_trans_g_100g",
+    label="Lemak trans",
+    unit="g",
+    synonyms=("lemak trans", "trans fat", "trans"),
+)
+CHOLESTEROL = FactKind(
+    key="cholesterol_mg_100g",
+    label="Kolesterol",
+    unit="mg",
+    synonyms=("kolesterol", "cholesterol"),
+)
+PROTEIN = FactKind(
+    key="protein_g_100g",
+    label="Protein",
+    unit="g",
+    synonyms=("protein",),
+)
+CARBS = FactKind(
+    key="carbohydrates_g_100g",
+    label="Karbohidrat total",
+    unit="g",
+    synonyms=("karbohidrat", "carbohydrate"),
+)
+SUGAR = FactKind(
+    key="sugars_g_100g",
+    label="Gula",
+    unit="g",
+    synonyms=("gula", "sugar"),
+)
+FIBER = FactKind(
+    key="fiber_g_100g",
+    label="Serat pangan",
+    unit="g",
+    synonyms=("serat", "fiber", "fibre"),
+)
+SODIUM = FactKind(
+    key="sodium_mg_100g",
+    label="Natrium",
+    unit="mg",
+    synonyms=("natrium", "sodium"),
+)
+SALT = FactKind(
+    key="salt_g_100g",
+    label="Garam",
+    unit="g",
+    synonyms=("garam", "salt"),
+)
+
+# Panel order, used to sort facts so reordered inputs normalize the same.
+FACT_KINDS = (
+    ENERGY, FAT, SAT_FAT, TRANS_FAT, CHOLESTEROL, PROTEIN, CARBS, SUGAR, FIBER,
+    SODIUM, SALT,
+)
+# Most specific first so "lemak jenuh" is not read as total fat.
+_MATCH_ORDER = tuple(
+    (
+        kind,
+        re.compile(
+            r"\b(?:" + "|".join(re.escape(s) for s in kind.synonyms) + r")s?\b"
+        ),
+    )
+    for kind in (
+        ENERGY, SAT_FAT, TRANS_FAT, FAT, CHOLESTEROL, PROTEIN, FIBER, SUGAR, CARBS,
+        SODIUM, SALT,
+    )
+)
+# Sub-rows of a nutrient ("Energi dari lemak", "Gula tambahan", "Lemak tidak
+# jenuh tunggal", "Polyunsaturated fat", ...) are facts of their own, not
+# the nutrient itself; they are kept as ``other:`` facts.
+_SUB_ROW = re.compile(
+    r"\b(?:dari|from|tambahan|added|tidak jenuh|tak jenuh|unsaturated"
+    r"|monounsaturated|polyunsaturated|alkohol|alcohols?|larut|soluble"
+    r"|insoluble)\b"
+)
+# Anything but letters separates words: "Lemak jenuh/Saturated fat (g)".
+_NON_LETTERS = re.compile(r"[\W\d_]+")
+_RANK = {kind.key: rank for rank, kind in enumerate(FACT_KINDS)}
+
+_VALUE = re.compile(
+    r"(<\s*)?(\d+(?:[.,]\d+)?)\s*"
+    r"(%|(?:mcg|µg|ug|mg|kg|kkal|kcal|kal|kj|gram|gr|g|ml|liter|l)(?![^\W_]))?",
+    re.IGNORECASE,
+)
+_GRAMS = {
+    "kg": 1000.0, "gram": 1.0, "gr": 1.0, "g": 1.0, "mg": 1e-3, "mcg": 1e-6,
+    "µg": 1e-6, "ug": 1e-6,
+}
+_KCAL = {"kkal": 1.0, "kcal": 1.0, "kal": 1.0, "kj": 1 / 4.184}
+_PORTION_UNITS = {
+    "ml": ("ml", 1.0), "l": ("ml", 1000.0), "liter": ("ml", 1000.0),
+    "g": ("g", 1.0), "gr": ("g", 1.0), "gram": ("g", 1.0), "kg": ("g", 1000.0),
+}
+
+
+def _clean(value) -> str:
+    return " ".join(str(value or "").split())
+
+
+def _round(value: float) -> float:
+    # Enough for label values; drops float noise like 0.30000000000000004.
+    return round(value, 3)
+
+
+@lru_cache(maxsize=1024)
+def fact_kind(label: str) -> Optional[FactKind]:
+    """The nutrient a label (or a whole label line) names, if any."""
+    words = _NON_LETTERS.sub(" ", label.lower())
+    if _SUB_ROW.search(words):
+        return None
+    for kind, pattern in _MATCH_ORDER:
+        if pattern.search(words):
+            return kind
+    return None
+
+
+def _convert(number: float, unit: str, kind: FactKind) -> Optional[float]:
+    if not unit:
+        return number
+    if kind.unit == "kkal":
+        factor = _KCAL.get(unit)
+        return number * factor if factor is not None else None
+    grams = _GRAMS.get(unit)
+    return number * grams / _GRAMS[kind.unit] if grams is not None else None
+
+
+@dataclass(frozen=True)
+class NormalizedFact:
+    """One nutrition fact in canonical form.
+
+    ``amount`` is per serving in ``unit``. A value given only as % AKG
+    keeps ``percent``; one that could not be read keeps ``text``.
+    Unrecognised labels get an ``other:`` key and no unit.
+    """
+
+    key: str
+    label: str
+    unit: str = ""
+    amount: Optional[float] = None
+    less_than: bool = False
+    percent: Optional[float] = None
+    text: str = ""
+
+    def value(self) -> str:
+        if self.amount is not None:
+            value = f"{self.amount:g} {self.unit}".strip()
+            return f"< {value}" if self.less_than else value
+        if self.percent is not None:
+            return f"{self.percent:g}% AKG"
+        return self.text
+
+
+@lru_cache(maxsize=8192)
+def normalize_fact(label: str, value: str) -> Optional[NormalizedFact]:
+    """Read one label/value pair, e.g. ("sugar", "12g"), per serving."""
+    label, value = _clean(label), _clean(value)
+    if not label and not value:
+        return None
+    kind = fact_kind(label) if label else None
+    if kind is None:
+        return NormalizedFact(
+            key="other:" + (label or value).casefold(), label=label, text=value
+        )
+
+    fact = NormalizedFact(key=kind.key, label=kind.label, unit=kind.unit, text=value)
+    match = _VALUE.search(value)
+    if match is None:
+        return fact
+    less, number, unit = match.groups()
+    number = float(number.replace(",", "."))
+    unit = (unit or "").lower()
+    if unit == "%":
+        return NormalizedFact(key=kind.key, label=kind.label, percent=_round(number))
+    amount = _convert(number, unit, kind)
+    if amount is None:
+        return fact
+    return NormalizedFact(
+        key=kind.key,
+        label=kind.label,
+        unit=kind.unit,
+        amount=_round(amount),
+        less_than=bool(less),
+    )
+
+
+def normalize_portion(size: Optional[float], unit) -> Tuple[Optional[float], str]:
+    """Serving size in g or mL; other units ("sachet") are kept as given."""
+    unit = _clean(unit).lower()
+    known = _PORTION_UNITS.get(unit)
+    if known is None:
+        return size, unit
+    base, factor = known
+    return (_round(size * factor) if size is not None else None), base
+
+
+@dataclass(frozen=True)
+class NormalizedFacts:
+    """A product's serving size and nutrition facts in canonical, hashable form.
+
+    Facts are de-duplicated (a nutrient keeps its first occurrence) and
+    sorted in panel order, so inputs differing only in spelling, units,
+    case, spacing or order compare and hash equal.
+    """
+
+    portion_size: Optional[float]
+    portion_unit: str
+    facts: Tuple[NormalizedFact, ...]
+
+    @property
+    def per_100_basis(self) -> Optional[str]:
+        """What ``per_100`` values are per, or None without a usable serving size."""
+        if not self.portion_size or self.portion_unit not in ("g", "ml"):
+            return None
+        return "100 mL" if self.portion_unit == "ml" else "100 g"
+
+    def per_100(self) -> Dict[str, float]:
+        """Amounts per 100 g/mL by key; empty without a usable serving size.
+
+        For ``less_than`` facts the value is an upper bound, like the amount.
+        """
+        if self.per_100_basis is None:
+            return {}
+        scale = 100 / self.portion_size
+        return {
+            f.key: _round(f.amount * scale) for f in self.facts if f.amount is not None
+        }
+
+
+def _order(fact: NormalizedFact) -> Tuple[int, str]:
+    return _RANK.get(fact.key, len(_RANK)), fact.key
+
+
+def normalize_facts(
+    facts: Iterable[Tuple[str, str]],
+    portion_size: Optional[float] = None,
+    portion_unit=None,
+) -> NormalizedFacts:
+    """Canonical form of a product's facts; see ``NormalizedFacts``.
+
+    Each (label, value) pair is parsed once per process (``normalize_fact``
+    is cached), so this stays cheap on the request path; per-100 values
+    are only computed when ``per_100()`` is called.
+    """
+    size, unit = normalize_portion(portion_size, portion_unit)
+    by_key: Dict[str, NormalizedFact] = {}
+    for label, value in facts:
+        fact = normalize_fact(label or "", value or "")
+        if fact is not None and fact.key not in by_key:
+            by_key[fact.key] = fact
+    ordered = sorted(by_key.values(), key=_order)
+    return NormalizedFacts(portion_size=size, portion_unit=unit, facts=tuple(ordered))
@@ -1,6 +1,7 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from app.models.schemas import NutritionFact, Product, UserProfile
+from app.services.normalize import NormalizedFact, normalize_facts
 
 
 def get_attribute(obj, key: str):
@@ -33,18 +34,45 @@ def build_user_query(medical_history: Optional[str]) -> str:
     return "Berikan alternatif lebih sehat dan aman berdasarkan profil pengguna."
 
 
+def _pairs(facts) -> List[Tuple[str, str]]:
+    return [
+        (get_attribute(nf, "label") or "", get_attribute(nf, "value") or "")
+        for nf in facts or []
+    ]
+
+
+def _fact_line(
+    fact: NormalizedFact, per_100: Dict[str, float], basis: Optional[str]
+) -> str:
+    value = fact.value()
+    if fact.key in per_100:
+        # "< 1 g" per serving is only a bound per 100 g too.
+        bound = "< " if fact.less_than else ""
+        value += f" ({bound}{per_100[fact.key]:g} {fact.unit}/{basis})"
+    if fact.label and value:
+        return f"{fact.label}: {value}"
+    return fact.label or value
+
+
 def build_product_profile(product: Product, facts: List[NutritionFact]) -> str:
+    """Prompt text for the product, with the facts in canonical form.
+
+    Labels, units and order are normalized, so equivalent inputs ("sugar
+    12g" and "Gula 12 g") give the same profile and the same cache key.
+    """
     lines = []
     product_name = get_attribute(product, "name")
     if product_name:
         lines.append(f"Produk: {product_name}")
 
     portion = get_attribute(product, "portion")
-    portion_size = get_attribute(portion, "size")
-    portion_unit = get_attribute(portion, "unit")
+    normalized = normalize_facts(
+        _pairs(facts), get_attribute(portion, "size"), get_attribute(portion, "unit")
+    )
+    portion_size, portion_unit = normalized.portion_size, normalized.portion_unit
     if portion_unit and portion_size is not None:
         lines.append(
-            f"Ukuran porsi: {portion_size} {portion_unit}"
+            f"Ukuran porsi: {portion_size:g} {portion_unit}"
         )
     elif portion_unit:
         lines.append(
@@ -53,19 +81,11 @@ def build_product_profile(product: Product, facts: List[NutritionFact]) -> str:
     else:
         lines.append("Ukuran porsi: tidak tersedia")
 
-    if facts:
+    if normalized.facts:
         lines.append("Nutrisi per porsi:")
-        for nf in facts:
-            label = get_attribute(nf, "label")
-            value = get_attribute(nf, "value")
-            if not label and not value:
-                continue
-            if label and value is not None and value != "":
-                lines.append(f"- {label}: {value}")
-            elif label:
-                lines.append(f"- {label}")
-            else:
-                lines.append(f"- {value}")
+        per_100, basis = normalized.per_100(), normalized.per_100_basis
+        for fact in normalized.facts:
+            lines.append(f"- {_fact_line(fact, per_100, basis)}")
 
     return "\n".join(lines)
 
@@ -77,11 +97,9 @@ def build_search_query(
     parts = []
     if product_name:
         parts.append(product_name)
-    for nf in facts or []:
-        label = get_attribute(nf, "label")
-        value = get_attribute(nf, "value")
-        if label and value:
-            parts.append(f"{label} {value}")
-        elif label:
-            parts.append(label)
+    for fact in normalize_facts(_pairs(facts)).facts:
+        if fact.label and fact.value():
+            parts.append(f"{fact.label} {fact.value()}")
+        elif fact.label:
+            parts.append(fact.label)
     return " ; ".join(parts) if parts else "alternatif makanan kemasan yang lebih sehat"
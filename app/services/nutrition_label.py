@@ -0,0 +1,133 @@
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from app.models.schemas import NutritionFact, Portion
+from app.services.normalize import fact_kind
+
+_SERVING = ("takaran saji", "serving size", "ukuran porsi")
+_SERVINGS_PER_PACK = ("sajian per kemasan", "servings per")
+
+_AMOUNT = re.compile(
+    r"(<\s*)?(\d+(?:[.,]\d+)?)\s*(mg|mcg|µg|g|gr|gram|kkal|kcal|kal|kj|ml|l)?"
+    r"(?![\w%])",
+    re.IGNORECASE,
+)
+_SERVING_AMOUNT = re.compile(
+    r"(\d+(?:[.,]\d+)?)\s*(ml|l|liter|g|gr|gram|kg)\b", re.IGNORECASE
+)
+_MARKDOWN_NOISE = re.compile(r"[|*#]+")
+
+
+@dataclass(frozen=True)
+class LabelReading:
+    """Structured nutrition facts read off a label.
+
+    ``confidence`` (0-1) combines how sure the OCR engine was about the
+    lines that were used with how complete the reading is: a serving size
+    and at least ``min_facts`` nutrients are needed for full marks.
+    """
+
+    facts: Tuple[NutritionFact, ...]
+    portion: Optional[Portion]
+    confidence: float
+
+    def markdown(self) -> str:
+        """The reading as the same kind of table the OCR service returns."""
+        rows = ["| Informasi Nilai Gizi | |", "|---|---|"]
+        if self.portion is not None:
+            size = f"{self.portion.size:g} " if self.portion.size else ""
+            rows.append(f"| Takaran saji | {size}{self.portion.unit} |")
+        rows += [f"| {fact.label} | {fact.value} |" for fact in self.facts]
+        return "\n".join(rows)
+
+
+def _canonical_label(text: str) -> Optional[str]:
+    kind = fact_kind(text)
+    return kind.label if kind is not None else None
+
+
+def _value(rest: str) -> Optional[str]:
+    """First amount after a label, skipping %AKG columns."""
+    for match in _AMOUNT.finditer(rest):
+        less, number, unit = match.groups()
+        value = number.replace(",", ".")
+        if unit:
+            value += f" {unit.lower()}"
+        return f"< {value}" if less else value
+    return None
+
+
+def _serving(line: str) -> Optional[Portion]:
+    match = _SERVING_AMOUNT.search(line)
+    if not match:
+        return None
+    unit = match.group(2).lower()
+    unit = {"gr": "g", "gram": "g", "liter": "l"}.get(unit, unit)
+    return Portion(size=float(match.group(1).replace(",", ".")), unit=unit)
+
+
+def read_nutrition_label(
+    lines: Iterable[Tuple[str, float]], min_facts: int = 3
+) -> LabelReading:
+    """Pick the nutrition-facts rows out of OCR text lines.
+
+    ``lines`` are (text, confidence 0-1) pairs in reading order; plain
+    markdown can be passed with confidence 1. Each nutrient keeps its first
+    occurrence (panels often repeat per serving and per 100 g).
+    """
+    facts: List[NutritionFact] = []
+    seen = set()
+    portion: Optional[Portion] = None
+    used: List[float] = []
+    for text, confidence in lines:
+        text = " ".join(_MARKDOWN_NOISE.sub(" ", text).split())
+        if not text:
+            continue
+        lowered = text.lower()
+        if any(s in lowered for s in _SERVINGS_PER_PACK):
+            continue
+        if portion is None and any(s in lowered for s in _SERVING):
+            portion = _serving(text)
+            if portion is not None:
+                used.append(confidence)
+            continue
+        label = _canonical_label(text)
+        if label is None or label in seen:
+            continue
+        head = re.search(r"\d|<", text)
+        value = _value(text[head.start():]) if head else None
+        if value is None:
+            continue
+        seen.add(label)
+        facts.append(NutritionFact(label=label, value=value))
+        used.append(confidence)
+
+    coverage = min(1.0, len(facts) / max(1, min_facts))
+    if portion is None:
+        coverage *= 0.5
+    engine = sum(used) / len(used) if used else 0.0
+    return LabelReading(
+        facts=tuple(facts), portion=portion, confidence=round(engine * coverage, 3)
+    )
+
+
+def read_markdown_label(markdown: str, min_facts: int = 3) -> LabelReading:
+    return read_nutrition_label(
+        ((line, 1.0) for line in markdown.splitlines()), min_facts
+    )
+
+
+def portion_or_unknown(portion: Optional[Portion]) -> Portion:
+    return portion if portion is not None else Portion(size=None, unit="")
+
+
+def first_heading(lines: Sequence[str]) -> Optional[str]:
+    """Product name from a markdown heading, if the OCR produced one."""
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith("#"):
+            name = stripped.lstrip("#").strip()
+            if name and _canonical_label(name) is None and "gizi" not in name.lower():
+                return name
+    return None
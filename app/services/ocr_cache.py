@@ -0,0 +1,132 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+from app.core.lazy import lazy
+from app.models.schemas import NutritionFact, Portion
+
+try:  # Pillow is optional; without it only exact matches are cached.
+    from PIL import Image
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = None
+
+
+@dataclass(frozen=True)
+class OcrResult:
+    markdown: str
+    search_query: str
+    # The nutrition table as structured facts, when it could be read.
+    product_name: Optional[str] = None
+    portion: Optional[Portion] = None
+    facts: Tuple[NutritionFact, ...] = ()
+    source: str = "backend"
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(data: bytes) -> Optional[int]:
+    """64-bit difference hash (dHash) of an image, or None if unavailable.
+
+    Re-encoded, resized or slightly recompressed copies of the same photo
+    land within a few bits of each other.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            small = img.convert("L").resize((9, 8), Image.BILINEAR)
+            pixels = list(small.getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+class OcrCache:
+    """OCR results keyed by image content hash, with near-duplicate lookup.
+
+    Exact matches use the SHA-256 of the uploaded bytes. When
+    ``max_distance`` is set and Pillow is installed, photos whose perceptual
+    hash is within ``max_distance`` bits of a cached one also hit.
+    """
+
+    def __init__(self, namespace: str, maxsize: int, ttl: float, max_distance: int):
+        self.namespace = namespace
+        self.max_distance = max_distance
+        self._exact = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._phashes: "OrderedDict[str, int]" = OrderedDict()
+        self._phash_lock = threading.Lock()
+        self._maxsize = maxsize
+        self.near_hits = 0
+
+    @property
+    def phash_enabled(self) -> bool:
+        return self.max_distance > 0 and Image is not None
+
+    def _key(self, digest: str) -> str:
+        return f"{self.namespace}:{digest}"
+
+    def get(self, digest: str, phash: Optional[int] = None) -> Optional[OcrResult]:
+        result = self._exact.get(self._key(digest))
+        if result is not None or phash is None or not self.phash_enabled:
+            return result
+        with self._phash_lock:
+            candidates = list(self._phashes.items())
+        for other_digest, other_phash in candidates:
+            if bin(phash ^ other_phash).count("1") <= self.max_distance:
+                result = self._exact.get(self._key(other_digest))
+                if result is not None:
+                    self.near_hits += 1
+                    return result
+        return None
+
+    def set(self, digest: str, result: OcrResult, phash: Optional[int] = None) -> None:
+        self._exact.set(self._key(digest), result)
+        if phash is None or not self.phash_enabled:
+            return
+        with self._phash_lock:
+            self._phashes[digest] = phash
+            self._phashes.move_to_end(digest)
+            while len(self._phashes) > self._maxsize:
+                self._phashes.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            **self._exact.stats(),
+            "phash_enabled": self.phash_enabled,
+            "near_hits": self.near_hits,
+        }
+
+
+@lazy
+def get_ocr_cache() -> OcrCache:
+    settings = get_settings()
+    if Image is None and (
+        settings.ocr_phash_max_distance > 0 or settings.ocr_max_image_side > 0
+    ):
+        print(
+            "[WARN] Pillow is not installed: uploads are not downscaled and "
+            "near-duplicate OCR cache matching is off."
+        )
+    return OcrCache(
+        # Results from another OCR engine or model are not interchangeable.
+        namespace=(
+            f"{settings.ocr_backend}:{settings.ocr_model}"
+            + (":local" if settings.ocr_local else "")
+        ),
+        maxsize=settings.ocr_cache_size,
+        ttl=settings.ocr_cache_ttl_seconds,
+        max_distance=settings.ocr_phash_max_distance,
+    )
@@ -0,0 +1,505 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.models.schemas import (
+    NO_ALTERNATIVE_SUMMARY,
+    NutritionSummary,
+    ProductAssessment,
+    RagAnswer,
+    Recommendation,
+)
+from app.services.normalize import SALT, normalize_fact
+
+
+@dataclass(frozen=True)
+class Nutrient:
+    """A nutrient the rules know how to read, compare and limit.
+
+    ``field`` is the per-100 g/mL metadata key of the vector table. ``low``
+    and ``high`` are per product type (``makanan`` per 100 g, ``minuman``
+    per 100 mL); only nutrients with ``conditions`` are limited.
+    """
+
+    field: str
+    summary_field: str
+    label: str
+    unit: str
+    conditions: Tuple[str, ...] = ()
+    low: Optional[Dict[str, float]] = None
+    high: Optional[Dict[str, float]] = None
+
+
+# Limits: Codex "low" claims and UK FSA "high" front-of-pack thresholds.
+SUGAR = Nutrient(
+    field="sugars_g_100g",
+    summary_field="sugar_g_100g",
+    label="Gula",
+    unit="g",
+    conditions=(
+        "diabetes", "kencing manis", "gula darah", "prediabetes", "obesitas",
+        "obesity", "insulin",
+    ),
+    low={"makanan": 5.0, "minuman": 2.5},
+    high={"makanan": 22.5, "minuman": 11.25},
+)
+SODIUM = Nutrient(
+    field="sodium_mg_100g",
+    summary_field="sodium_mg_100g",
+    label="Natrium",
+    unit="mg",
+    conditions=(
+        "hipertensi", "hypertension", "darah tinggi", "tekanan darah",
+        "jantung", "heart", "ginjal", "kidney", "stroke",
+    ),
+    low={"makanan": 120.0, "minuman": 120.0},
+    high={"makanan": 600.0, "minuman": 300.0},
+)
+SAT_FAT = Nutrient(
+    field="fat_sat_g_100g",
+    summary_field="fat_sat_g_100g",
+    label="Lemak jenuh",
+    unit="g",
+    conditions=(
+        "kolesterol", "cholesterol", "dislipidemia", "jantung", "heart",
+        "stroke",
+    ),
+    low={"makanan": 1.5, "minuman": 0.75},
+    high={"makanan": 5.0, "minuman": 2.5},
+)
+FIBER = Nutrient(
+    field="fiber_g_100g",
+    summary_field="fiber_g_100g",
+    label="Serat",
+    unit="g",
+)
+PROTEIN = Nutrient(
+    field="protein_g_100g",
+    summary_field="protein_g_100g",
+    label="Protein",
+    unit="g",
+)
+
+LIMITED = (SUGAR, SODIUM, SAT_FAT)
+NUTRIENTS = LIMITED + (FIBER, PROTEIN)
+_BY_FIELD = {n.field: n for n in NUTRIENTS}
+
+ALLERGEN_SYNONYMS = {
+    "susu": ("susu", "milk", "laktosa", "lactose"),
+    "kacang": ("kacang", "peanut"),
+    "gandum": ("gandum", "wheat", "gluten"),
+    "telur": ("telur", "egg"),
+    "kedelai": ("kedelai", "soy"),
+    "ikan": ("ikan", "fish"),
+    "udang": ("udang", "shrimp", "crustacea"),
+    "seafood": ("seafood", "udang", "kerang", "ikan", "crustacea"),
+}
+
+# Every known allergen word, mapped to what it excludes: its own entry's
+# synonyms if it has one ("udang"), else those of the entry naming it.
+_ALLERGEN_WORDS: Dict[str, Tuple[str, ...]] = {}
+for _synonyms in ALLERGEN_SYNONYMS.values():
+    for _word in _synonyms:
+        _ALLERGEN_WORDS.setdefault(_word, ALLERGEN_SYNONYMS.get(_word, _synonyms))
+
+_CONJUNCTIONS = frozenset(["dan", "atau", "and", "or", "serta"])
+
+_ALLERGY = re.compile(
+    r"(?:alergi|allergy|allergic)(?:\s+(?:to|terhadap))?\s+([^.;\n]+)"
+)
+_PORTION = re.compile(
+    r"(?:ukuran porsi|takaran saji|serving size)\W+[^\n]*?"
+    r"(\d+(?:[.,]\d+)?)\s*(ml|l|liter|g|gr|gram|kg)\b",
+    re.IGNORECASE,
+)
+_PORTION_UNIT = re.compile(
+    r"(?:ukuran porsi|takaran saji|serving size)\W+(ml|l|liter|g|gr|gram|kg)\b",
+    re.IGNORECASE,
+)
+_PRODUCT_NAME = re.compile(r"^Produk:\s*(.+)$", re.MULTILINE)
+_UNIT = re.compile(r"\d\s*(ml|l|liter|g|gr|gram|kg)\b", re.IGNORECASE)
+_LIST_FACT = re.compile(r"^\s*-\s*([^:\n]+):\s*(.+)$", re.MULTILINE)
+_TABLE_FACT = re.compile(r"^\s*\|([^|\n]+)\|([^|\n]+)\|", re.MULTILINE)
+
+
+def _unit_type(unit: str) -> str:
+    return "minuman" if unit.lower() in ("ml", "l", "liter") else "makanan"
+
+
+def _to_float(number: str) -> float:
+    return float(number.replace(",", "."))
+
+
+def product_type_of(metadata: dict) -> Optional[str]:
+    """Drink or food, from ``product_type`` or the serving size unit."""
+    declared = str(metadata.get("product_type") or "").lower()
+    if declared in ("minuman", "makanan"):
+        return declared
+    match = _UNIT.search(str(metadata.get("serving_size_raw") or ""))
+    return _unit_type(match.group(1)) if match else None
+
+
+def health_text(resolved: dict) -> str:
+    return "\n".join(
+        [resolved.get("user_profile") or "", resolved.get("user_query") or ""]
+    ).lower()
+
+
+def relevant_nutrients(health: str) -> List[Nutrient]:
+    return [n for n in LIMITED if any(c in health for c in n.conditions)]
+
+
+def parse_portion(product_profile: str) -> Tuple[Optional[float], Optional[str]]:
+    """Serving size (in g or mL) and product type from a product profile."""
+    match = _PORTION.search(product_profile)
+    if not match:
+        unit = _PORTION_UNIT.search(product_profile)
+        return None, (_unit_type(unit.group(1)) if unit else None)
+    size, unit = _to_float(match.group(1)), match.group(2).lower()
+    if unit in ("l", "liter", "kg"):
+        size *= 1000
+    return (size or None), _unit_type(unit)
+
+
+def parse_nutrient(label: str, value: str) -> Optional[Tuple[Nutrient, float]]:
+    """Read one NutritionFact, e.g. ("Natrium", "35 mg"), in the nutrient's unit.
+
+    "< 1 g" is read as its upper bound. Salt ("garam") is converted to
+    sodium. Returns None for labels the rules do not use and for values
+    without an amount (including ones given only as % AKG).
+    """
+    fact = normalize_fact(label or "", value or "")
+    if fact is None or fact.amount is None:
+        return None
+    if fact.key == SALT.key:
+        return SODIUM, fact.amount * 1000 / 2.5
+    nutrient = _BY_FIELD.get(fact.key)
+    return (nutrient, fact.amount) if nutrient is not None else None
+
+
+def parse_profile_facts(product_profile: str) -> List[Tuple[str, str]]:
+    """(label, value) pairs from "- label: value" lines or markdown tables."""
+    pairs = [(m.group(1), m.group(2)) for m in _LIST_FACT.finditer(product_profile)]
+    pairs += [
+        (m.group(1).strip(), m.group(2).strip())
+        for m in _TABLE_FACT.finditer(product_profile)
+    ]
+    return pairs
+
+
+def nutrients_per_100(
+    facts: Iterable[Tuple[str, str]], serving_size: Optional[float]
+) -> Dict[str, float]:
+    """Per-serving label values scaled to per 100 g/mL, keyed by field.
+
+    Empty when the serving size is unknown, since nothing can be compared
+    with the per-100 catalogue values then.
+    """
+    if not serving_size:
+        return {}
+    values: Dict[str, float] = {}
+    for label, value in facts:
+        parsed = parse_nutrient(label, value)
+        if parsed is not None and parsed[0].field not in values:
+            nutrient, amount = parsed
+            values[nutrient.field] = amount * 100 / serving_size
+    return values
+
+
+@dataclass(frozen=True)
+class CandidateFilter:
+    """Constraints every retrieved candidate must satisfy.
+
+    Nutrient ceilings go into the vector query's metadata filter, so TiDB
+    only ranks eligible rows. Allergens, product type and the original
+    product are checked on the returned rows, since they need substring or
+    unit parsing the filter syntax cannot express.
+    """
+
+    product_type: Optional[str] = None
+    max_sugars_g_100g: Optional[float] = None
+    max_sodium_mg_100g: Optional[float] = None
+    max_fat_sat_g_100g: Optional[float] = None
+    exclude_allergens: Tuple[str, ...] = ()
+    exclude_names: Tuple[str, ...] = ()
+
+    def ceilings(self) -> Dict[str, float]:
+        return {
+            field: ceiling
+            for field, ceiling in (
+                ("sugars_g_100g", self.max_sugars_g_100g),
+                ("sodium_mg_100g", self.max_sodium_mg_100g),
+                ("fat_sat_g_100g", self.max_fat_sat_g_100g),
+            )
+            if ceiling is not None
+        }
+
+    def metadata_filter(self) -> Optional[dict]:
+        clauses = [
+            {field: {"$lte": ceiling}} for field, ceiling in self.ceilings().items()
+        ]
+        return {"$and": clauses} if clauses else None
+
+    def accepts(self, metadata: dict) -> bool:
+        if self.product_type:
+            kind = product_type_of(metadata)
+            if kind is not None and kind != self.product_type:
+                return False
+        if self.exclude_allergens:
+            allergens = str(metadata.get("allergens") or "").lower()
+            if any(a in allergens for a in self.exclude_allergens):
+                return False
+        if self.exclude_names:
+            name = str(metadata.get("brand_name") or "").strip().lower()
+            if name and name in self.exclude_names:
+                return False
+        return True
+
+
+def derive_filter(resolved: dict) -> CandidateFilter:
+    """Build the candidate constraints from the four prompt strings."""
+    product_profile = resolved.get("product_profile") or ""
+    health = health_text(resolved)
+    _, product_type = parse_portion(product_profile)
+    basis = product_type or "makanan"
+    ceilings = {n.field: n.low[basis] for n in relevant_nutrients(health)}
+
+    allergens: List[str] = []
+    for match in _ALLERGY.finditer(health):
+        # The clause runs on past the allergens ("alergi kacang, hipertensi
+        # dan sering makan roti"), so only known allergen words count, plus
+        # the word right after "alergi" for allergens we have no entry for.
+        words = [
+            w for w in re.findall(r"[^\W\d_]+", match.group(1))
+            if w not in _CONJUNCTIONS
+        ]
+        if words and words[0] not in _ALLERGEN_WORDS:
+            allergens.append(words[0])
+        for word in words:
+            allergens.extend(_ALLERGEN_WORDS.get(word, ()))
+
+    names = tuple(
+        m.group(1).strip().lower() for m in _PRODUCT_NAME.finditer(product_profile)
+    )
+    return CandidateFilter(
+        product_type=product_type,
+        max_sugars_g_100g=ceilings.get(SUGAR.field),
+        max_sodium_mg_100g=ceilings.get(SODIUM.field),
+        max_fat_sat_g_100g=ceilings.get(SAT_FAT.field),
+        exclude_allergens=tuple(dict.fromkeys(allergens)),
+        exclude_names=names,
+    )
+
+
+def _num(value: float) -> str:
+    return f"{round(value, 2):g}"
+
+
+def _per(product_type: str) -> str:
+    return "100 mL" if product_type == "minuman" else "100 g"
+
+
+def _amount(nutrient: Nutrient, value: float, product_type: str) -> str:
+    return f"{nutrient.label} {_num(value)} {nutrient.unit}/{_per(product_type)}"
+
+
+@dataclass(frozen=True)
+class RuleAssessment:
+    assessment: ProductAssessment
+    # False when the rules cannot decide and the LLM should.
+    conclusive: bool
+    # What alternatives are compared on: the user's conditions, or else
+    # the nutrients that made the product unsafe.
+    nutrients: Tuple[Nutrient, ...] = ()
+
+
+def assess_product(resolved: dict) -> RuleAssessment:
+    """Judge the original product against the limits for the user's conditions.
+
+    Conclusive cases: a limited nutrient above the "high" threshold (not
+    safe), every relevant nutrient at or below the "low" threshold (safe),
+    or missing data for a relevant nutrient (unknown, naming what is
+    missing). Values in between, or an unrecognised medical history, are
+    left to the LLM.
+    """
+    product_profile = resolved.get("product_profile") or ""
+    serving_size, product_type = parse_portion(product_profile)
+    facts = parse_profile_facts(product_profile)
+    values = nutrients_per_100(facts, serving_size)
+    labelled = {
+        parsed[0].field
+        for parsed in (parse_nutrient(label, value) for label, value in facts)
+        if parsed is not None
+    }
+    health = health_text(resolved)
+    relevant = relevant_nutrients(health)
+    kind = product_type or "tidak_diketahui"
+
+    def verdict(is_safe, reasons, summary, conclusive=True) -> RuleAssessment:
+        return RuleAssessment(
+            ProductAssessment(
+                product_type=kind, is_safe=is_safe, reasons=reasons, summary=summary
+            ),
+            conclusive,
+            tuple(relevant or over),
+        )
+
+    basis = product_type or "makanan"
+    checked = relevant or list(LIMITED)
+    over = [
+        n for n in checked
+        if n.field in values and values[n.field] > n.high[basis]
+    ]
+    if over:
+        reasons = [
+            f"{_amount(n, values[n.field], basis)} melebihi batas tinggi "
+            f"{_num(n.high[basis])} {n.unit}."
+            for n in over
+        ]
+        names = ", ".join(n.label.lower() for n in over)
+        return verdict(False, reasons, f"Tidak disarankan karena {names} tinggi.")
+
+    if not relevant:
+        return verdict(None, [], "", conclusive=False)
+
+    missing = [n for n in relevant if n.field not in labelled]
+    if serving_size is None or missing:
+        needed = ["ukuran porsi"] if serving_size is None else []
+        needed += [n.label.lower() for n in missing]
+        return verdict(
+            None,
+            [f"Data {item} tidak tersedia." for item in needed],
+            "Belum dapat dinilai; lengkapi data " + ", ".join(needed) + ".",
+        )
+
+    if all(values[n.field] <= n.low[basis] for n in relevant):
+        reasons = [
+            f"{_amount(n, values[n.field], basis)} termasuk rendah." for n in relevant
+        ]
+        return verdict(True, reasons, "Sesuai untuk kondisi pengguna.")
+
+    return verdict(None, [], "", conclusive=False)
+
+
+def _above(metadata: dict, nutrient: Nutrient, limit: float) -> bool:
+    try:
+        return float(metadata[nutrient.field]) > limit
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def healthier_score(
+    metadata: dict, nutrients: Iterable[Nutrient], basis: str
+) -> Optional[float]:
+    """How far under the "low" limits a candidate is (lower is better).
+
+    None when it lacks a value for one of ``nutrients`` or is high in any
+    limited nutrient, i.e. when it can never be recommended.
+    """
+    try:
+        values = [float(metadata[n.field]) / n.low[basis] for n in nutrients]
+    except (KeyError, TypeError, ValueError):
+        return None
+    if any(_above(metadata, n, n.high[basis]) for n in LIMITED):
+        return None
+    return sum(values)
+
+
+def rank_candidates(
+    resolved: dict,
+    docs,
+    nutrients: Iterable[Nutrient] = (),
+    limit: int = 3,
+) -> List[Recommendation]:
+    """Order retrieved candidates by how far under the limits they are.
+
+    Keeps candidates that pass the request's constraints, have values for
+    every nutrient in ``nutrients`` (default: the user's conditions, else
+    all limited ones), are no worse than the original product on any of
+    them and are not high in any limited nutrient.
+    """
+    product_profile = resolved.get("product_profile") or ""
+    serving_size, product_type = parse_portion(product_profile)
+    original = nutrients_per_100(parse_profile_facts(product_profile), serving_size)
+    basis = product_type or "makanan"
+    relevant = (
+        list(nutrients) or relevant_nutrients(health_text(resolved)) or list(LIMITED)
+    )
+    constraints = derive_filter(resolved)
+
+    scored = []
+    seen = set()
+    for doc in docs:
+        m = doc.metadata
+        name = str(m.get("brand_name") or "").strip()
+        if not name or name.lower() in seen or not constraints.accepts(m):
+            continue
+        score = healthier_score(m, relevant, basis)
+        if score is None:
+            continue
+        values = {n.field: float(m[n.field]) for n in relevant}
+        if any(
+            n.field in original and values[n.field] > original[n.field]
+            for n in relevant
+        ):
+            continue
+        seen.add(name.lower())
+        scored.append((score, name, m, values))
+
+    scored.sort(key=lambda item: item[0])
+    recommendations = []
+    for rank, (_, name, m, values) in enumerate(scored[:limit], start=1):
+        reasons = []
+        for n in relevant:
+            reason = _amount(n, values[n.field], basis)
+            if n.field in original and values[n.field] < original[n.field]:
+                reason += f", lebih rendah dari produk asal ({_num(original[n.field])})"
+            reasons.append(reason + ".")
+        summary = {}
+        for n in NUTRIENTS:
+            try:
+                summary[n.summary_field] = float(m[n.field])
+            except (KeyError, TypeError, ValueError):
+                summary[n.summary_field] = None
+        recommendations.append(
+            Recommendation(
+                rank=rank,
+                brand=name,
+                category=str(m.get("category") or "tidak diketahui"),
+                reasons=reasons,
+                nutrition=NutritionSummary(**summary),
+            )
+        )
+    return recommendations
+
+
+def rule_answer(
+    resolved: dict, docs, assessed: Optional[RuleAssessment] = None
+) -> Optional[RagAnswer]:
+    """A complete answer from the rules alone, or None if they are inconclusive.
+
+    With nothing retrieved there is nothing to recommend, so the answer is
+    the product verdict and the fixed no-alternative summary. The verdict
+    itself still has to come from the rules: when they cannot decide it,
+    the model is asked even without candidates.
+    """
+    assessed = assessed or assess_product(resolved)
+    if not assessed.conclusive:
+        return None
+    if not docs:
+        return RagAnswer(
+            product_assessment=assessed.assessment,
+            recommendations=[],
+            summary=NO_ALTERNATIVE_SUMMARY,
+        )
+    recommendations = rank_candidates(resolved, docs, assessed.nutrients)
+    if recommendations:
+        brands = ", ".join(r.brand for r in recommendations)
+        summary = f"{assessed.assessment.summary} Alternatif yang lebih sesuai: {brands}."
+    else:
+        summary = NO_ALTERNATIVE_SUMMARY
+    return RagAnswer(
+        product_assessment=assessed.assessment,
+        recommendations=recommendations,
+        summary=summary,
+    )
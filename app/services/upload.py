@@ -0,0 +1,218 @@
+import asyncio
+import base64
+import hashlib
+import io
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from fastapi import UploadFile
+
+from app.services.ocr_cache import Image, perceptual_hash
+
+# Multiple of 3 so every chunk base64-encodes without padding.
+CHUNK_SIZE = 3 * 64 * 1024
+
+
+class UploadRejected(ValueError):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class UploadTimings:
+    bytes_in: int = 0
+    bytes_sent: int = 0
+    read_ms: float = 0.0
+    resize_ms: float = 0.0
+    encode_ms: float = 0.0
+    resized: bool = False
+
+
+@dataclass
+class EncodedImage:
+    data_url: str
+    mime: str
+    digest: str
+    phash: Optional[int] = None
+    timings: UploadTimings = field(default_factory=UploadTimings)
+
+
+class UploadStats:
+    """Running totals of upload sizes and per-stage latency."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.resized = 0
+        self.rejected = 0
+        self.bytes_in = 0
+        self.bytes_sent = 0
+        self.read_ms = 0.0
+        self.resize_ms = 0.0
+        self.encode_ms = 0.0
+
+    def record(self, timings: UploadTimings) -> None:
+        with self._lock:
+            self.uploads += 1
+            self.resized += int(timings.resized)
+            self.bytes_in += timings.bytes_in
+            self.bytes_sent += timings.bytes_sent
+            self.read_ms += timings.read_ms
+            self.resize_ms += timings.resize_ms
+            self.encode_ms += timings.encode_ms
+
+    def reject(self) -> None:
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "uploads": self.uploads,
+            "resized": self.resized,
+            "rejected": self.rejected,
+            "bytes_in": self.bytes_in,
+            "bytes_sent": self.bytes_sent,
+            "read_ms": round(self.read_ms, 3),
+            "resize_ms": round(self.resize_ms, 3),
+            "encode_ms": round(self.encode_ms, 3),
+        }
+
+
+upload_stats = UploadStats()
+
+
+def _elapsed_ms(started: float) -> float:
+    return (time.perf_counter() - started) * 1000
+
+
+def downscale_image(data, max_side: int, quality: int) -> Optional[bytes]:
+    """Shrink an image so its longest side is ``max_side``, as JPEG.
+
+    Returns None when the image is already small enough or cannot be
+    decoded, in which case the original bytes should be sent.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if max(img.size) <= max_side:
+                return None
+            img = img.convert("RGB")
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=quality, optimize=True)
+    except Exception as exc:
+        print(f"[WARN] Image downscale skipped: {exc}")
+        return None
+    return out.getvalue()
+
+
+def exceeds_side(head: bytes, max_side: int) -> bool:
+    """Whether the image starting with ``head`` is larger than ``max_side``.
+
+    Pillow reads the size from the header only. When the header cannot be
+    parsed from ``head`` the image is assumed to need resizing.
+    """
+    try:
+        with Image.open(io.BytesIO(head)) as img:
+            return max(img.size) > max_side
+    except Exception:
+        return True
+
+
+def _encode_chunks(data: memoryview) -> List[str]:
+    return [
+        base64.b64encode(data[i : i + CHUNK_SIZE]).decode("ascii")
+        for i in range(0, len(data), CHUNK_SIZE)
+    ]
+
+
+async def encode_upload(
+    upload: UploadFile,
+    mime: str,
+    max_bytes: int,
+    max_side: int = 0,
+    jpeg_quality: int = 85,
+    want_phash: bool = False,
+) -> EncodedImage:
+    """Read an upload in chunks and build the ``data:`` URL for OCR.
+
+    The size limit is enforced while streaming, so oversized files are
+    rejected without being buffered. The image size is read from the
+    header in the first chunk; unless the image is larger than ``max_side``
+    or a perceptual hash is wanted, chunks are base64-encoded as they arrive
+    and the raw bytes are never held in full. The encoded pieces are joined
+    into the data URL at the end, so two encoded copies exist briefly then.
+    """
+    timings = UploadTimings()
+    if upload.size is not None and upload.size > max_bytes:
+        upload_stats.reject()
+        raise UploadRejected(413, _too_large_message(max_bytes))
+
+    started = time.perf_counter()
+    chunk = await upload.read(CHUNK_SIZE)
+    downscale = (
+        max_side > 0
+        and Image is not None
+        and bool(chunk)
+        and exceeds_side(chunk, max_side)
+    )
+    keep_raw = downscale or want_phash
+    digest = hashlib.sha256()
+    raw = bytearray() if keep_raw else None
+    pieces: List[str] = []
+    carry = b""
+
+    while chunk:
+        timings.bytes_in += len(chunk)
+        if timings.bytes_in > max_bytes:
+            upload_stats.reject()
+            raise UploadRejected(413, _too_large_message(max_bytes))
+        digest.update(chunk)
+        if keep_raw:
+            raw.extend(chunk)
+        else:
+            chunk = carry + chunk
+            usable = len(chunk) - len(chunk) % 3
+            pieces.append(base64.b64encode(chunk[:usable]).decode("ascii"))
+            carry = chunk[usable:]
+        chunk = await upload.read(CHUNK_SIZE)
+    timings.read_ms = _elapsed_ms(started)
+
+    if not timings.bytes_in:
+        raise UploadRejected(400, "File gambar kosong.")
+
+    phash = None
+    if keep_raw:
+        payload = raw
+        if downscale:
+            started = time.perf_counter()
+            smaller = await asyncio.to_thread(
+                downscale_image, payload, max_side, jpeg_quality
+            )
+            timings.resize_ms = _elapsed_ms(started)
+            if smaller is not None:
+                payload, mime, timings.resized = smaller, "image/jpeg", True
+        if want_phash:
+            phash = await asyncio.to_thread(perceptual_hash, payload)
+        started = time.perf_counter()
+        pieces = _encode_chunks(memoryview(payload))
+        timings.bytes_sent = len(payload)
+    else:
+        started = time.perf_counter()
+        if carry:
+            pieces.append(base64.b64encode(carry).decode("ascii"))
+        timings.bytes_sent = timings.bytes_in
+
+    data_url = "".join([f"data:{mime};base64,", *pieces])
+    timings.encode_ms = _elapsed_ms(started)
+
+    upload_stats.record(timings)
+    return EncodedImage(data_url, mime, digest.hexdigest(), phash, timings)
+
+
+def _too_large_message(max_bytes: int) -> str:
+    return f"Ukuran gambar melebihi batas {max_bytes / (1024 * 1024):g} MB."
@@ -0,0 +1,260 @@
+"""Local stand-ins for Ollama, TiDB and Mistral used by the offline benchmark.
+
+Each fake keeps the interface the application touches and adds a fixed,
+configurable latency, so the numbers measure our own code plus a known
+amount of simulated I/O.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from app.core.replica import matches_filter
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures" / "products.json"
+
+EMBEDDING_DIM = 64
+
+CANNED_ANSWER = {
+    "product_assessment": {
+        "product_type": "minuman",
+        "is_safe": False,
+        "reasons": [
+            "Kandungan gula tinggi untuk penderita diabetes.",
+            "Takaran saji besar sehingga asupan gula per porsi tinggi.",
+        ],
+        "summary": "Kurang sesuai karena gula tinggi.",
+    },
+    "recommendations": [
+        {
+            "rank": 1,
+            "brand": "Nu Green Tea No Sugar",
+            "category": "teh siap minum",
+            "reasons": ["Tanpa gula tambahan."],
+            "nutrition": {"sugar_g_100g": 0.0, "sodium_mg_100g": 10.0},
+        },
+        {
+            "rank": 2,
+            "brand": "Ichi Ocha",
+            "category": "teh siap minum",
+            "reasons": ["Gula lebih rendah."],
+            "nutrition": {"sugar_g_100g": 1.2, "sodium_mg_100g": 12.0},
+        },
+    ],
+    "summary": "Ada alternatif teh dengan gula lebih rendah.",
+}
+
+
+def load_products(path: Optional[str] = None) -> List[dict]:
+    return json.loads(Path(path or FIXTURE_PATH).read_text())
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words feature hashing, normalized to unit length."""
+
+    def __init__(self, latency_s: float = 0.0, dim: int = EMBEDDING_DIM):
+        self.latency_s = latency_s
+        self.dim = dim
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(token.encode(), digest_size=4).digest()
+            index = int.from_bytes(digest, "little")
+            vector[index % self.dim] += 1.0 if index & 1 << 31 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+@dataclass
+class QueryResult:
+    id: str
+    document: str
+    metadata: Dict[str, Any]
+    distance: float
+
+
+class InMemoryVectorClient:
+    """Brute-force cosine search over the fixture table.
+
+    Mirrors ``TiDBVectorClient.query``; ``latency_s`` stands in for the
+    network round trip to TiDB.
+    """
+
+    def __init__(self, products: List[dict], embeddings, latency_s: float = 0.0):
+        self.latency_s = latency_s
+        vectors = embeddings.embed_documents([p["document"] for p in products])
+        self.rows = [
+            (
+                product["id"],
+                product["document"],
+                {k: v for k, v in product.items() if k not in ("id", "document")},
+                vector,
+            )
+            for product, vector in zip(products, vectors)
+        ]
+
+    def query(self, query_vector, k: int = 3, filter: Optional[dict] = None, **kwargs):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        scored = []
+        for row_id, document, metadata, vector in self.rows:
+            if not matches_filter(metadata, filter):
+                continue
+            similarity = sum(a * b for a, b in zip(query_vector, vector))
+            scored.append(QueryResult(row_id, document, metadata, 1.0 - similarity))
+        scored.sort(key=lambda r: r.distance)
+        return scored[:k]
+
+
+class InMemoryVectorStore:
+    """Just enough of ``TiDBVectorStore`` for ``search_by_vector``."""
+
+    def __init__(self, client: InMemoryVectorClient):
+        self.tidb_vector_client = client
+
+
+def create_fixture_engine(table: str, products: List[dict], embeddings):
+    """SQLite engine holding the fixture in the vector table's layout.
+
+    Serves the answer cache's catalogue fingerprint and the local vector
+    replica, which read the table directly.
+    """
+    engine = create_engine(
+        "sqlite://",
+        poolclass=StaticPool,
+        connect_args={"check_same_thread": False},
+    )
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f'CREATE TABLE "{table}" (id TEXT PRIMARY KEY, embedding TEXT, '
+                "document TEXT, meta TEXT, update_time TEXT)"
+            )
+        )
+        vectors = embeddings.embed_documents([p["document"] for p in products])
+        conn.execute(
+            text(
+                f'INSERT INTO "{table}" '
+                "VALUES (:id, :embedding, :document, :meta, :update_time)"
+            ),
+            [
+                {
+                    "id": p["id"],
+                    "embedding": json.dumps(vector),
+                    "document": p["document"],
+                    "meta": json.dumps(
+                        {k: v for k, v in p.items() if k not in ("id", "document")}
+                    ),
+                    "update_time": "2025-01-01 00:00:00",
+                }
+                for p, vector in zip(products, vectors)
+            ],
+        )
+    return engine
+
+
+class FakeChatModel(BaseChatModel):
+    """Returns canned ``RagAnswer`` JSON after ``latency_s``.
+
+    Streaming spreads the same latency over ``chunks`` pieces, and every
+    response reports token usage like Ollama does.
+    """
+
+    latency_s: float = 0.2
+    chunks: int = 20
+    answer: dict = CANNED_ANSWER
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _usage(self, messages, content: str) -> dict:
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        input_tokens = prompt_chars // 4
+        output_tokens = len(content) // 4
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def _result(self, messages) -> ChatResult:
+        content = json.dumps(self.answer, ensure_ascii=False)
+        message = AIMessage(
+            content=content, usage_metadata=self._usage(messages, content)
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _pieces(self) -> List[str]:
+        content = json.dumps(self.answer, ensure_ascii=False)
+        size = max(1, math.ceil(len(content) / self.chunks))
+        return [content[i : i + size] for i in range(0, len(content), size)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency_s)
+        return self._result(messages)
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency_s)
+        return self._result(messages)
+
+    def _stream(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> Iterator[ChatGenerationChunk]:
+        pieces = self._pieces()
+        for index, piece in enumerate(pieces):
+            time.sleep(self.latency_s / len(pieces))
+            yield self._chunk(messages, piece, last=index == len(pieces) - 1)
+
+    async def _astream(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        pieces = self._pieces()
+        for index, piece in enumerate(pieces):
+            await asyncio.sleep(self.latency_s / len(pieces))
+            yield self._chunk(messages, piece, last=index == len(pieces) - 1)
+
+    def _chunk(self, messages, piece: str, last: bool) -> ChatGenerationChunk:
+        usage = None
+        if last:
+            usage = self._usage(messages, json.dumps(self.answer, ensure_ascii=False))
+        return ChatGenerationChunk(
+            message=AIMessageChunk(content=piece, usage_metadata=usage)
+        )
+
+    def with_structured_output(self, schema=None, **kwargs):
+        # Same shape as ChatOllama's json_schema mode with a dict schema.
+        return self | JsonOutputParser()
@@ -0,0 +1,178 @@
+"""Closed-loop load generator for the /search endpoints.
+
+Each of N concurrent clients sends requests back to back for a fixed
+duration; the report shows requests/sec and latency percentiles per
+concurrency level. To compare before/after, start the old and new builds on
+different ports and pass both base URLs:
+
+    python -m benchmarks.load_test \\
+        --base-url http://localhost:8000 --base-url http://localhost:8001 \\
+        --endpoint manual --concurrency 50 100 200 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+import httpx
+
+DEFAULT_MANUAL_PAYLOAD = {
+    "product": {"name": "Teh Kotak Jasmine", "portion": {"size": 200, "unit": "ml"}},
+    "nutritionFacts": [
+        {"label": "Gula", "value": "18 g"},
+        {"label": "Natrium", "value": "35 mg"},
+    ],
+    "userProfile": {"medical_history": "diabetes"},
+}
+
+
+@dataclass
+class LevelResult:
+    base_url: str
+    concurrency: int
+    duration_s: float
+    latencies_ms: List[float] = field(default_factory=list)
+    errors: int = 0
+
+    @property
+    def ok(self) -> int:
+        return len(self.latencies_ms)
+
+    @property
+    def rps(self) -> float:
+        return self.ok / self.duration_s if self.duration_s else 0.0
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies_ms:
+            return None
+        ordered = sorted(self.latencies_ms)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def as_dict(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "concurrency": self.concurrency,
+            "ok": self.ok,
+            "errors": self.errors,
+            "rps": round(self.rps, 2),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "mean_ms": (
+                round(statistics.fmean(self.latencies_ms), 2)
+                if self.latencies_ms
+                else None
+            ),
+        }
+
+
+def build_request_factory(endpoint: str, payload: dict, image: Optional[bytes]):
+    """Return a callable that issues one request against ``client``."""
+    if endpoint == "manual":
+        async def send(client: httpx.AsyncClient) -> httpx.Response:
+            return await client.post("/search/manual", json=payload)
+        return send
+
+    if image is None:
+        raise SystemExit("--image is required for the ocr endpoint")
+
+    user_profile = json.dumps(payload.get("userProfile") or {})
+
+    async def send(client: httpx.AsyncClient) -> httpx.Response:
+        return await client.post(
+            "/search/ocr",
+            files={"image": ("label.jpg", image, "image/jpeg")},
+            data={"userProfile": user_profile},
+        )
+    return send
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    send,
+    concurrency: int,
+    duration_s: float,
+) -> LevelResult:
+    result = LevelResult(str(client.base_url), concurrency, duration_s)
+    deadline = time.perf_counter() + duration_s
+
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await send(client)
+            except httpx.HTTPError:
+                result.errors += 1
+                continue
+            if response.status_code == 200:
+                result.latencies_ms.append(
+                    round((time.perf_counter() - started) * 1000, 2)
+                )
+            else:
+                result.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.duration_s = time.perf_counter() - started
+    return result
+
+
+async def run(args: argparse.Namespace, transport=None) -> List[LevelResult]:
+    payload = (
+        json.loads(Path(args.payload).read_text())
+        if args.payload
+        else DEFAULT_MANUAL_PAYLOAD
+    )
+    image = Path(args.image).read_bytes() if args.image else None
+    send = build_request_factory(args.endpoint, payload, image)
+
+    results = []
+    for base_url in args.base_url:
+        limits = httpx.Limits(max_connections=max(args.concurrency))
+        async with httpx.AsyncClient(
+            base_url=base_url,
+            timeout=args.timeout,
+            limits=limits,
+            transport=transport,
+        ) as client:
+            for concurrency in args.concurrency:
+                level = await run_level(client, send, concurrency, args.duration)
+                print(json.dumps(level.as_dict()))
+                results.append(level)
+    return results
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--base-url",
+        action="append",
+        default=None,
+        help="Server to load; repeat to compare builds side by side.",
+    )
+    parser.add_argument("--endpoint", choices=["manual", "ocr"], default="manual")
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[50, 100, 200]
+    )
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--payload", help="JSON file with a ManualSearchRequest.")
+    parser.add_argument("--image", help="Label image for the ocr endpoint.")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    if not args.base_url:
+        args.base_url = ["http://localhost:8000"]
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Micro-benchmark of nutrition-fact normalization on large batches.
+
+Generates products whose facts are written in many equivalent ways
+(Indonesian/English labels, unit spellings, case, spacing, order, per
+serving in mL or L) and times ``normalize_facts`` and the two prompt
+builders over them, with cold and warm parse caches. Also reports how many
+distinct product profiles the raw and normalized inputs produce, i.e. how
+many answer-cache keys the normalization saves:
+
+    python -m benchmarks.normalize --items 100000 --variants 200
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Callable, List, Tuple
+
+from app.services.normalize import fact_kind, normalize_fact, normalize_facts
+from app.services.nutrition import build_product_profile, build_search_query
+
+# (label spellings, value spellings) with the same meaning within a row.
+_FACTS = [
+    (
+        ["Gula", "gula", "Sugar", "Total Sugars", "GULA "],
+        ["{g} g", "{g}g", "{g} gram", "{mg} mg"],
+    ),
+    (["Natrium", "natrium", "Sodium"], ["{mg} mg", "{mg}mg", "{g} g"]),
+    (["Lemak jenuh", "Saturated fat", "lemak  jenuh"], ["{g} g", "{g}g"]),
+    (["Energi total", "Energi", "Energy", "Kalori"], ["{kcal} kkal", "{kcal} kcal"]),
+    (["Protein", "protein"], ["{g} g", "{g} gr"]),
+    (["Vitamin C"], ["{mg} mg"]),
+]
+_PORTIONS = [(200, "ml"), (0.2, "l"), (200, "mL"), (250, "g"), (0.25, "kg")]
+
+
+def _fact(rng: random.Random, row: int, base: float) -> Tuple[str, str]:
+    labels, values = _FACTS[row]
+    value = rng.choice(values).format(
+        g=round(base, 1),
+        mg=round(base * 1000, 1),
+        kcal=round(base * 10, 1),
+    )
+    return rng.choice(labels), value
+
+
+def make_products(items: int, variants: int, seed: int = 0) -> List[Tuple[dict, list]]:
+    """``items`` products drawn from ``variants`` underlying ones."""
+    rng = random.Random(seed)
+    bases = [
+        ([round(rng.uniform(0.1, 20), 1) for _ in _FACTS], rng.randrange(2))
+        for _ in range(variants)
+    ]
+    products = []
+    for _ in range(items):
+        amounts, kind = rng.choice(bases)
+        size, unit = (
+            rng.choice(_PORTIONS[:3]) if kind == 0 else rng.choice(_PORTIONS[3:])
+        )
+        facts = [
+            {"label": label, "value": value}
+            for label, value in (
+                _fact(rng, row, base) for row, base in enumerate(amounts)
+            )
+        ]
+        rng.shuffle(facts)
+        portion = {"size": size, "unit": unit}
+        products.append(({"name": "Produk", "portion": portion}, facts))
+    return products
+
+
+def _clear_caches() -> None:
+    normalize_fact.cache_clear()
+    fact_kind.cache_clear()
+
+
+def _time(name: str, run: Callable[[], None], items: int) -> dict:
+    started = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - started
+    return {
+        "case": name,
+        "seconds": round(elapsed, 4),
+        "us_per_item": round(elapsed / items * 1e6, 2),
+        "items_per_s": round(items / elapsed) if elapsed else None,
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    products = make_products(args.items, args.variants, args.seed)
+    pairs = [
+        ([(f["label"], f["value"]) for f in facts], product["portion"])
+        for product, facts in products
+    ]
+
+    def normalize() -> None:
+        for facts, portion in pairs:
+            normalize_facts(facts, portion["size"], portion["unit"])
+
+    def profiles() -> None:
+        for product, facts in products:
+            build_product_profile(product, facts)
+            build_search_query(product["name"], facts)
+
+    results = []
+    _clear_caches()
+    results.append(_time("normalize_facts (cold)", normalize, args.items))
+    results.append(_time("normalize_facts (warm)", normalize, args.items))
+    _clear_caches()
+    results.append(_time("profile + query (cold)", profiles, args.items))
+    results.append(_time("profile + query (warm)", profiles, args.items))
+
+    raw = {json.dumps([product, facts], sort_keys=True) for product, facts in products}
+    normalized = {build_product_profile(product, facts) for product, facts in products}
+    return {
+        "items": args.items,
+        "variants": args.variants,
+        "results": results,
+        "distinct_raw_inputs": len(raw),
+        "distinct_profiles": len(normalized),
+        "parse_cache": normalize_fact.cache_info()._asdict(),
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument(
+        "--variants",
+        type=int,
+        default=200,
+        help="Underlying products the items are spelled-differently copies of.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main() -> None:
+    report = run(build_parser().parse_args())
+    for row in report.pop("results"):
+        print(
+            f"{row['case']:<24} {row['seconds']:>8.3f}s "
+            f"{row['us_per_item']:>8.2f} us/item {row['items_per_s']:>10} items/s"
+        )
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
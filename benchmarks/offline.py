@@ -0,0 +1,311 @@
+"""Offline benchmark of the full app with local fakes for Ollama, TiDB and OCR.
+
+Runs the real FastAPI application in-process (ASGI transport, lifespan
+included) with a hashing embedder, an in-memory vector index loaded from
+``benchmarks/fixtures/products.json``, a fake chat model returning canned
+``RagAnswer`` JSON and the stub OCR backend. Latencies of the fakes are
+fixed, so runs on the same machine are comparable between commits:
+
+    python -m benchmarks.offline --endpoint manual ocr \\
+        --concurrency 1 8 32 --duration 10 --output before.json
+    git checkout my-branch
+    python -m benchmarks.offline --endpoint manual ocr \\
+        --concurrency 1 8 32 --duration 10 --output after.json
+    python -m benchmarks.offline --compare before.json after.json
+
+By default every request is distinct, so the numbers are for cache misses;
+``--distinct N`` cycles through N request variants to measure cache hits.
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import httpx
+
+from benchmarks.load_test import DEFAULT_MANUAL_PAYLOAD, run_level
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Point settings at the fakes. Must run before settings are first read."""
+    for var, value in {
+        "TIDB_USER": "bench",
+        "TIDB_PASSWORD": "bench",
+        "TIDB_HOST": "localhost",
+        "TIDB_PORT": "4000",
+        "TIDB_DB": "bench",
+        "TIDB_VECTOR_TABLE": "products",
+        "OLLAMA_BASE_URL": "http://localhost:11434",
+        "OLLAMA_EMBEDDING_MODEL": "fake-embed",
+        "OLLAMA_CHAT_MODEL": "fake-chat",
+    }.items():
+        os.environ.setdefault(var, value)
+    os.environ.update(
+        {
+            "OCR_BACKEND": "stub",
+            "OCR_STUB_LATENCY_MS": str(args.ocr_latency_ms),
+            # Keep runs independent of whatever a previous run left on disk.
+            "ANSWER_CACHE_PATH": "",
+            "EMBEDDING_CACHE_PATH": "",
+            "JOBS_DB_PATH": ":memory:",
+            "STARTUP_RETRIES": "1",
+            "VECTOR_REPLICA": "true" if args.vector_replica else "false",
+        }
+    )
+
+
+def install_fakes(args: argparse.Namespace):
+    """Swap the external clients for local fakes and return the app."""
+    import app.main
+    from app.core.config import get_settings
+    from app.core.db import get_engine
+    from app.core.embedding_cache import CachedEmbeddings
+    from app.core.llm import get_embeddings, get_llm, get_vector_store
+    from app.core.metrics import TokenUsageHandler
+    from benchmarks.fakes import (
+        FakeChatModel,
+        HashingEmbeddings,
+        InMemoryVectorClient,
+        InMemoryVectorStore,
+        create_fixture_engine,
+        load_products,
+    )
+
+    settings = get_settings()
+    products = load_products(args.fixture)
+    embedder = HashingEmbeddings(latency_s=args.embed_latency_ms / 1000)
+    get_engine.override(
+        create_fixture_engine(settings.tidb_vector_table, products, embedder)
+    )
+    get_embeddings.override(
+        CachedEmbeddings(
+            embedder,
+            model_name=settings.ollama_embedding_model,
+            maxsize=settings.embedding_cache_size,
+        )
+    )
+    get_vector_store.override(
+        InMemoryVectorStore(
+            InMemoryVectorClient(
+                products, embedder, latency_s=args.vector_latency_ms / 1000
+            )
+        )
+    )
+    get_llm.override(
+        FakeChatModel(
+            latency_s=args.llm_latency_ms / 1000, callbacks=[TokenUsageHandler()]
+        )
+    )
+
+    async def no_warmup() -> None:
+        pass
+
+    app.main.warm_chat_model = no_warmup
+    return app.main.app
+
+
+def synthetic_label_image() -> bytes:
+    """A phone-photo-sized JPEG, so upload resizing is exercised."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff\xe0" + os.urandom(512 * 1024)
+    image = Image.effect_noise((2400, 1800), 48).convert("RGB")
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def build_sender(endpoint: str, distinct: int, image: bytes):
+    """One request per call; ``distinct`` > 0 cycles through that many variants."""
+    counter = itertools.count()
+
+    def variant() -> int:
+        n = next(counter)
+        return n % distinct if distinct else n
+
+    if endpoint == "manual":
+        async def send(client: httpx.AsyncClient) -> httpx.Response:
+            payload = json.loads(json.dumps(DEFAULT_MANUAL_PAYLOAD))
+            payload["product"]["name"] += f" {variant()}"
+            return await client.post("/search/manual", json=payload)
+        return send
+
+    async def send(client: httpx.AsyncClient) -> httpx.Response:
+        n = variant()
+        # Bytes after the JPEG end marker change the digest, not the picture.
+        return await client.post(
+            "/search/ocr",
+            files={"image": ("label.jpg", image + b"#%d" % n, "image/jpeg")},
+            data={"userProfile": json.dumps({"medical_history": f"diabetes {n}"})},
+        )
+    return send
+
+
+def memory_mb() -> dict:
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_kb //= 1024
+    current = None
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+        current = round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        pass
+    return {"rss_mb": current, "peak_rss_mb": round(peak_kb / 1024, 1)}
+
+
+def git_revision() -> dict:
+    def git(*cmd: str) -> Optional[str]:
+        try:
+            return subprocess.run(
+                ["git", *cmd], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+    }
+
+
+async def wait_until_ready(app, timeout_s: float = 30.0) -> None:
+    deadline = time.perf_counter() + timeout_s
+    while time.perf_counter() < deadline:
+        tracker = app.state.startup
+        if tracker.ready:
+            return
+        if tracker.failed:
+            raise SystemExit(f"Warmup failed: {tracker.snapshot()}")
+        await asyncio.sleep(0.05)
+    raise SystemExit("Warmup did not finish in time")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    configure_environment(args)
+    app = install_fakes(args)
+    image = Path(args.image).read_bytes() if args.image else synthetic_label_image()
+
+    results: List[dict] = []
+    async with app.router.lifespan_context(app):
+        await wait_until_ready(app)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=args.timeout
+        ) as client:
+            for endpoint in args.endpoint:
+                send = build_sender(endpoint, args.distinct, image)
+                if args.warmup:
+                    await run_level(client, send, min(args.concurrency), args.warmup)
+                for concurrency in args.concurrency:
+                    level = await run_level(client, send, concurrency, args.duration)
+                    row = {"endpoint": endpoint, **level.as_dict(), **memory_mb()}
+                    del row["base_url"]
+                    print(json.dumps(row))
+                    results.append(row)
+            stats = (await client.get("/stats")).json()
+
+    return {
+        "meta": {
+            **git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "duration_s": args.duration,
+            "distinct": args.distinct,
+            "vector_replica": args.vector_replica,
+            "latency_ms": {
+                "embed": args.embed_latency_ms,
+                "vector": args.vector_latency_ms,
+                "llm": args.llm_latency_ms,
+                "ocr": args.ocr_latency_ms,
+            },
+        },
+        "results": results,
+        "stats": stats,
+    }
+
+
+def compare(before_path: str, after_path: str) -> None:
+    before = json.loads(Path(before_path).read_text())
+    after = json.loads(Path(after_path).read_text())
+    old = {(r["endpoint"], r["concurrency"]): r for r in before["results"]}
+    print(
+        f"before {before['meta'].get('commit', '?')[:10]}  "
+        f"after {after['meta'].get('commit', '?')[:10]}"
+    )
+    print(f"{'endpoint':<8} {'conc':>5} {'metric':<8} {'before':>10} {'after':>10} {'change':>8}")
+    for row in after["results"]:
+        base = old.get((row["endpoint"], row["concurrency"]))
+        if base is None:
+            continue
+        for metric in ("rps", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb"):
+            a, b = base.get(metric), row.get(metric)
+            change = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else "n/a"
+            print(
+                f"{row['endpoint']:<8} {row['concurrency']:>5} {metric:<8} "
+                f"{a if a is not None else '-':>10} {b if b is not None else '-':>10} "
+                f"{change:>8}"
+            )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--endpoint", nargs="+", choices=["manual", "ocr"], default=["manual", "ocr"]
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument(
+        "--distinct",
+        type=int,
+        default=0,
+        help="Number of request variants to cycle through (0: all distinct).",
+    )
+    parser.add_argument("--embed-latency-ms", type=float, default=5.0)
+    parser.add_argument("--vector-latency-ms", type=float, default=5.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--ocr-latency-ms", type=int, default=300)
+    parser.add_argument(
+        "--vector-replica",
+        action="store_true",
+        help="Serve retrieval from the in-process replica instead of the fake TiDB.",
+    )
+    parser.add_argument("--fixture", help="Product table JSON for the vector index.")
+    parser.add_argument("--image", help="Label image for the ocr endpoint.")
+    parser.add_argument("--output", help="Write results and metadata as JSON.")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BEFORE", "AFTER"),
+        help="Print the change between two --output files and exit.",
+    )
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = asyncio.run(run(args))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()